@@ -25,6 +25,33 @@ c = get_config()
 # be imported in the controller for pickling to work.
 # c.Global.import_statements = ['import math']
 
+# The results of calls made with block=False are kept by the controller until
+# the client retrieves them.  Results older than result_ttl seconds (None for
+# no limit) are discarded, and so are the oldest ones once they take more
+# than max_result_bytes.  These limits can be changed with an import
+# statement; the counters are shown by the queue_status method of clients.
+# c.Global.import_statements = [
+#     'import IPython.kernel.pendingdeferred as pd; '
+#     'pd.PendingDeferredManager.result_ttl = 3600; '
+#     'pd.PendingDeferredManager.max_result_bytes = 256*1024*1024'
+# ]
+
+# The task controller gives each engine up to TaskController.prefetch tasks
+# at a time, so that an engine starts its next task as soon as one is done.
+# A larger value helps with many short tasks, but tasks queued on a busy
+# engine can't go to another engine that becomes free.
+# c.Global.import_statements = [
+#     'import IPython.kernel.task as task; task.TaskController.prefetch = 2'
+# ]
+
+# Messages the controller sends can be compressed with zlib or bz2 (see
+# IPython.kernel.pbconfig).  Whatever the controller is set to, it
+# understands compressed messages from clients and engines.
+# c.Global.import_statements = [
+#     'import IPython.kernel.pbconfig as pbconfig; '
+#     'pbconfig.COMPRESSION = "zlib"; pbconfig.COMPRESSION_LEVEL = 1'
+# ]
+
 # Reuse the controller's FURL files. If False, FURL files are regenerated
 # each time the controller is run. If True, they will be reused, *but*, you
 # also must set the network ports by hand. If set, this will override the
@@ -59,10 +59,19 @@ c = get_config()
 
 # c.InteractiveShell.cache_size = 1000
 
+# c.InteractiveShell.cache_bytes = 268435456
+
+# c.InteractiveShell.code_cache_size = 33554432
+
 # c.InteractiveShell.colors = 'LightBG'
 
 # c.InteractiveShell.color_info = True
 
+# Time budgets, in seconds, of a tab completion and of each of its matchers
+# (0 for no limit).  Completions that run out of time return what they found.
+# c.InteractiveShell.completion_budget = 0.5
+# c.InteractiveShell.completion_matcher_budget = 0.2
+
 # c.TerminalInteractiveShell.confirm_exit = True
 
 # c.InteractiveShell.deep_reload = False
@@ -26,6 +26,9 @@ import keyword
 import os
 import re
 import sys
+import threading
+import time
+from Queue import Queue, Empty
 
 from IPython.config.configurable import Configurable
 from IPython.core.splitinput import split_user_input
@@ -41,6 +44,9 @@ from IPython.utils.warn import warn, error
 # This is used as the pattern for calls to split_user_input.
 shell_line_split = re.compile(r'^(\s*)(\S*\s*)(.*$)')
 
+# Key of the index of executables in the ipython db.
+EXEC_INDEX_KEY = 'execindex'
+
 def default_aliases():
     """Return list of shell aliases to auto-define.
     """
@@ -99,6 +105,101 @@ def default_aliases():
     return default_aliases
 
 
+def map_threads(func, items, nthreads=8):
+    """Return map(func, items), computed in up to nthreads threads.
+
+    This is meant for functions that spend their time waiting on the
+    filesystem, which releases the GIL."""
+    items = list(items)
+    results = [None]*len(items)
+    queue = Queue()
+    for i, item in enumerate(items):
+        queue.put((i, item))
+    def work():
+        while True:
+            try:
+                i, item = queue.get_nowait()
+            except Empty:
+                return
+            results[i] = func(item)
+    threads = [threading.Thread(target=work)
+               for i in range(min(nthreads, len(items)))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+class ExecutableIndex(object):
+    """An index of the executable files in folders, for %rehashx.
+
+    The executables of each folder are kept along with the mtime of the
+    folder, so that a scan only lists the folders that changed since the
+    last one.  Folders are stat'ed and listed in a pool of threads, by
+    absolute path, without changing the working directory.  The index is
+    kept in the database it is given (ip.db) between sessions.
+
+    Changing the permissions of a file doesn't change the mtime of its
+    folder: call `clear` to list all the folders again.
+    """
+
+    # Folders modified this recently (in seconds) are listed again by the
+    # next scan, as their mtime may not show changes made in the meantime.
+    mtime_resolution = 2
+    nthreads = 8
+
+    def __init__(self, db=None):
+        self.db = db
+        self._dirs = {}
+        if db is not None:
+            self._dirs = dict(db.get(EXEC_INDEX_KEY, {}))
+
+    def clear(self):
+        """Forget all the folders, so that the next scan lists them all."""
+        self._dirs = {}
+
+    def _scan_dir(self, path, isexec):
+        """Return (mtime, executables) for a folder, or None if it's gone."""
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            return None
+        rec = self._dirs.get(path)
+        if rec is not None and rec[0] == mtime:
+            return rec
+        try:
+            names = os.listdir(path)
+        except OSError:
+            return None
+        join = os.path.join
+        execs = [name for name in names if isexec(join(path, name))]
+        if time.time() - mtime < self.mtime_resolution:
+            mtime = None
+        return mtime, execs
+
+    def scan(self, dirs, isexec):
+        """Return the executables in dirs, as a list of (dir, names).
+
+        isexec(path) tells whether the file at path is an executable.  Only
+        the folders in dirs are kept in the index, which is saved if it
+        changed."""
+        recs = map_threads(lambda path: self._scan_dir(path, isexec), dirs,
+                           self.nthreads)
+        index = {}
+        executables = []
+        for path, rec in zip(dirs, recs):
+            if rec is not None:
+                index[path] = rec
+                executables.append((path, rec[1]))
+        if index != self._dirs:
+            self._dirs = index
+            if self.db is not None:
+                self.db[EXEC_INDEX_KEY] = index
+        return executables
+
+
 class AliasError(Exception):
     pass
 
@@ -164,6 +265,23 @@ class AliasManager(Configurable):
         nargs = self.validate_alias(name, cmd)
         self.alias_table[name] = (nargs, cmd)
 
+    def define_aliases(self, aliases):
+        """Define many aliases at once, skipping the invalid ones.
+
+        aliases is a list of (name, cmd) pairs, defined in order, and the
+        list of the pairs that were valid is returned.
+        """
+        valid = []
+        table = {}
+        for name, cmd in aliases:
+            try:
+                table[name] = (self.validate_alias(name, cmd), cmd)
+            except AliasError:
+                continue
+            valid.append((name, cmd))
+        self.alias_table.update(table)
+        return valid
+
     def undefine_alias(self, name):
         if self.alias_table.has_key(name):
             del self.alias_table[name]
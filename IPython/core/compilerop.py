@@ -30,7 +30,10 @@ from __future__ import print_function
 import codeop
 import hashlib
 import linecache
-import time
+import sys
+import weakref
+from ast import PyCF_ONLY_AST
+from types import CodeType
 
 #-----------------------------------------------------------------------------
 # Local utilities
@@ -39,41 +42,174 @@ import time
 def code_name(code, number=0):
     """ Compute a (probably) unique name for code for caching.
     """
+    if isinstance(code, unicode):
+        code = code.encode('utf-8')
     hash_digest = hashlib.md5(code).hexdigest()
     # Include the number and 12 characters of the hash in the name.  It's
     # pretty much impossible that in a single session we'll have collisions
     # even with truncated hashes, and the full one makes tracebacks too long
     return '<ipython-input-{0}-{1}>'.format(number, hash_digest[:12])
 
+
+def getlines(filename, module_globals=None):
+    """Replacement for linecache.getlines() that knows about our inputs.
+
+    The source of our inputs is found in the shared :class:`CodeCache` with a
+    single dict lookup, and put back in linecache.cache if something cleared
+    it from there.
+    """
+    entry = linecache._ipython_cache.get(filename)
+    if entry is not None:
+        linecache.cache.setdefault(filename, entry)
+        return entry[2]
+    return linecache._getlines_ori(filename, module_globals)
+
 #-----------------------------------------------------------------------------
 # Classes and functions
 #-----------------------------------------------------------------------------
 
+class CodeCache(object):
+    """A bounded store for the source of compiled interactive inputs.
+
+    Entries are kept in the format of linecache.cache.  When the source held
+    takes more than max_size bytes, the least recently used entries are
+    dropped, down to 3/4 of max_size, so that the cost of finding what to
+    drop is paid only once in a while.  Entries whose code is still in use by
+    a live function, generator or frame are never dropped, since tracebacks
+    and the inspect module may still need their source.  To know which those
+    are, the code objects compiled from each entry are registered with
+    :meth:`track`, and held through weak references.
+    """
+
+    def __init__(self, max_size=32*1024*1024):
+        # Maximum number of bytes of source to keep
+        self.max_size = max_size
+        # Number of bytes of source currently kept
+        self.size = 0
+        # Entries and their sizes, by name
+        self._entries = {}
+        self._sizes = {}
+        # Last time each entry was used, in a counter of uses
+        self._used = {}
+        self._clock = 0
+        # Weak references to the code objects compiled from each entry
+        self._code = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def __contains__(self, name):
+        return name in self._entries
+
+    def get(self, name, default=None):
+        """Return the entry for name, marking it as recently used."""
+        entry = self._entries.get(name)
+        if entry is None:
+            return default
+        self._clock += 1
+        self._used[name] = self._clock
+        return entry
+
+    def add(self, name, entry):
+        """Store an entry, dropping old ones if we go over max_size."""
+        self.remove(name)
+        size = sum(map(sys.getsizeof, entry[2]))
+        self._entries[name] = entry
+        self._sizes[name] = size
+        self.size += size
+        self._clock += 1
+        self._used[name] = self._clock
+        linecache.cache[name] = entry
+        if self.size > self.max_size:
+            self.shrink(keep=name)
+
+    def remove(self, name):
+        """Drop an entry, if we have it."""
+        if name in self._entries:
+            del self._entries[name]
+            del self._used[name]
+            self._code.pop(name, None)
+            self.size -= self._sizes.pop(name)
+            linecache.cache.pop(name, None)
+
+    def track(self, code):
+        """Register a code object compiled from one of our entries.
+
+        Its entry, named by its co_filename, is kept as long as the code
+        object or any code nested in it (the body of a function, say) lives.
+        """
+        name = code.co_filename
+        if name not in self._entries:
+            return
+        refs = [r for r in self._code.get(name, []) if r() is not None]
+        todo = [code]
+        while todo:
+            code = todo.pop()
+            refs.append(weakref.ref(code))
+            todo.extend(c for c in code.co_consts if isinstance(c, CodeType))
+        self._code[name] = refs
+
+    def is_live(self, name):
+        """Return whether code compiled from the entry name is still in use."""
+        for ref in self._code.get(name, ()):
+            if ref() is not None:
+                return True
+        return False
+
+    def shrink(self, keep=None):
+        """Drop least recently used entries down to 3/4 of max_size.
+
+        Entries in use by live code, and the one named keep, are not dropped.
+        """
+        target = self.max_size * 3 // 4
+        for name in sorted(self._used, key=self._used.get):
+            if self.size <= target:
+                break
+            if name != keep and not self.is_live(name):
+                self.remove(name)
+
+
 class CachingCompiler(object):
     """A compiler that caches code compiled from interactive statements.
     """
 
-    def __init__(self):
+    def __init__(self, cache_size=None):
+        """Create a new compiler.
+
+        Parameters
+        ----------
+        cache_size : int, optional
+          Maximum number of bytes of source to keep around for tracebacks.
+          This applies to the cache shared by all instances.
+        """
         self._compiler = codeop.CommandCompiler()
         
         # This is ugly, but it must be done this way to allow multiple
         # simultaneous ipython instances to coexist.  Since Python itself
         # directly accesses the data structures in the linecache module, and
         # the cache therein is global, we must work with that data structure.
-        # We must hold a reference to the original checkcache routine and call
-        # that in our own check_cache() below, but the special IPython cache
-        # must also be shared by all IPython instances.  If we were to hold
-        # separate caches (one in each CachingCompiler instance), any call made
-        # by Python itself to linecache.checkcache() would obliterate the
-        # cached data from the other IPython instances.
-        if not hasattr(linecache, '_ipython_cache'):
-            linecache._ipython_cache = {}
+        # The special IPython cache must also be shared by all IPython
+        # instances.  Our entries in linecache.cache have no mtime, so
+        # linecache.checkcache() leaves them alone, and we hook
+        # linecache.getlines() so that any entry removed from there anyway is
+        # still found, with a single lookup in our cache.
+        if not isinstance(getattr(linecache, '_ipython_cache', None),
+                          CodeCache):
+            linecache._ipython_cache = CodeCache()
+        if cache_size is not None:
+            linecache._ipython_cache.max_size = cache_size
         if not hasattr(linecache, '_checkcache_ori'):
             linecache._checkcache_ori = linecache.checkcache
+        if not hasattr(linecache, '_getlines_ori'):
+            linecache._getlines_ori = linecache.getlines
         # Now, we must monkeypatch the linecache directly so that parts of the
         # stdlib that call it outside our control go through our codepath
         # (otherwise we'd lose our tracebacks).
         linecache.checkcache = self.check_cache
+        linecache.getlines = getlines
 
     @property
     def compiler_flags(self):
@@ -101,19 +237,73 @@ class CachingCompiler(object):
         """
         name = code_name(code, number)
         code_obj = self._compiler(code, name, symbol)
-        entry = (len(code), time.time(),
-                 [line+'\n' for line in code.splitlines()], name)
-        # Cache the info both in the linecache (a global cache used internally
-        # by most of Python's inspect/traceback machinery), and in our cache
-        linecache.cache[name] = entry
-        linecache._ipython_cache[name] = entry
+        self._cache(code, name)
+        if code_obj is not None:
+            linecache._ipython_cache.track(code_obj)
+        return code_obj
+
+    def ast_parse(self, source, filename='<unknown>', symbol='exec'):
+        """Parse source to an AST, with the current compiler flags active.
+
+        The flags matter because ``from __future__ import print_function``
+        in an earlier input changes how later inputs are parsed.
+        """
+        return compile(source, filename, symbol,
+                       self.compiler_flags | PyCF_ONLY_AST, 1)
+
+    def compile_ast(self, node, filename, symbol):
+        """Compile an AST made by :meth:`ast_parse` to a code object.
+
+        Parameters
+        ----------
+        node : ast.Module or ast.Interactive
+          The nodes to compile, wrapped in a Module for symbol 'exec' or in an
+          Interactive for symbol 'single'.
+
+        filename : str
+          The name the code will have in tracebacks, normally one returned by
+          :meth:`cache`.
+
+        symbol : str
+          One of 'single' or 'exec'.
+        """
+        # Going through the codeop compiler keeps track of any __future__
+        # statements in the nodes for later compilations.
+        code_obj = self._compiler.compiler(node, filename, symbol)
+        linecache._ipython_cache.track(code_obj)
         return code_obj
 
+    def cache(self, code, number=0):
+        """Store code in the linecache, so that tracebacks can show it.
+
+        Parameters
+        ----------
+        code : str
+          Source code, one or more lines.
+
+        number : int, optional
+          An integer identifying the code, as for :meth:`__call__`.
+
+        Returns
+        -------
+        The name the code is cached under, to be used as its filename when
+        compiling it.
+        """
+        name = code_name(code, number)
+        self._cache(code, name)
+        return name
+
+    def _cache(self, code, name):
+        # A None mtime tells linecache.checkcache() that there's no file to
+        # check the entry against.  Our cache puts the entry in the linecache
+        # too (a global cache used internally by most of Python's
+        # inspect/traceback machinery).
+        entry = (len(code), None,
+                 [line+'\n' for line in code.splitlines()], name)
+        linecache._ipython_cache.add(name, entry)
+
     def check_cache(self, *args):
         """Call linecache.checkcache() safely protecting our cached values.
         """
-        # First call the orignal checkcache as intended
+        # Our entries have no mtime, so the original checkcache keeps them.
         linecache._checkcache_ori(*args)
-        # Then, update back the cache with our data, so that tracebacks related
-        # to our compiled codes can be produced.
-        linecache.cache.update(linecache._ipython_cache)
@@ -69,6 +69,7 @@ from __future__ import print_function
 
 import __builtin__
 import __main__
+import bisect
 import glob
 import inspect
 import itertools
@@ -76,7 +77,9 @@ import keyword
 import os
 import re
 import shlex
+import signal
 import sys
+from timeit import default_timer as clock
 
 from IPython.core.error import TryNext
 from IPython.core.prefilter import ESC_MAGIC
@@ -90,7 +93,7 @@ from IPython.utils.process import arg_split
 #-----------------------------------------------------------------------------
 
 # Public API
-__all__ = ['Completer','IPCompleter']
+__all__ = ['Completer','IPCompleter','CompletionTimeout']
 
 if sys.platform == 'win32':
     PROTECTABLES = ' '
@@ -211,6 +214,11 @@ def single_dir_expand(matches):
 class Bunch(object): pass
 
 
+class CompletionTimeout(Exception):
+    """Raised in a matcher that runs past its deadline."""
+    pass
+
+
 class CompletionSplitter(object):
     """An object to split an input line in a manner similar to readline.
 
@@ -260,6 +268,67 @@ class CompletionSplitter(object):
         return self._delim_re.split(l)[-1]
 
 
+class NameIndex(object):
+    """A sorted index of the names in a few namespaces, for prefix lookups.
+
+    Each namespace is a source, given by a key.  `update` diffs the names of
+    a source with the ones indexed for it, so that keeping the index up to
+    date costs little when few names change, and `match` finds the names
+    starting with a prefix with a binary search, in O(log n + k) for k
+    matches.  A name in several sources is indexed once.
+    """
+
+    def __init__(self):
+        # All the names, sorted
+        self.names = []
+        # The set of names of each source
+        self._sources = {}
+        # In how many sources each name is
+        self._counts = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    def update(self, key, names):
+        """Make the names indexed for the source key be names."""
+        old = self._sources.setdefault(key, set())
+        changed = old.symmetric_difference(names)
+        if not changed:
+            return
+        added = [n for n in changed if n not in old]
+        removed = [n for n in changed if n in old]
+        old.symmetric_difference_update(changed)
+        counts = self._counts
+        fresh = [n for n in added if counts.get(n, 0) == 0]
+        gone = [n for n in removed if counts.get(n, 0) == 1]
+        for n in added:
+            counts[n] = counts.get(n, 0) + 1
+        for n in removed:
+            counts[n] -= 1
+            if not counts[n]:
+                del counts[n]
+        if len(fresh) + len(gone) > 64 + len(self.names)//16:
+            # Many changes, as after a star import: sorting it all again is
+            # faster than moving the list around for each one.
+            self.names = sorted(counts)
+            return
+        names = self.names
+        for n in gone:
+            del names[bisect.bisect_left(names, n)]
+        for n in fresh:
+            bisect.insort(names, n)
+
+    def match(self, text):
+        """Return the names that start with text, in order."""
+        names = self.names
+        start = bisect.bisect_left(names, text)
+        end = start
+        n = len(names)
+        while end < n and names[end].startswith(text):
+            end += 1
+        return names[start:end]
+
+
 class Completer(object):
     def __init__(self, namespace=None, global_namespace=None):
         """Create a new completer for the command line.
@@ -295,6 +364,16 @@ class Completer(object):
         else:
             self.global_namespace = global_namespace
 
+        # Names are looked up in an index of the namespaces.  Unless
+        # update_names is turned off, it is brought up to date on every
+        # lookup; otherwise update_name_index has to be called once the
+        # namespaces have changed, as IPython does after each execution.  In
+        # both cases the index is updated on lookup if any namespace has
+        # been replaced or has changed size.
+        self.name_index = NameIndex()
+        self.update_names = True
+        self._indexed_namespaces = None
+
     def complete(self, text, state):
         """Return the next possible completion for 'text'.
 
@@ -323,17 +402,30 @@ class Completer(object):
 
         """
         #print 'Completer->global_matches, txt=%r' % text # dbg
-        matches = []
-        match_append = matches.append
-        n = len(text)
-        for lst in [keyword.kwlist,
-                    __builtin__.__dict__.keys(),
-                    self.namespace.keys(),
-                    self.global_namespace.keys()]:
-            for word in lst:
-                if word[:n] == text and word != "__builtins__":
-                    match_append(word)
-        return matches
+        if self.use_main_ns:
+            self.namespace = __main__.__dict__
+        if self.update_names or \
+               self._namespace_signature() != self._indexed_namespaces:
+            self.update_name_index()
+        return [word for word in self.name_index.match(text)
+                if word != "__builtins__"]
+
+    def _name_sources(self):
+        return [('keywords', keyword.kwlist),
+                ('builtins', __builtin__.__dict__),
+                ('namespace', self.namespace),
+                ('global_namespace', self.global_namespace)]
+
+    def _namespace_signature(self):
+        return [(id(ns), len(ns)) for key, ns in self._name_sources()]
+
+    def update_name_index(self):
+        """Bring the index of global names up to date with the namespaces."""
+        if self.use_main_ns:
+            self.namespace = __main__.__dict__
+        for key, ns in self._name_sources():
+            self.name_index.update(key, ns)
+        self._indexed_namespaces = self._namespace_signature()
 
     def attr_matches(self, text):
         """Compute matches when text contains a dot.
@@ -455,7 +547,108 @@ class IPCompleter(Completer):
                          self.alias_matches,
                          self.python_func_kw_matches,
                          ]
-    
+
+        # Time budgets, in seconds, of a whole completion and of each of the
+        # matchers run for it; 0 means no limit.  A matcher that runs past
+        # its deadline is interrupted where possible (see _run_matcher), and
+        # the matchers left when the budget of the completion is spent are
+        # skipped; either way the completion returns the matches found so
+        # far and sets self.incomplete.
+        self.budget = shell.completion_budget
+        self.matcher_budget = shell.completion_matcher_budget
+        self.incomplete = False
+        # The deadline of the running matcher, as a clock() time, or None.
+        self.deadline = None
+        self._complete_deadline = None
+        # Timings of the matchers, by name: dicts of calls, total and max
+        # time in seconds, and the number of times they ran out of time.
+        self.matcher_stats = {}
+        # How long past its deadline a matcher is interrupted, which leaves
+        # the ones that check `expired` time to return what they have.
+        self.interrupt_grace = 0.02
+
+    def time_left(self):
+        """Return the seconds left to the running matcher, or None.
+
+        Matchers that loop over many candidates can check this (or
+        `expired`) to stop early and return what they have so far."""
+        if self.deadline is None:
+            return None
+        return self.deadline - clock()
+
+    def expired(self):
+        """Return True if the running matcher is past its deadline."""
+        left = self.time_left()
+        return left is not None and left <= 0
+
+    def _arm_timer(self, seconds):
+        """Raise CompletionTimeout in the running matcher after seconds.
+
+        This uses SIGALRM, so it only works where signal.setitimer exists,
+        in the main thread, and when no one else uses the signal or the
+        timer.  Return a function that disarms the timer, or None if it
+        could not be armed; the deadline is then only checked between
+        matchers and by the matchers that call `expired`."""
+        if not hasattr(signal, 'setitimer'):
+            return None
+        if signal.getitimer(signal.ITIMER_REAL)[0]:
+            return None
+        def handler(signum, frame):
+            raise CompletionTimeout()
+        try:
+            if signal.getsignal(signal.SIGALRM) != signal.SIG_DFL:
+                return None
+            signal.signal(signal.SIGALRM, handler)
+        except ValueError:
+            # Not in the main thread.
+            return None
+        signal.setitimer(signal.ITIMER_REAL, seconds + self.interrupt_grace)
+        def disarm():
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, signal.SIG_DFL)
+        return disarm
+
+    def _run_matcher(self, matcher, *args):
+        """Run matcher(*args) within its deadline, keeping its timings.
+
+        Return what the matcher returns, or None if it was interrupted or
+        skipped because the completion is out of time."""
+        name = getattr(matcher, '__name__', repr(matcher))
+        stats = self.matcher_stats.setdefault(name,
+            dict(calls=0, total=0.0, max=0.0, timeouts=0))
+        start = clock()
+        deadline = self._complete_deadline
+        if self.matcher_budget:
+            deadline = min(deadline or start + self.matcher_budget,
+                           start + self.matcher_budget)
+        if deadline is not None and deadline <= start:
+            self.incomplete = True
+            return None
+        self.deadline = deadline
+        disarm = None
+        result = None
+        try:
+            try:
+                if deadline is not None:
+                    disarm = self._arm_timer(deadline - start)
+                result = matcher(*args)
+            finally:
+                if disarm is not None:
+                    disarm()
+                self.deadline = None
+        except CompletionTimeout:
+            pass
+        elapsed = clock() - start
+        # A matcher that ran out of time, whether it was interrupted or it
+        # stopped itself, may have missed some matches.
+        if deadline is not None and start + elapsed >= deadline:
+            self.incomplete = True
+            stats['timeouts'] += 1
+        stats['calls'] += 1
+        stats['total'] += elapsed
+        stats['max'] = max(stats['max'], elapsed)
+        return result
+
     # Code contributed by Alex Schmolck, for ipython/emacs integration
     def all_completions(self, text):
         """Return all possible completions for the benefit of emacs."""
@@ -718,6 +911,9 @@ class IPCompleter(Completer):
                  try_magic,
                  self.custom_completers.flat_matches(self.text_until_cursor)):
             #print "try",c # dbg
+            if self.expired():
+                self.incomplete = True
+                break
             try:
                 res = c(event)
                 if res:
@@ -787,7 +983,11 @@ class IPCompleter(Completer):
 
         # Start with a clean slate of completions
         self.matches[:] = []
-        custom_res = self.dispatch_custom_completer(text)
+        self.incomplete = False
+        self._complete_deadline = None
+        if self.budget:
+            self._complete_deadline = clock() + self.budget
+        custom_res = self._run_matcher(self.dispatch_custom_completer, text)
         if custom_res is not None:
             # did custom completers produce something?
             self.matches = custom_res
@@ -799,16 +999,18 @@ class IPCompleter(Completer):
                 self.matches = []
                 for matcher in self.matchers:
                     try:
-                        self.matches.extend(matcher(text))
+                        self.matches.extend(self._run_matcher(matcher, text)
+                                            or [])
                     except:
                         # Show the ugly traceback if the matcher causes an
                         # exception, but do NOT crash the kernel!
                         sys.excepthook(*sys.exc_info())
             else:
                 for matcher in self.matchers:
-                    self.matches = matcher(text)
+                    self.matches = self._run_matcher(matcher, text) or []
                     if self.matches:
                         break
+        self._complete_deadline = None
         # FIXME: we should extend our api to return a dict with completions for
         # different types of objects.  The rlcomplete() method could then
         # simply collapse the dict into a list for readline, but we'd have
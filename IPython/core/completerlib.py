@@ -22,6 +22,7 @@ import os
 import re
 import shlex
 import sys
+import threading
 
 # Third-party imports
 from time import time
@@ -38,12 +39,13 @@ from IPython.core.ipapi import get as get_ipython
 # Globals and constants
 #-----------------------------------------------------------------------------
 
-# Time in seconds after which the rootmodules will be stored permanently in the
-# ipython ip.db database (kept in the user's .ipython dir).
-TIMEOUT_STORAGE = 2
+# Time in seconds a completion waits for the module index to be built before
+# it makes do with the modules found so far.
+TIMEOUT_WAIT = 0.5
 
-# Time in seconds after which we give up
-TIMEOUT_GIVEUP = 20
+# Key of the module index in the ipython ip.db database (kept in the user's
+# .ipython dir).
+MODULE_INDEX_KEY = 'moduleindex'
 
 # Regular expression for the python import statement
 import_re = re.compile(r'.*(\.so|\.py[cod]?)$')
@@ -115,39 +117,169 @@ def module_list(path):
 
     return [basename(p).split('.')[0] for p in folder_list]
 
+def list_modules(path):
+    """Return the lists of the modules and of the packages in a folder.
+
+    Eggs are not looked into for packages, all their modules are returned as
+    modules.
+    """
+    if not os.path.isdir(path):
+        return module_list(path), []
+
+    isfile = os.path.isfile
+    pjoin = os.path.join
+    modules = []
+    packages = []
+    for name in os.listdir(path):
+        if isfile(pjoin(path, name, '__init__.py')):
+            packages.append(name)
+        elif import_re.match(name):
+            modules.append(name.split('.')[0])
+    return modules, packages
+
+
+class ModuleIndex(object):
+    """An index of the modules that can be imported, for import completion.
+
+    For each folder of sys.path, and for each package folder below them that
+    a completion needed, the index keeps the modules and packages found in it
+    along with the mtime of the folder.  Lookups stat the folders they use
+    and only list again the ones whose mtime changed, so new modules show up
+    at once and sys.path is never walked again as a whole.  Submodules are
+    found this way too, without importing their packages.
+
+    The index is kept in ip.db between sessions, and `start_refresh` brings
+    it up to date in a background thread, as IPython does at startup.
+    """
+
+    # Folders modified this recently (in seconds) are listed again on the
+    # next lookup, as their mtime may not show changes made in the meantime.
+    mtime_resolution = 2
+
+    def __init__(self, db=None):
+        self.db = db
+        self._dirs = {}
+        if db is not None:
+            self._dirs = dict(db.get(MODULE_INDEX_KEY, {}))
+        self._changed = False
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _lookup(self, path, validate=True):
+        """Return the modules and packages of a folder, listing it if needed.
+
+        With validate False, return what the index has, if anything, without
+        touching the filesystem."""
+        rec = self._dirs.get(path)
+        if not validate:
+            if rec is None:
+                return [], []
+            return rec[1], rec[2]
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            if rec is not None:
+                with self._lock:
+                    self._dirs.pop(path, None)
+                    self._changed = True
+            return [], []
+        if rec is not None and rec[0] == mtime:
+            return rec[1], rec[2]
+        modules, packages = list_modules(path)
+        if time() - mtime < self.mtime_resolution:
+            mtime = None
+        with self._lock:
+            self._dirs[path] = (mtime, modules, packages)
+            self._changed = True
+        return modules, packages
+
+    def _building(self):
+        """Wait a little for a refresh in progress, return True if it goes on."""
+        thread = self._thread
+        if thread is None:
+            return False
+        thread.join(TIMEOUT_WAIT)
+        return thread.isAlive()
+
+    def root_modules(self):
+        """Return the names of all the top-level modules and packages."""
+        validate = not self._building()
+        modules = set(sys.builtin_module_names)
+        for path in sys.path:
+            if path:
+                for names in self._lookup(path, validate):
+                    modules.update(names)
+        modules.discard('__init__')
+        if validate:
+            self.save()
+        return list(modules)
+
+    def submodules(self, name):
+        """Return the names of the modules and packages in package name.
+
+        None is returned if name isn't a package found in the folders of
+        sys.path, for instance a plain module or a package that sets its own
+        __path__."""
+        validate = not self._building()
+        dirs = [path for path in sys.path if path]
+        for part in name.split('.'):
+            for path in dirs:
+                modules, packages = self._lookup(path, validate)
+                if part in packages:
+                    dirs = [os.path.join(path, part)]
+                    break
+                if part in modules:
+                    return None
+            else:
+                return None
+        modules, packages = self._lookup(dirs[0], validate)
+        if validate:
+            self.save()
+        return [m for m in modules if m != '__init__'] + packages
+
+    def refresh(self):
+        """Bring the whole index up to date, and save it."""
+        for path in sys.path:
+            if path:
+                self._lookup(path)
+        # Package folders that were looked into before.
+        for path in self._dirs.keys():
+            self._lookup(path)
+        self.save()
+
+    def start_refresh(self):
+        """Call `refresh` in a background thread."""
+        if self._thread is not None and self._thread.isAlive():
+            return
+        self._thread = threading.Thread(target=self.refresh)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def reset(self):
+        """Forget everything in the index and build it again."""
+        if self._building():
+            self._thread.join()
+        with self._lock:
+            self._dirs = {}
+            self._changed = True
+        self.start_refresh()
+
+    def save(self):
+        """Store the index in the database, if it changed."""
+        if self.db is None or not self._changed:
+            return
+        with self._lock:
+            dirs = dict(self._dirs)
+            self._changed = False
+        self.db[MODULE_INDEX_KEY] = dirs
+
+
 def get_root_modules():
     """
     Returns a list containing the names of all the modules available in the
     folders of the pythonpath.
     """
-    ip = get_ipython()
-
-    if 'rootmodules' in ip.db:
-        return ip.db['rootmodules']
-    
-    t = time()
-    store = False
-    modules = list(sys.builtin_module_names)
-    for path in sys.path:
-        modules += module_list(path)        
-        if time() - t >= TIMEOUT_STORAGE and not store:
-            store = True
-            print("\nCaching the list of root modules, please wait!")
-            print("(This will only be done once - type '%rehashx' to "
-                  "reset cache!)\n")
-            sys.stdout.flush()
-        if time() - t > TIMEOUT_GIVEUP:
-            print("This is taking too long, we give up.\n")
-            ip.db['rootmodules'] = []
-            return []
-    
-    modules = set(modules)
-    if '__init__' in modules:
-        modules.remove('__init__')
-    modules = list(modules)
-    if store:
-        ip.db['rootmodules'] = modules
-    return modules
+    return get_ipython().module_index.root_modules()
 
 
 def is_importable(module, attr, only_modules):
@@ -182,6 +314,21 @@ def try_import(mod, only_modules=False):
     return list(completions)
 
 
+def get_submodules(mod, only_modules=False):
+    """Return the names that can be imported from module mod.
+
+    Packages are looked up in the module index, so they aren't imported just
+    to complete their submodules; their other names are only included if
+    they have been imported already.  Other modules have to be imported.
+    """
+    submodules = get_ipython().module_index.submodules(mod)
+    if submodules is None:
+        return try_import(mod, only_modules)
+    if mod in sys.modules:
+        submodules = list(set(submodules + try_import(mod, only_modules)))
+    return submodules
+
+
 #-----------------------------------------------------------------------------
 # Completion-related functions.
 #-----------------------------------------------------------------------------
@@ -233,13 +380,13 @@ def module_completion(line):
         mod = words[1].split('.')
         if len(mod) < 2:
             return get_root_modules()
-        completion_list = try_import('.'.join(mod[:-1]), True)
+        completion_list = get_submodules('.'.join(mod[:-1]), True)
         return ['.'.join(mod[:-1] + [el]) for el in completion_list]
     
     # 'from xyz import abc<tab>'
     if nwords >= 3 and words[0] == 'from':
         mod = words[1]
-        return try_import(mod)
+        return get_submodules(mod)
 
 #-----------------------------------------------------------------------------
 # Completers
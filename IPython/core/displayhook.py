@@ -67,7 +67,7 @@ class DisplayHook(Configurable):
     # Each call to the In[] prompt raises it by 1, even the first.
     #prompt_count = Int(0)
 
-    def __init__(self, shell=None, cache_size=1000,
+    def __init__(self, shell=None, cache_size=1000, cache_bytes=256*1024*1024,
                  colors='NoColor', input_sep='\n',
                  output_sep='\n', output_sep2='',
                  ps1 = None, ps2 = None, ps_out = None, pad_left=True,
@@ -92,6 +92,12 @@ class DisplayHook(Configurable):
         # we need a reference to the user-level namespace
         self.shell = shell
 
+        # Old outputs are dropped from the output cache as it fills up
+        output_cache = self.shell.output_hist
+        output_cache.max_entries = cache_size
+        output_cache.max_bytes = cache_bytes
+        output_cache.on_evict = self.evict
+
         # Set input prompt strings and colors
         if cache_size == 0:
             if ps1.find('%n') > -1 or ps1.find(r'\#') > -1 \
@@ -234,14 +240,6 @@ class DisplayHook(Configurable):
 
         # Avoid recursive reference when displaying _oh/Out
         if result is not self.shell.user_ns['_oh']:
-            if len(self.shell.user_ns['_oh']) >= self.cache_size and self.do_full_cache:
-                warn('Output cache limit (currently '+
-                      `self.cache_size`+' entries) hit.\n'
-                     'Flushing cache and resetting history counter...\n'
-                     'The only history variables available will be _,__,___ and _1\n'
-                     'with the current result.')
-
-                self.flush()
             # Don't overwrite '_' and friends if '_' is in __builtin__ (otherwise
             # we cause buggy behavior for things like gettext).
             if '_' not in __builtin__.__dict__:
@@ -257,6 +255,8 @@ class DisplayHook(Configurable):
                 to_main[new_result] = result
                 self.shell.user_ns.update(to_main)
                 self.shell.user_ns['_oh'][self.prompt_count] = result
+                self.shell.history_manager.store_output(self.prompt_count,
+                                                        result)
 
     def log_output(self, result):
         """Log the output."""
@@ -284,21 +284,8 @@ class DisplayHook(Configurable):
             self.log_output(result)
             self.finish_displayhook()
 
-    def flush(self):
-        if not self.do_full_cache:
-            raise ValueError,"You shouldn't have reached the cache flush "\
-                  "if full caching is not enabled!"
-        # delete auto-generated vars from global namespace
-        
-        for n in range(1,self.prompt_count + 1):
-            key = '_'+`n`
-            try:
-                del self.shell.user_ns[key]
-            except: pass
-        self.shell.user_ns['_oh'].clear()
-        
-        if '_' not in __builtin__.__dict__:
-            self.shell.user_ns.update({'_':None,'__':None, '___':None})
-        import gc
-        gc.collect() # xxx needed?
-
+    def evict(self, n, result):
+        """Delete the _n variable of an output dropped from the cache."""
+        key = '_%i' % n
+        if self.shell.user_ns.get(key) is result:
+            del self.shell.user_ns[key]
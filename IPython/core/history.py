@@ -13,36 +13,248 @@
 from __future__ import print_function
 
 # Stdlib imports
+import datetime
 import fnmatch
+import hashlib
+import json
 import os
 import sys
+import threading
+from Queue import Queue, Empty
+
+try:
+    import sqlite3
+except ImportError:
+    # Python can be built without sqlite support; in that case we simply
+    # fall back to the purely in-memory history.
+    sqlite3 = None
 
 # Our own packages
 import IPython.utils.io
 
+from IPython.config.configurable import Configurable
 from IPython.core.inputlist import InputList
+from IPython.core.outputcache import OutputCache
 from IPython.utils.pickleshare import PickleShareDB
 from IPython.utils.io import ask_yes_no
+from IPython.utils.traitlets import Bool, Instance, Int, Unicode
 from IPython.utils.warn import warn
 
 #-----------------------------------------------------------------------------
 # Classes and functions
 #-----------------------------------------------------------------------------
 
-class HistoryManager(object):
+class HistorySavingThread(threading.Thread):
+    """Thread that writes queued history records to a :class:`HistoryDB`.
+
+    Records are taken off the queue in batches and each batch is committed in
+    a single transaction, so the cost of a commit is paid once per batch and
+    never by the code that is executing user input.
+    """
+
+    def __init__(self, history_db):
+        threading.Thread.__init__(self)
+        self.history_db = history_db
+        self.daemon = True
+
+    def run(self):
+        hdb = self.history_db
+        queue = hdb.queue
+        while True:
+            batch = [queue.get()]
+            while len(batch) < hdb.batch_size:
+                try:
+                    batch.append(queue.get_nowait())
+                except Empty:
+                    break
+            stop = None in batch
+            records = [rec for rec in batch if rec is not None]
+            try:
+                hdb._write(records)
+            finally:
+                for rec in batch:
+                    queue.task_done()
+            if stop:
+                return
+
+
+class HistoryDB(object):
+    """An SQLite store for input and output history.
+
+    Each cell is one row of the ``history`` table, keyed by ``(session,
+    line)``, so both range and tail queries are index lookups and never need
+    to load a whole session into memory.  Writes are queued and committed in
+    batches by a :class:`HistorySavingThread`; call :meth:`flush` to wait for
+    all pending writes to reach the database.
+
+    Parameters
+    ----------
+    filename : str
+      Path to the database file.  ``':memory:'`` gives a private, in-memory
+      database (mostly useful for testing).
+    batch_size : int, optional
+      Maximum number of records committed in a single transaction.
+    """
+
+    def __init__(self, filename, batch_size=100):
+        self.filename = filename
+        self.batch_size = batch_size
+        self.queue = Queue()
+        # The connection is shared between the saving thread and callers of
+        # the query methods, all access to it goes through this lock.
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(filename, check_same_thread=False,
+                        detect_types=sqlite3.PARSE_DECLTYPES)
+        self.conn.text_factory = unicode
+        self._init_db()
+        self.saving_thread = HistorySavingThread(self)
+        self.saving_thread.start()
+
+    def _init_db(self):
+        with self._lock:
+            conn = self.conn
+            if self.filename != ':memory:':
+                # Write-ahead logging lets readers proceed while the saving
+                # thread commits, and only syncs at checkpoints.
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute("""CREATE TABLE IF NOT EXISTS sessions (
+                    session INTEGER PRIMARY KEY AUTOINCREMENT,
+                    start timestamp, end timestamp, num_cmds INTEGER,
+                    remark TEXT)""")
+            conn.execute("""CREATE TABLE IF NOT EXISTS history (
+                    session INTEGER, line INTEGER, source TEXT,
+                    source_raw TEXT, PRIMARY KEY (session, line))""")
+            conn.execute("""CREATE TABLE IF NOT EXISTS output_history (
+                    session INTEGER, line INTEGER, output TEXT,
+                    PRIMARY KEY (session, line))""")
+            conn.commit()
+
+    def _write(self, records):
+        """Commit a batch of (sql, params) records in one transaction."""
+        if not records:
+            return
+        with self._lock:
+            try:
+                for sql, params in records:
+                    self.conn.execute(sql, params)
+                self.conn.commit()
+            except sqlite3.Error, e:
+                self.conn.rollback()
+                warn('Could not save history to %s: %s' % (self.filename, e))
+
+    #-------------------------------------------------------------------------
+    # Writing
+    #-------------------------------------------------------------------------
+
+    def new_session(self):
+        """Start a new session and return its number."""
+        with self._lock:
+            cur = self.conn.execute("INSERT INTO sessions VALUES "
+                        "(NULL, ?, NULL, NULL, '')", (datetime.datetime.now(),))
+            self.conn.commit()
+            return cur.lastrowid
+
+    def end_session(self, session, num_cmds):
+        """Record the end time and number of commands of a session."""
+        self.queue.put(("UPDATE sessions SET end=?, num_cmds=? WHERE "
+                        "session=?", (datetime.datetime.now(), num_cmds,
+                                      session)))
+        self.flush()
+
+    def store_input(self, session, line, source, source_raw):
+        """Queue an input cell for saving."""
+        self.queue.put(("INSERT OR REPLACE INTO history VALUES (?, ?, ?, ?)",
+                        (session, line, source, source_raw)))
+
+    def store_output(self, session, line, output):
+        """Queue the repr of an output for saving."""
+        self.queue.put(("INSERT OR REPLACE INTO output_history VALUES "
+                        "(?, ?, ?)", (session, line, output)))
+
+    def flush(self):
+        """Block until all queued records have been committed."""
+        self.queue.join()
+
+    def close(self):
+        """Write all pending records, stop the saving thread and close."""
+        if self.saving_thread.is_alive():
+            self.queue.put(None)
+            self.saving_thread.join()
+        with self._lock:
+            self.conn.close()
+
+    #-------------------------------------------------------------------------
+    # Querying
+    #-------------------------------------------------------------------------
+
+    def _query(self, sql, params=(), raw=True, output=False):
+        """Run a query against history, returning (session, line, input[,
+        output]) tuples.
+
+        ``sql`` is everything after the ``FROM`` clause, and refers to the
+        input table as ``history``.
+        """
+        toget = 'source_raw' if raw else 'source'
+        sqlfrom = 'history'
+        if output:
+            sqlfrom = ('history LEFT JOIN output_history USING '
+                       '(session, line)')
+            toget = 'history.%s, output_history.output' % toget
+        self.flush()
+        with self._lock:
+            cur = self.conn.execute('SELECT session, line, %s FROM %s %s' %
+                                    (toget, sqlfrom, sql), params)
+            return cur.fetchall()
+
+    def get_range(self, session, start=0, stop=None, raw=True, output=False):
+        """Get the cells ``start <= line < stop`` of a session.
+
+        If ``stop`` is None, go to the end of the session.
+        """
+        if stop is None:
+            return self._query('WHERE session=? AND line>=? ORDER BY line',
+                               (session, start), raw, output)
+        return self._query('WHERE session=? AND line>=? AND line<? '
+                           'ORDER BY line', (session, start, stop), raw,
+                           output)
+
+    def get_tail(self, n=10, session=None, raw=True, output=False):
+        """Get the last n cells, optionally restricted to one session.
+
+        Cells are returned oldest first.
+        """
+        if session is None:
+            rows = self._query('ORDER BY session DESC, line DESC LIMIT ?',
+                               (n,), raw, output)
+        else:
+            rows = self._query('WHERE session=? ORDER BY line DESC LIMIT ?',
+                               (session, n), raw, output)
+        return rows[::-1]
+
+    def search(self, pattern='*', raw=True, output=False):
+        """Search all stored input with a glob pattern (as used by %hist -g).
+        """
+        return self._query('WHERE %s GLOB ? ORDER BY session, line' %
+                           ('source_raw' if raw else 'source'), (pattern,),
+                           raw, output)
+
+
+class HistoryManager(Configurable):
     """A class to organize all history-related functionality in one place.
     """
     # Public interface
 
     # An instance of the IPython shell we are attached to
-    shell = None
+    shell = Instance('IPython.core.interactiveshell.InteractiveShellABC')
     # An InputList instance to hold processed history
     input_hist = None
     # An InputList instance to hold raw history (as typed by user)
     input_hist_raw = None
     # A list of directories visited during session
     dir_hist = None
-    # A dict of output history, keyed with ints from the shell's execution count
+    # An OutputCache dict of output history, keyed with ints from the shell's
+    # execution count
     output_hist = None
     # String with path to the history file
     hist_file = None
@@ -50,18 +262,33 @@ class HistoryManager(object):
     shadow_db = None
     # ShadowHist instance with the actual shadow history
     shadow_hist = None
+
+    # Path to the SQLite history database.  If empty, a file named after the
+    # profile is created in the ipython directory.
+    db_file = Unicode(u'', config=True)
+    # Set to False to disable the SQLite history database.
+    db_enabled = Bool(True, config=True)
+    # Whether to also store the repr of every output in the database.
+    db_log_output = Bool(False, config=True)
+    # Maximum number of records committed to the database at once.
+    db_batch_size = Int(100, config=True)
+    # HistoryDB instance, or None if the database is not in use
+    db = None
     
     # Private interface
     # Variables used to store the three last inputs from the user.  On each new
     # history update, we populate the user's namespace with these, shifted as
     # necessary.
     _i00, _i, _ii, _iii = '','','',''
+    # Number of the current session in the database; a new one is started
+    # lazily on the first input stored after a reset.
+    _session_number = None
     
-    def __init__(self, shell):
+    def __init__(self, shell, config=None):
         """Create a new history manager associated with a shell instance.
         """
         # We need a pointer back to the shell for various tasks.
-        self.shell = shell
+        super(HistoryManager, self).__init__(shell=shell, config=config)
         
         # List of input with multi-line handling.
         self.input_hist = InputList()
@@ -76,8 +303,8 @@ class HistoryManager(object):
         except OSError:
             self.dir_hist = []
 
-        # dict of output history
-        self.output_hist = {}
+        # dict of output history, its limits are set by the displayhook
+        self.output_hist = OutputCache()
 
         # Now the history file
         if shell.profile:
@@ -88,6 +315,7 @@ class HistoryManager(object):
 
         # Objects related to shadow history management
         self._init_shadow_hist()
+        self._init_db(histfname)
     
         self._i00, self._i, self._ii, self._iii = '','','',''
 
@@ -118,6 +346,33 @@ class HistoryManager(object):
             print("Now it is", self.ipython_dir)
             sys.exit()
         self.shadow_hist = ShadowHist(self.shadow_db, self.shell)
+
+    def _init_db(self, histfname):
+        if not self.db_enabled or sqlite3 is None:
+            return
+        if not self.db_file:
+            self.db_file = os.path.join(self.shell.ipython_dir,
+                                        histfname + '.sqlite')
+        try:
+            self.db = HistoryDB(self.db_file, batch_size=self.db_batch_size)
+        except sqlite3.Error, e:
+            warn('Could not open history database %s: %s\n'
+                 'History will not be saved to disk.' % (self.db_file, e))
+            self.db = None
+
+    @property
+    def session_number(self):
+        """Number of the current session in the history database."""
+        if self._session_number is None and self.db is not None:
+            self._session_number = self.db.new_session()
+        return self._session_number
+
+    def end_session(self):
+        """Close the current database session, flushing pending writes."""
+        if self.db is not None and self._session_number is not None:
+            self.db.end_session(self._session_number,
+                                len(self.input_hist) - 1)
+        self._session_number = None
         
     def save_hist(self):
         """Save input history to a file (via readline library)."""
@@ -176,12 +431,22 @@ class HistoryManager(object):
         else:
             raise IndexError('Not a valid index for the input history: %r'
                              % index)
+        if self.db is not None:
+            # Only the requested range is read back from the database.
+            if isinstance(index, int):
+                rows = self.db.get_tail(index, self.session_number, raw)
+            else:
+                rows = self.db.get_range(self.session_number, start, stop,
+                                         raw)
+            inputs = [(line, source) for (session, line, source) in rows]
+        else:
+            inputs = [(i, input_hist[i]) for i in range(start, stop)]
         hist = {}
-        for i in range(start, stop):
+        for i, source in inputs:
             if output:
-                hist[i] = (input_hist[i], output_hist.get(i))
+                hist[i] = (source, output_hist.peek(i))
             else:
-                hist[i] = input_hist[i]
+                hist[i] = source
         if not hist:
             raise IndexError('No history for range of indices: %r' % index)
         return hist
@@ -204,6 +469,9 @@ class HistoryManager(object):
         self.input_hist.append(source)
         self.input_hist_raw.append(source_raw)
         self.shadow_hist.add(source)
+        if self.db is not None:
+            self.db.store_input(self.session_number, len(self.input_hist)-1,
+                                self._decode(source), self._decode(source_raw))
 
         # update the auto _i variables
         self._iii = self._ii
@@ -219,13 +487,47 @@ class HistoryManager(object):
                    new_i : self._i00 }
         self.shell.user_ns.update(to_main)
 
+    def store_output(self, line, result):
+        """Store the repr of an output in the database, if so configured.
+
+        The output object itself is kept in ``output_hist`` by the
+        displayhook.
+        """
+        if self.db is None or not self.db_log_output:
+            return
+        try:
+            output = repr(result)
+        except Exception:
+            return
+        self.db.store_output(self.session_number, line, self._decode(output))
+
+    def _decode(self, s):
+        """Return s as unicode, sqlite refuses 8-bit byte strings.
+
+        UTF-8 is tried first, then the terminal encoding.  Failing both, the
+        bytes are decoded as latin-1, which can't fail and loses nothing.
+        """
+        if not isinstance(s, str):
+            return s
+        for enc in ('utf-8', self.shell.stdin_encoding):
+            try:
+                return s.decode(enc)
+            except (UnicodeError, LookupError, TypeError):
+                pass
+        return s.decode('latin-1')
+
     def sync_inputs(self):
         """Ensure raw and translated histories have same length."""
         if len(self.input_hist) != len (self.input_hist_raw):
             self.input_hist_raw = InputList(self.input_hist)
 
     def reset(self):
-        """Clear all histories managed by this object."""
+        """Clear all histories managed by this object.
+
+        The current database session is closed, and a new one is started with
+        the next input.
+        """
+        self.end_session()
         self.input_hist[:] = []
         self.input_hist_raw[:] = []
         self.output_hist.clear()
@@ -373,7 +675,7 @@ def magic_history(self, parameter_s = ''):
         else:
             print(inline, end='', file=outfile)
         if print_outputs:
-            output = self.shell.output_hist.get(in_num)
+            output = self.shell.output_hist.peek(in_num)
             if output is not None:
                 print(repr(output), file=outfile)
 
@@ -452,48 +754,134 @@ def rep_f(self, arg):
         print("Not found in recent history:", args)
         
 
-_sentinel = object()
+def _shadow_key(ent):
+    """Key of a shadow history entry in the in-memory hash index."""
+    if isinstance(ent, unicode):
+        ent = ent.encode('utf-8')
+    return hashlib.md5(ent).digest()
+
 
 class ShadowHist(object):
-    def __init__(self, db, shell):
-        # cmd => idx mapping
-        self.curidx = 0
+    """The shadow history: every distinct input ever entered, numbered.
+
+    Entries are appended to a log file, one JSON ``[idx, entry]`` record per
+    line.  Two in-memory indices are built from it: a hash index (digest of
+    the entry -> idx) used to skip inputs already seen, and a reverse index
+    (idx -> offset of the record in the log) used to read a single entry back.
+    Adding and looking up an entry are therefore constant time, and only
+    :meth:`all` reads the whole log.
+
+    Shadow history stored in the old hashed PickleShareDB format
+    (``db/shadowhist``) is migrated to the log the first time it is opened.
+    """
+
+    def __init__(self, db, shell, log_file=None):
         self.db = db
-        self.disabled = False
         self.shell = shell
-    
-    def inc_idx(self):
-        idx = self.db.get('shadowhist_idx', 1)
-        self.db['shadowhist_idx'] = idx + 1
-        return idx
-        
+        self.disabled = False
+        if log_file is None:
+            log_file = os.path.join(db.root, 'shadowhist.log')
+        self.log_file = log_file
+        # Highest entry number in the log
+        self.curidx = 0
+        # digest -> idx, and idx -> offset of the record in the log
+        self._digests = {}
+        self._offsets = {}
+        # Offset up to which the log has been read into the indices
+        self._end = 0
+        try:
+            if not os.path.exists(log_file):
+                self._migrate()
+            self._log = open(log_file, 'ab')
+            self._sync()
+        except:
+            self.shell.showtraceback()
+            print("WARNING: disabling shadow history")
+            self.disabled = True
+
+    def _migrate(self):
+        """Write shadow history from the old PickleShareDB format to the log.
+        """
+        old = self.db.hdict('shadowhist')
+        if not old:
+            return
+        items = sorted((idx, ent) for (ent, idx) in old.iteritems())
+        # Write to a temporary file first, so that an interrupted migration
+        # is simply redone the next time.
+        tmpname = self.log_file + '.tmp'
+        with open(tmpname, 'wb') as f:
+            for idx, ent in items:
+                f.write(self._format(idx, ent))
+        os.rename(tmpname, self.log_file)
+
+    def _format(self, idx, ent):
+        if not isinstance(ent, unicode):
+            ent = ent.decode('utf-8', 'replace')
+        return json.dumps([idx, ent]) + '\n'
+
+    def _sync(self):
+        """Index records appended to the log since it was last read.
+
+        Other IPython sessions may be appending to the same log, so this is
+        called whenever the log is found to be longer than expected.
+        """
+        with open(self.log_file, 'rb') as f:
+            f.seek(self._end)
+            while True:
+                line = f.readline()
+                if not line.endswith('\n'):
+                    # EOF, or a record still being written by someone else
+                    break
+                idx, ent = json.loads(line)
+                self._digests[_shadow_key(ent)] = idx
+                self._offsets[idx] = self._end
+                self.curidx = max(self.curidx, idx)
+                self._end += len(line)
+
     def add(self, ent):
         if self.disabled:
             return
         try:
-            old = self.db.hget('shadowhist', ent, _sentinel)
-            if old is not _sentinel:
+            key = _shadow_key(ent)
+            if key in self._digests:
                 return
-            newidx = self.inc_idx()
-            #print("new", newidx) # dbg
-            self.db.hset('shadowhist',ent, newidx)
+            if os.path.getsize(self.log_file) != self._end:
+                self._sync()
+                if key in self._digests:
+                    return
+            idx = self.curidx + 1
+            record = self._format(idx, ent)
+            self._log.write(record)
+            self._log.flush()
+            self._digests[key] = idx
+            self._offsets[idx] = self._end
+            self.curidx = idx
+            self._end += len(record)
         except:
             self.shell.showtraceback()
             print("WARNING: disabling shadow history")
             self.disabled = True
-    
+
     def all(self):
-        d = self.db.hdict('shadowhist')
-        items = [(i,s) for (s,i) in d.iteritems()]
+        if self.disabled:
+            return []
+        with open(self.log_file, 'rb') as f:
+            items = [tuple(json.loads(line)) for line in f
+                     if line.endswith('\n')]
         items.sort()
         return items
 
     def get(self, idx):
-        all = self.all()
-        
-        for k, v in all:
-            if k == idx:
-                return v
+        if self.disabled:
+            return None
+        if idx not in self._offsets:
+            self._sync()
+        offset = self._offsets.get(idx)
+        if offset is None:
+            return None
+        with open(self.log_file, 'rb') as f:
+            f.seek(offset)
+            return json.loads(f.readline())[1]
 
 
 def init_ipython(ip):
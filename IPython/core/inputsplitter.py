@@ -40,11 +40,6 @@ ToDo
 - Think about the best way to support dynamic things: automagic, autocall,
   macros, etc.
 
-- Think of a better heuristic for the application of the transforms in
-  IPythonInputSplitter.push() than looking at the buffer ending in ':'.  Idea:
-  track indentation change events (indent, dedent, nothing) and apply them only
-  if the indentation went up, but not otherwise.
-
 - Think of the cleanest way for supporting user-specified transformations (the
   user prefilters we had before).
 
@@ -66,9 +61,11 @@ from __future__ import print_function
 # Imports
 #-----------------------------------------------------------------------------
 # stdlib
+import ast
 import codeop
 import re
 import sys
+import tokenize
 
 # IPython modules
 from IPython.utils.text import make_quoted_expr
@@ -165,11 +162,99 @@ def get_input_encoding():
 # Classes and functions for normal Python syntax handling
 #-----------------------------------------------------------------------------
 
-# HACK!  This implementation, written by Robert K a while ago using the
-# compiler module, is more robust than the other one below, but it expects its
-# input to be pure python (no ipython syntax).  For now we're using it as a
-# second-pass splitter after the first pass transforms the input to pure
-# python.
+# The tokens that can change the lexical state a line leaves behind: comments,
+# string quotes and brackets.
+_lexer_token_re = re.compile(r"""(\#)|('''|\"\"\"|'|")|([(\[{])|([)\]}])""")
+
+
+class LineLexer(object):
+    """Incremental lexer that tracks the state of Python source line by line.
+
+    Only the lexical state that carries over from one line to the next is
+    tracked: open brackets, open strings and backslash continuations.  This is
+    enough to know, in time proportional to the length of each new line,
+    whether the next line starts a new logical line of Python code or
+    continues the current one.
+    """
+    # Number of currently open brackets of any kind
+    paren_level = 0
+    # Quote of the string still open at the end of the last line, or None
+    string_quote = None
+    # Whether the last line ended in a backslash continuation
+    continued = False
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Forget all state, as if no line had been pushed."""
+        self.paren_level = 0
+        self.string_quote = None
+        self.continued = False
+
+    @property
+    def at_line_start(self):
+        """Whether the next line pushed starts a new logical line."""
+        return not (self.paren_level or self.string_quote or self.continued)
+
+    def push(self, line):
+        """Update the state with one more physical line of source.
+
+        Parameters
+        ----------
+        line : str
+          A single line, without its trailing newline.
+        """
+        pos = 0
+        if self.string_quote is not None:
+            pos = self._close_string(line, 0)
+            if pos is None:
+                return
+        # Last character of actual code seen on this line
+        last = ''
+        while True:
+            m = _lexer_token_re.search(line, pos)
+            chunk = line[pos:m.start() if m else len(line)].rstrip()
+            if chunk:
+                last = chunk[-1]
+            if m is None:
+                break
+            comment, quote, opener, closer = m.groups()
+            if comment:
+                break
+            pos = m.end()
+            if quote:
+                self.string_quote = quote
+                pos = self._close_string(line, pos)
+                if pos is None:
+                    return
+                last = quote
+            elif opener:
+                self.paren_level += 1
+                last = opener
+            else:
+                self.paren_level = max(self.paren_level-1, 0)
+                last = closer
+        self.continued = last == '\\'
+
+    def _close_string(self, line, pos):
+        """Look for the end of the currently open string, starting at pos.
+
+        Return the position right after the string, or None if the string
+        continues on the next line."""
+        quote = self.string_quote
+        self.continued = False
+        m = tokenize.endprogs[quote].match(line, pos)
+        if m is not None:
+            self.string_quote = None
+            return m.end()
+        if len(quote) == 1 and not line.endswith('\\'):
+            # An unterminated single-quoted string is a syntax error, but it
+            # doesn't spill over to the next line.
+            self.string_quote = None
+            return len(line)
+        return None
+
 
 def split_blocks(python):
     """ Split multiple lines of code into discrete commands that can be
@@ -185,45 +270,35 @@ def split_blocks(python):
     commands : list of str
         Separate commands that can be exec'ed independently.
     """
-
-    import compiler
-    
-    # compiler.parse treats trailing spaces after a newline as a
-    # SyntaxError.  This is different than codeop.CommandCompiler, which
-    # will compile the trailng spaces just fine.  We simply strip any
-    # trailing whitespace off.  Passing a string with trailing whitespace
-    # to exec will fail however.  There seems to be some inconsistency in
-    # how trailing whitespace is handled, but this seems to work.
+    # Passing a string with trailing whitespace to exec will fail, and
+    # there seems to be some inconsistency in how trailing whitespace is
+    # handled, so we simply strip any trailing whitespace off.
     python_ori = python # save original in case we bail on error
     python = python.strip()
 
-    # The compiler module does not like unicode. We need to convert
-    # it encode it:
-    if isinstance(python, unicode):
-        # Use the utf-8-sig BOM so the compiler detects this a UTF-8
-        # encode string.
-        python = '\xef\xbb\xbf' + python.encode('utf-8')
-
-    # The compiler module will parse the code into an abstract syntax tree.
-    # This has a bug with str("a\nb"), but not str("""a\nb""")!!!
+    # The whole input is parsed once.  If it doesn't parse, it is returned as
+    # a single block so that executing it produces the proper error.
     try:
-        ast = compiler.parse(python)
+        tree = ast.parse(python)
     except:
         return [python_ori]
 
-    # Uncomment to help debug the ast tree
-    # for n in ast.node:
-    #     print n.lineno,'->',n
+    lines = python.splitlines()
 
-    # Each separate command is available by iterating over ast.node. The
-    # lineno attribute is the line number (1-indexed) beginning the commands
-    # suite.
-    # lines ending with ";" yield a Discard Node that doesn't have a lineno
-    # attribute.  These nodes can and should be discarded.  But there are
-    # other situations that cause Discard nodes that shouldn't be discarded.
-    # We might eventually discover other cases where lineno is None and have
-    # to put in a more sophisticated test.
-    linenos = [x.lineno-1 for x in ast.node if x.lineno is not None]
+    # The ast gives the *last* line of a multiline string as its lineno, so
+    # map every line to the first line of the logical line it belongs to.
+    logical_starts = []
+    lexer = LineLexer()
+    start = 0
+    for i, line in enumerate(lines):
+        if lexer.at_line_start:
+            start = i
+        logical_starts.append(start)
+        lexer.push(line)
+
+    # Each top-level statement starts a new command.  Decorated functions and
+    # classes already start at their first decorator.
+    linenos = [logical_starts[node.lineno-1] for node in tree.body]
 
     # When we finally get the slices, we will need to slice all the way to
     # the end even though we don't have a line number for it. Fortunately,
@@ -235,9 +310,8 @@ def split_blocks(python):
     # we might miss part of it.  This fixes ticket 266993.  Thanks Gael!
     linenos[0] = 0
 
-    lines = python.splitlines()
-
-    # Create a list of atomic commands.
+    # Create a list of atomic commands.  Statements separated by ';' on a
+    # single line give empty slices, which are skipped.
     cmds = []
     for i, j in zip(linenos[:-1], linenos[1:]):
         cmd = lines[i:j]
@@ -281,10 +355,6 @@ class InputSplitter(object):
     # at initialization time via get_input_encoding(), but it can be reset by a
     # client with specific knowledge of the encoding.
     encoding = ''
-    # String where the current full source input is stored, properly encoded.
-    # Reading this attribute is the normal way of querying the currently pushed
-    # source code, that has been properly encoded.
-    source = ''
     # Code object corresponding to the current source.  It is automatically
     # synced to the source, so it can be queried at any time to obtain the code
     # object; it will be None if the source doesn't compile to valid Python.
@@ -296,6 +366,10 @@ class InputSplitter(object):
     
     # List with lines of input accumulated so far
     _buffer = None
+    # Cached value of the source property, None when it needs to be rebuilt
+    _source = ''
+    # Lexer fed with every line of input, to know where logical lines start
+    _lexer = None
     # Command compiler
     _compile = None
     # Mark when input has changed indentation all the way back to flush-left
@@ -325,6 +399,7 @@ class InputSplitter(object):
           to prepending a full reset() to every push() call.
         """
         self._buffer = []
+        self._lexer = LineLexer()
         self._compile = codeop.CommandCompiler()
         self.encoding = get_input_encoding()
         self.input_mode = InputSplitter.input_mode if input_mode is None \
@@ -334,11 +409,24 @@ class InputSplitter(object):
         """Reset the input buffer and associated state."""
         self.indent_spaces = 0
         self._buffer[:] = []
-        self.source = ''
+        self._source = ''
+        self._lexer.reset()
         self.code = None
         self._is_complete = False
         self._full_dedent = False
 
+    @property
+    def source(self):
+        """The current full source input, properly encoded.
+
+        Reading this attribute is the normal way of querying the currently
+        pushed source code.  It is only rebuilt from the input buffer when it
+        is read after new input was pushed.
+        """
+        if self._source is None:
+            self._source = self._set_source(self._buffer)
+        return self._source
+
     def source_reset(self):
         """Return the input source and perform a full reset.
         """
@@ -371,21 +459,32 @@ class InputSplitter(object):
         if self.input_mode == 'cell':
             self.reset()
         
-        self._store(lines)
-        source = self.source
+        lines = self._push_lines(lines)
 
         # Before calling _compile(), reset the code object to None so that if an
         # exception is raised in compilation, we don't mislead by having
         # inconsistent code/source attributes.
         self.code, self._is_complete = None, None
 
-        # Honor termination lines properly
-        if source.rstrip().endswith('\\'):
+        # Honor termination lines properly.  Only the last non-blank input
+        # needs to be checked for this, not the whole source.
+        for last_input in reversed(self._buffer):
+            if not last_input.isspace():
+                break
+        if last_input.rstrip().endswith('\\'):
             return False
 
         self._update_indent(lines)
+
+        # Inside brackets or a multiline string the input can't be complete,
+        # so there's no need to compile the whole source to find that out.
+        # This keeps pushing a long literal line by line linear in its size.
+        if self._lexer.paren_level or self._lexer.string_quote:
+            self._is_complete = False
+            return False
+
         try:
-            self.code = self._compile(source)
+            self.code = self._compile(self.source)
         # Invalid syntax can produce any of a number of different errors from
         # inside the compiler, so we have to catch them all.  Syntax errors
         # immediately produce a 'ready' block, so the invalid Python can be
@@ -456,7 +555,7 @@ class InputSplitter(object):
 
         # When input is complete, then termination is marked by an extra blank
         # line at the end.
-        last_line = self.source.splitlines()[-1]
+        last_line = self._buffer[-1].splitlines()[-1]
         return bool(last_line and not last_line.isspace())
         
     def split_blocks(self, lines):
@@ -476,70 +575,12 @@ class InputSplitter(object):
           to a single block that can be compiled in 'single' mode (unless it
           has a syntax error)."""
 
-        # This code is fairly delicate.  If you make any changes here, make
-        # absolutely sure that you do run the full test suite and ALL tests
-        # pass.
-
+        # All lines are run through the lexer (and for IPython input, the
+        # syntax transformations) once, and the resulting pure python source
+        # is then parsed once to find where each block starts.
         self.reset()
-        blocks = []
-        
-        # Reversed copy so we can use pop() efficiently and consume the input
-        # as a stack
-        lines = lines.splitlines()[::-1]
-        # Outer loop over all input
-        while lines:
-            #print 'Current lines:', lines  # dbg
-            # Inner loop to build each block
-            while True:
-                # Safety exit from inner loop
-                if not lines:
-                    break
-                # Grab next line but don't push it yet
-                next_line = lines.pop()
-                # Blank/empty lines are pushed as-is
-                if not next_line or next_line.isspace():
-                    self.push(next_line)
-                    continue
-
-                # Check indentation changes caused by the *next* line
-                indent_spaces, _full_dedent = self._find_indent(next_line)
-
-                # If the next line causes a dedent, it can be for two differnt
-                # reasons: either an explicit de-dent by the user or a
-                # return/raise/pass statement.  These MUST be handled
-                # separately:
-                #
-                # 1. the first case is only detected when the actual explicit
-                # dedent happens, and that would be the *first* line of a *new*
-                # block.  Thus, we must put the line back into the input buffer
-                # so that it starts a new block on the next pass.
-                #
-                # 2. the second case is detected in the line before the actual
-                # dedent happens, so , we consume the line and we can break out
-                # to start a new block.
-
-                # Case 1, explicit dedent causes a break.
-                # Note: check that we weren't on the very last line, else we'll
-                # enter an infinite loop adding/removing the last line.
-                if  _full_dedent and lines and not next_line.startswith(' '):
-                    lines.append(next_line)
-                    break
-                
-                # Otherwise any line is pushed
-                self.push(next_line)
-
-                # Case 2, full dedent with full block ready:
-                if _full_dedent or \
-                       self.indent_spaces==0 and not self.push_accepts_more():
-                    break
-            # Form the new block with the current source input
-            blocks.append(self.source_reset())
-            
-        #return blocks
-        # HACK!!! Now that our input is in blocks but guaranteed to be pure
-        # python syntax, feed it back a second time through the AST-based
-        # splitter, which is more accurate than ours.
-        return split_blocks(''.join(blocks))
+        self._push_lines('\n'.join(lines.splitlines()))
+        return split_blocks(self.source_reset())
 
     #------------------------------------------------------------------------
     # Private interface
@@ -591,11 +632,21 @@ class InputSplitter(object):
             if line and not line.isspace():
                 self.indent_spaces, self._full_dedent = self._find_indent(line)
 
+    def _push_lines(self, lines):
+        """Feed one or more lines of input to the lexer and store them.
+
+        Returns the lines as they were stored."""
+        for line in lines.splitlines():
+            self._lexer.push(line)
+        self._store(lines)
+        return lines
+
     def _store(self, lines, buffer=None, store='source'):
         """Store one or more lines of input.
 
         If input lines are not newline-terminated, a newline is automatically
-        appended."""
+        appended.  The matching source attribute is rebuilt on its next
+        access."""
 
         if buffer is None:
             buffer = self._buffer
@@ -604,7 +655,7 @@ class InputSplitter(object):
             buffer.append(lines)
         else:
             buffer.append(lines+'\n')
-        setattr(self, store, self._set_source(buffer))
+        setattr(self, '_' + store, None)
 
     def _set_source(self, buffer):
         return ''.join(buffer).encode(self.encoding)
@@ -926,13 +977,12 @@ transform_escaped = EscapedTransformer()
 class IPythonInputSplitter(InputSplitter):
     """An input splitter that recognizes all of IPython's special syntax."""
 
-    # String with raw, untransformed input.
-    source_raw = ''
-
     # Private attributes
     
     # List with lines of raw input accumulated so far.
     _buffer_raw = None
+    # Cached value of the source_raw property, None when it must be rebuilt
+    _source_raw = ''
 
     def __init__(self, input_mode=None):
         InputSplitter.__init__(self, input_mode)
@@ -942,7 +992,14 @@ class IPythonInputSplitter(InputSplitter):
         """Reset the input buffer and associated state."""
         InputSplitter.reset(self)
         self._buffer_raw[:] = []
-        self.source_raw = ''
+        self._source_raw = ''
+
+    @property
+    def source_raw(self):
+        """String with raw, untransformed input."""
+        if self._source_raw is None:
+            self._source_raw = self._set_source(self._buffer_raw)
+        return self._source_raw
 
     def source_raw_reset(self):
         """Return input and raw source and perform a full reset.
@@ -952,17 +1009,20 @@ class IPythonInputSplitter(InputSplitter):
         self.reset()
         return out, out_r
 
-    def push(self, lines):
-        """Push one or more lines of IPython input.
+    def _push_lines(self, lines):
+        """Transform one or more lines of IPython input and store them.
+
+        Returns the transformed lines, as they were stored.
         """
         if not lines:
-            return super(IPythonInputSplitter, self).push(lines)
+            return super(IPythonInputSplitter, self)._push_lines(lines)
 
         # We must ensure all input is pure unicode
         if type(lines)==str:
             lines = lines.decode(self.encoding)
 
-        lines_list = lines.splitlines()
+        # Store raw source before applying any transformations to it.
+        self._store(lines, self._buffer_raw, 'source_raw')
 
         transforms = [transform_escaped, transform_assign_system,
                       transform_assign_magic, transform_ipy_prompt,
@@ -970,45 +1030,19 @@ class IPythonInputSplitter(InputSplitter):
 
         # Transform logic
         #
-        # We only apply the line transformers to the input if we have either no
-        # input yet, or complete input, or if the last line of the buffer ends
-        # with ':' (opening an indented block).  This prevents the accidental
-        # transformation of escapes inside multiline expressions like
-        # triple-quoted strings or parenthesized expressions.
-        #
-        # The last heuristic, while ugly, ensures that the first line of an
-        # indented block is correctly transformed.
-        #
-        # FIXME: try to find a cleaner approach for this last bit.
-
-        # If we were in 'block' mode, since we're going to pump the parent
-        # class by hand line by line, we need to temporarily switch out to
-        # 'line' mode, do a single manual reset and then feed the lines one
-        # by one.  Note that this only matters if the input has more than one
-        # line.
-        changed_input_mode = False
-
-        if self.input_mode == 'cell':
-            self.reset()
-            changed_input_mode = True
-            saved_input_mode = 'cell'
-            self.input_mode = 'line'
-
-        # Store raw source before applying any transformations to it.  Note
-        # that this must be done *after* the reset() call that would otherwise
-        # flush the buffer.
-        self._store(lines, self._buffer_raw, 'source_raw')
-        
-        try:
-            push = super(IPythonInputSplitter, self).push
-            for line in lines_list:
-                if self._is_complete or not self._buffer or \
-                   (self._buffer and self._buffer[-1].rstrip().endswith(':')):
-                    for f in transforms:
-                        line = f(line)
-
-                out = push(line)
-        finally:
-            if changed_input_mode:
-                self.input_mode = saved_input_mode
-        return out
+        # We only apply the line transformers to lines that start a new
+        # logical line of Python code, as tracked by the lexer.  This prevents
+        # the accidental transformation of escapes inside multiline
+        # expressions like triple-quoted strings or parenthesized expressions.
+        # The lexer only ever sees transformed lines, which are pure Python.
+        lexer = self._lexer
+        out = []
+        for line in lines.splitlines():
+            if lexer.at_line_start:
+                for f in transforms:
+                    line = f(line)
+            lexer.push(line)
+            out.append(line)
+        lines = '\n'.join(out)
+        self._store(lines)
+        return lines
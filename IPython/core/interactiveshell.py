@@ -20,6 +20,7 @@ from __future__ import absolute_import
 import __builtin__
 import __future__
 import abc
+import ast
 import atexit
 import codeop
 import os
@@ -64,8 +65,8 @@ from IPython.utils.process import system, getoutput
 from IPython.utils.strdispatch import StrDispatch
 from IPython.utils.syspathcontext import prepended_to_syspath
 from IPython.utils.text import num_ini_spaces, format_screen, LSString, SList
-from IPython.utils.traitlets import (Int, Str, CBool, CaselessStrEnum, Enum,
-                                     List, Unicode, Instance, Type)
+from IPython.utils.traitlets import (Int, Str, CBool, CFloat, CaselessStrEnum,
+                                     Enum, List, Unicode, Instance, Type)
 from IPython.utils.warn import warn, error, fatal
 import IPython.core.hooks
 
@@ -145,9 +146,17 @@ class InteractiveShell(Configurable, Magic):
     autoindent = CBool(True, config=True)
     automagic = CBool(True, config=True)
     cache_size = Int(1000, config=True)
+    # Rough maximum number of bytes taken by the outputs kept in Out/_oh
+    cache_bytes = Int(256*1024*1024, config=True)
+    # Maximum number of bytes of input source kept around for tracebacks
+    code_cache_size = Int(32*1024*1024, config=True)
     color_info = CBool(True, config=True)
     colors = CaselessStrEnum(('NoColor','LightBG','Linux'), 
                              default_value=get_default_colors(), config=True)
+    # Time budgets of completions and of each of their matchers, in seconds;
+    # 0 means no limit.  See IPCompleter for what happens when they run out.
+    completion_budget = CFloat(0.0, config=True)
+    completion_matcher_budget = CFloat(0.0, config=True)
     debug = CBool(False, config=True)
     deep_reload = CBool(False, config=True)
     displayhook_class = Type(DisplayHook)
@@ -246,8 +255,8 @@ class InteractiveShell(Configurable, Magic):
         self.save_sys_module_state()
         self.init_sys_modules()
 
-        self.init_history()
         self.init_encoding()
+        self.init_history()
         self.init_prefilter()
 
         Magic.__init__(self, self)
@@ -367,7 +376,7 @@ class InteractiveShell(Configurable, Magic):
         self.more = False
 
         # command compiler
-        self.compile = CachingCompiler()
+        self.compile = CachingCompiler(self.code_cache_size)
         
         # User input buffers
         # NOTE: these variables are slated for full removal, once we are 100%
@@ -478,6 +487,7 @@ class InteractiveShell(Configurable, Magic):
             config=self.config,
             shell=self,
             cache_size=self.cache_size,
+            cache_bytes=self.cache_bytes,
             input_sep = self.separate_in,
             output_sep = self.separate_out,
             output_sep2 = self.separate_out2,
@@ -1226,7 +1236,7 @@ class InteractiveShell(Configurable, Magic):
     #-------------------------------------------------------------------------
 
     def init_history(self):
-        self.history_manager = HistoryManager(shell=self)
+        self.history_manager = HistoryManager(shell=self, config=self.config)
 
     def save_hist(self):
         """Save input history to a file (via readline library)."""
@@ -1598,7 +1608,8 @@ class InteractiveShell(Configurable, Magic):
         """
         from IPython.core.completer import IPCompleter
         from IPython.core.completerlib import (module_completer,
-                                               magic_run_completer, cd_completer)
+                                               magic_run_completer, cd_completer,
+                                               ModuleIndex)
         
         self.Completer = IPCompleter(self,
                                      self.user_ns,
@@ -1612,6 +1623,16 @@ class InteractiveShell(Configurable, Magic):
         self.strdispatchers['complete_command'] = sdisp
         self.Completer.custom_completers = sdisp
 
+        # Keep the index of names to complete up to date after each
+        # execution, rather than rebuilding it on every completion.
+        self.Completer.update_names = False
+        self.register_post_execute(self.Completer.update_name_index)
+
+        # The modules to complete imports with are indexed in the background,
+        # so that the first completion doesn't have to wait for it.
+        self.module_index = ModuleIndex(self.db)
+        self.module_index.start_refresh()
+
         self.set_hook('complete_command', module_completer, str_key = 'import')
         self.set_hook('complete_command', module_completer, str_key = 'from')
         self.set_hook('complete_command', magic_run_completer, str_key = '%run')
@@ -2059,18 +2080,15 @@ class InteractiveShell(Configurable, Magic):
     def run_cell(self, cell):
         """Run the contents of an entire multiline 'cell' of code.
 
-        The cell is split into separate blocks which can be executed
-        individually.  Then, based on how many blocks there are, they are
-        executed as follows:
+        The cell is split into separate blocks, each of which could be
+        executed individually, and transformed to pure Python.  The result is
+        then parsed once and executed as follows:
 
-        - A single block: 'single' mode.
+        - if the last block is a single line, run all but the last block in
+        'exec' mode and the very last one in 'single' mode.  This makes it
+        easy to type simple expressions at the end to see computed values.
 
-        If there's more than one block, it depends:
-
-        - if the last one is no more than two lines long, run all but the last
-        in 'exec' mode and the very last one in 'single' mode.  This makes it
-        easy to type simple expressions at the end to see computed values.  -
-        otherwise (last one is also multiline), run all in 'exec' mode
+        - otherwise (last one is multiline), run all in 'exec' mode.
 
         When code is executed in 'single' mode, :func:`sys.displayhook` fires,
         results are displayed and output prompts are computed.  In 'exec' mode,
@@ -2115,42 +2133,129 @@ class InteractiveShell(Configurable, Magic):
         # All user code execution must happen with our context managers active
         with nested(self.builtin_trap, self.display_trap):
 
-            # Single-block input should behave like an interactive prompt
-            if len(blocks) == 1:
-                # since we return here, we need to update the execution count
-                out = self.run_one_block(blocks[0])
-                self.execution_count += 1
-                return out
-
-            # In multi-block input, if the last block is a simple (one-two
-            # lines) expression, run it in single mode so it produces output.
-            # Otherwise just feed the whole thing to run_code.  This seems like
-            # a reasonable usability design.
+            # If the last block is a simple (one line) statement, it is run in
+            # 'single' mode so it produces output, and it gets the dynamic
+            # transformations (automagic, autocall, aliases) applied to it, as
+            # it would at an interactive prompt.  Otherwise the whole cell is
+            # run in 'exec' mode.  This seems like a reasonable usability
+            # design.
             last = blocks[-1]
-            last_nlines = len(last.splitlines())
-
-            # Note: below, whenever we call run_code, we must sync history
-            # ourselves, because run_code is NOT meant to manage history at all.
-            if last_nlines < 2:
-                # Here we consider the cell split between 'body' and 'last',
-                # store all history and execute 'body', and if successful, then
-                # proceed to execute 'last'.
-
-                # Get the main body to run as a cell
-                ipy_body = ''.join(blocks[:-1])
-                retcode = self.run_source(ipy_body, symbol='exec',
-                                          post_execute=False)
-                if retcode==0:
-                    # And the last expression via runlines so it produces output
-                    self.run_one_block(last)
+            if len(last.splitlines()) < 2:
+                # The body runs first, so that the dynamic transformations of
+                # the last line see the names it defines.  Both parts are
+                # cached as a single cell, for tracebacks.
+                body = ''.join(blocks[:-1])
+                if type(ipy_cell)==str:
+                    ipy_cell = ipy_cell.decode(self.stdin_encoding)
+                cell_name = self.compile.cache(ipy_cell, self.execution_count)
+                failed = 0
+                if body:
+                    failed = self.run_ast_cell(body, False, cell_name=cell_name,
+                                               post_execute=False)
+                if not failed:
+                    last = self.prefilter_manager.prefilter_line(last)
+                    self.run_ast_cell(last, True, cell_name=cell_name,
+                                      first_lineno=len(body.splitlines()))
             else:
-                # Run the whole cell as one entity, storing both raw and
-                # processed input in history
-                self.run_source(ipy_cell, symbol='exec')
+                self.run_ast_cell(ipy_cell, False)
 
         # Each cell is a *single* input, regardless of how many lines it has
         self.execution_count += 1
 
+    def run_ast_cell(self, cell, interactive=True, last_lineno=0,
+                     cell_name=None, first_lineno=0, post_execute=True):
+        """Parse a cell of pure Python code once and run it.
+
+        The cell is registered in the linecache once, under a single name, so
+        the line numbers in tracebacks are those of the cell itself.  Then
+        the statements before line last_lineno are compiled and run as a
+        whole in 'exec' mode and, if interactive is true, the statements from
+        that line on are compiled and run in 'single' mode, so that
+        :func:`sys.displayhook` fires for them.  If interactive is false, the
+        whole cell is run in 'exec' mode.
+
+        Parameters
+        ----------
+        cell : str
+          Pure Python code, one or more lines.
+
+        interactive : bool, optional
+          Whether to run the last statements of the cell in 'single' mode.
+
+        last_lineno : int, optional
+          Zero-based line in the cell where the statements to run in 'single'
+          mode start.
+
+        cell_name : str, optional
+          The name the cell was cached under, if it is part of a larger cell
+          that was cached already.  By default the cell is cached on its own.
+
+        first_lineno : int, optional
+          The zero-based line the code starts at in the cell it was cached
+          as part of.
+
+        post_execute : bool, optional
+          Whether to run the post-execution functions after the code.
+
+        Returns
+        -------
+        0 if the whole cell ran successfully, 1 if an error occurred.
+        """
+        # We need to ensure that the source is unicode from here on.
+        if type(cell)==str:
+            cell = cell.decode(self.stdin_encoding)
+
+        if cell_name is None:
+            cell_name = self.compile.cache(cell, self.execution_count)
+        try:
+            tree = self.compile.ast_parse(cell, filename=cell_name)
+        except (OverflowError, SyntaxError, ValueError, TypeError,
+                MemoryError):
+            self.showsyntaxerror()
+            return 1
+        if first_lineno:
+            ast.increment_lineno(tree, first_lineno)
+            last_lineno += first_lineno
+        nodes = tree.body
+
+        if interactive:
+            # Statements on the same line as the start of the last block, like
+            # in 'x=1; x', all belong to the interactive part.
+            for nsingle, node in enumerate(reversed(nodes)):
+                if node.lineno <= last_lineno:
+                    break
+            else:
+                nsingle = len(nodes)
+        else:
+            nsingle = 0
+        exec_nodes = nodes[:len(nodes)-nsingle]
+        single_nodes = nodes[len(nodes)-nsingle:]
+
+        # Only whole groups of nodes are compiled, so there are at most two
+        # compilations per cell.  Everything is compiled before anything is
+        # run, so that a compilation error doesn't leave the cell half run.
+        to_run = []
+        try:
+            if exec_nodes:
+                to_run.append(self.compile.compile_ast(ast.Module(exec_nodes),
+                                                       cell_name, 'exec'))
+            if single_nodes:
+                mod = ast.Interactive(single_nodes)
+                to_run.append(self.compile.compile_ast(mod, cell_name,
+                                                       'single'))
+        except (OverflowError, SyntaxError, ValueError, TypeError,
+                MemoryError):
+            self.showsyntaxerror()
+            return 1
+
+        for i, code in enumerate(to_run):
+            # Post-execution functions only run once, after the whole cell.
+            self.code_to_run = code
+            if self.run_code(code, post_execute=(post_execute and
+                                                 i == len(to_run)-1)):
+                return 1
+        return 0
+
     def run_one_block(self, block):
         """Run a single interactive block.
 
@@ -2521,7 +2626,8 @@ class InteractiveShell(Configurable, Magic):
             except OSError:
                 pass
 
-        # Clear all user namespaces to release all references cleanly.
+        # Clear all user namespaces to release all references cleanly.  This
+        # also closes the history session, writing out any pending records.
         self.reset()
 
         # Run user hooks
@@ -1019,9 +1019,36 @@ Currently the magic system has the following functions:\n"""
             except TypeError:
                 raise TypeError('regex must be a string or compiled pattern')
             for i in self.magic_who_ls():
-                if m.search(i): 
-                    del(user_ns[i])        
-        
+                if m.search(i):
+                    del(user_ns[i])
+
+    def magic_outcache(self, parameter_s=''):
+        """Print the memory use and hit/miss statistics of the output cache.
+
+        The output cache holds the results kept in Out (or _oh) and in the _N
+        variables.  When it holds more than InteractiveShell.cache_size
+        results, or when they take more than InteractiveShell.cache_bytes
+        bytes (roughly measured), the least recently used results are dropped
+        from it, along with their _N variables.
+
+        Options:
+
+          -r: also reset the hit, miss and eviction counters.
+        """
+        opts, args = self.parse_options(parameter_s, 'r')
+        cache = self.shell.output_hist
+        st = cache.stats()
+        mb = 1024.0*1024
+        print 'Output cache: %i of %i entries, %.1f MB of %.1f MB' % \
+              (st['entries'], st['max_entries'], st['size']/mb,
+               st['max_bytes']/mb)
+        print 'Lookups: %i hits, %i misses' % (st['hits'], st['misses'])
+        print 'Evicted: %i entries, %.1f MB' % (st['evictions'],
+                                                st['evicted_bytes']/mb)
+        if 'r' in opts:
+            cache.hits = cache.misses = cache.evictions = 0
+            cache.evicted_bytes = 0
+
     def magic_logstart(self,parameter_s=''):
         """Start logging anywhere in a session.
 
@@ -1116,7 +1143,7 @@ Currently the magic system has the following functions:\n"""
                 for n in range(1,len(input_hist)-1):
                     log_write(input_hist[n].rstrip())
                     if n in output_hist:
-                        log_write(repr(output_hist[n]),'output')
+                        log_write(repr(output_hist.peek(n)),'output')
             else:
                 logger.log_write(input_hist[1:])
             if timestamp:
@@ -1679,7 +1706,7 @@ Currently the magic system has the following functions:\n"""
         """Time execution of a Python statement or expression
 
         Usage:\\
-          %timeit [-n<N> -r<R> [-t|-c]] statement
+          %timeit [-n<N> -r<R> [-t|-c] -b<B> -g -o -q] statement
 
         Time execution of a Python statement or expression using the timeit
         module.
@@ -1701,25 +1728,44 @@ Currently the magic system has the following functions:\n"""
         -p<P>: use a precision of <P> digits to display the timing result.
         Default: 3
 
+        -b<B>: spend at most about <B> seconds: the loop count is chosen for
+        the runs to fit in this time, and no more runs are started once it is
+        spent.
+
+        -g: leave the garbage collector enabled while timing.  Like the timeit
+        module, %timeit disables it by default.
+
+        -o: return a TimeitResult object, with the time of every run and
+        statistics on them, that can be compared with other results and saved
+        as JSON.
+
+        -q: quiet, do not print the result.
+
         
         Examples:
 
           In [1]: %timeit pass
-          10000000 loops, best of 3: 53.3 ns per loop
+          10000000 loops, best of 3: 53.3 ns per loop (mean 54.1 ns, stdev 0.9 ns)
 
           In [2]: u = None
 
           In [3]: %timeit u is None
-          10000000 loops, best of 3: 184 ns per loop
+          10000000 loops, best of 3: 184 ns per loop (mean 186 ns, stdev 2.1 ns)
 
           In [4]: %timeit -r 4 u == None
-          1000000 loops, best of 4: 242 ns per loop
+          1000000 loops, best of 4: 242 ns per loop (mean 245 ns, stdev 3.3 ns)
 
           In [5]: import time
 
           In [6]: %timeit -n1 time.sleep(2)
-          1 loops, best of 3: 2 s per loop
-          
+          1 loops, best of 3: 2 s per loop (mean 2 s, stdev 0.000117 s)
+
+          In [7]: r = %timeit -o -q -r 10 sum(range(100))
+
+          In [8]: r.best < 2e-6, r.repeat
+          Out[8]: (True, 10)
+
+          In [9]: open('sum.json', 'w').write(r.to_json())
 
         The times reported by %timeit will be slightly higher than those
         reported by the timeit.py script when variables are accessed. This is
@@ -1730,33 +1776,9 @@ Currently the magic system has the following functions:\n"""
         those from %timeit."""
 
         import timeit
-        import math
-
-        # XXX: Unfortunately the unicode 'micro' symbol can cause problems in
-        # certain terminals.  Until we figure out a robust way of
-        # auto-detecting if the terminal can deal with it, use plain 'us' for
-        # microseconds.  I am really NOT happy about disabling the proper
-        # 'micro' prefix, but crashing is worse... If anyone knows what the
-        # right solution for this is, I'm all ears...
-        #
-        # Note: using
-        #
-        # s = u'\xb5'
-        # s.encode(sys.getdefaultencoding())
-        #
-        # is not sufficient, as I've seen terminals where that fails but
-        # print s
-        #
-        # succeeds
-        #
-        # See bug: https://bugs.launchpad.net/ipython/+bug/348466
-        
-        #units = [u"s", u"ms",u'\xb5',"ns"]
-        units = [u"s", u"ms",u'us',"ns"]
-        
-        scaling = [1, 1e3, 1e6, 1e9]
-
-        opts, stmt = self.parse_options(parameter_s,'n:r:tcp:',
+        from IPython.utils.timing import timeit_runs
+
+        opts, stmt = self.parse_options(parameter_s,'n:r:tcp:b:goq',
                                         posix=False)
         if stmt == "":
             return
@@ -1764,18 +1786,18 @@ Currently the magic system has the following functions:\n"""
         number = int(getattr(opts, "n", 0))
         repeat = int(getattr(opts, "r", timeit.default_repeat))
         precision = int(getattr(opts, "p", 3))
+        budget = float(getattr(opts, "b", 0))
         if hasattr(opts, "t"):
             timefunc = time.time
         if hasattr(opts, "c"):
             timefunc = clock
 
-        timer = timeit.Timer(timer=timefunc)
         # this code has tight coupling to the inner workings of timeit.Timer,
         # but is there a better way to achieve that the code stmt has access
         # to the shell namespace?
 
         src = timeit.template % {'stmt': timeit.reindent(stmt, 8),
-                                 'setup': "pass"}
+                                 'setup': "pass", 'init': ''}
         # Track compilation time so it can be reported if too long
         # Minimum time above which compilation time will be reported
         tc_min = 0.1
@@ -1786,30 +1808,19 @@ Currently the magic system has the following functions:\n"""
         
         ns = {}
         exec code in self.shell.user_ns, ns
-        timer.inner = ns["inner"]
-        
-        if number == 0:
-            # determine number so that 0.2 <= total time < 2.0
-            number = 1
-            for i in range(1, 10):
-                if timer.timeit(number) >= 0.2:
-                    break
-                number *= 10
-        
-        best = min(timer.repeat(repeat, number)) / number
 
-        if best > 0.0 and best < 1000.0:
-            order = min(-int(math.floor(math.log10(best)) // 3), 3)
-        elif best >= 1000.0:
-            order = 0
-        else:
-            order = 3
-        print u"%d loops, best of %d: %.*g %s per loop" % (number, repeat,
-                                                          precision,
-                                                          best * scaling[order],
-                                                          units[order])
-        if tc > tc_min:
-            print "Compiler time: %.2f s" % tc
+        result = timeit_runs(ns["inner"], number, repeat, timefunc,
+                             gc_enabled=hasattr(opts, "g"), budget=budget)
+        result.stmt = stmt
+        result.timer = "%s.%s" % (timefunc.__module__, timefunc.__name__)
+        result.compile_time = tc
+        result.precision = precision
+        if not hasattr(opts, "q"):
+            print result
+            if tc > tc_min:
+                print "Compiler time: %.2f s" % tc
+        if hasattr(opts, "o"):
+            return result
 
     @testdec.skip_doctest
     def magic_time(self,parameter_s = ''):
@@ -2530,25 +2541,35 @@ Defaulting color scheme to 'NoColor'"""
         """Update the alias table with all executable files in $PATH.
 
         This version explicitly checks that every entry in $PATH is a file
-        with execute access (os.X_OK), so it is much slower than %rehash.
+        with execute access (os.X_OK).  The executables found are kept in an
+        index along with the mtime of their directory, and only the
+        directories that changed since the last %rehashx are listed again,
+        so that it is fast once the index is built.
+
+        Options:
+
+          -f: list all the directories again.  Use this after changing the
+          permissions of files, which doesn't change the mtime of the
+          directories.
 
         Under Windows, it checks executability as a match agains a
         '|'-separated string of extensions, stored in the IPython config
         variable win_exec_ext.  This defaults to 'exe|com|bat'.
         
-        This function also resets the root module cache of module completer,
-        used on slow filesystems.
+        This function also rebuilds the index of modules used to complete
+        imports, which otherwise only checks for changes in the folders it
+        uses.
         """
-        from IPython.core.alias import InvalidAliasError
+        from IPython.core.alias import ExecutableIndex
 
-        # for the benefit of module completer in ipy_completers.py
-        del self.db['rootmodules']
+        opts, args = self.parse_options(parameter_s, 'f')
+
+        # for the benefit of the module completer in completerlib.py
+        self.shell.module_index.reset()
         
         path = [os.path.abspath(os.path.expanduser(p)) for p in 
             os.environ.get('PATH','').split(os.pathsep)]
-        path = filter(os.path.isdir,path)
 
-        syscmdlist = []
         # Now define isexec in a cross platform manner.
         if os.name == 'posix':
             isexec = lambda fname:os.path.isfile(fname) and \
@@ -2562,47 +2583,33 @@ Defaulting color scheme to 'NoColor'"""
                 winext += '|py'
             execre = re.compile(r'(.*)\.(%s)$' % winext,re.IGNORECASE)
             isexec = lambda fname:os.path.isfile(fname) and execre.match(fname)
-        savedir = os.getcwd()
 
-        # Now walk the paths looking for executables to alias.
-        try:
-            # write the whole loop for posix/Windows so we don't have an if in
-            # the innermost part
-            if os.name == 'posix':
-                for pdir in path:
-                    os.chdir(pdir)
-                    for ff in os.listdir(pdir):
-                        if isexec(ff):
-                            try:
-                                # Removes dots from the name since ipython
-                                # will assume names with dots to be python.
-                                self.shell.alias_manager.define_alias(
-                                    ff.replace('.',''), ff)
-                            except InvalidAliasError:
-                                pass
-                            else:
-                                syscmdlist.append(ff)
-            else:
-                no_alias = self.shell.alias_manager.no_alias
-                for pdir in path:
-                    os.chdir(pdir)
-                    for ff in os.listdir(pdir):
-                        base, ext = os.path.splitext(ff)
-                        if isexec(ff) and base.lower() not in no_alias:
-                            if ext.lower() == '.exe':
-                                ff = base
-                                try:
-                                    # Removes dots from the name since ipython
-                                    # will assume names with dots to be python.
-                                    self.shell.alias_manager.define_alias(
-                                        base.lower().replace('.',''), ff)
-                                except InvalidAliasError:
-                                    pass
-                                syscmdlist.append(ff)
-            db = self.db
-            db['syscmdlist'] = syscmdlist
-        finally:
-            os.chdir(savedir)
+        index = ExecutableIndex(self.db)
+        if opts.has_key('f'):
+            index.clear()
+        executables = index.scan(path, isexec)
+
+        # Now build the aliases and define them all at once.
+        alias_manager = self.shell.alias_manager
+        if os.name == 'posix':
+            # Removes dots from the name since ipython will assume names
+            # with dots to be python.
+            aliases = [(ff.replace('.',''), ff)
+                       for pdir, names in executables for ff in names]
+            syscmdlist = [cmd for name, cmd in
+                          alias_manager.define_aliases(aliases)]
+        else:
+            no_alias = alias_manager.no_alias
+            aliases = []
+            for pdir, names in executables:
+                for ff in names:
+                    base, ext = os.path.splitext(ff)
+                    if base.lower() not in no_alias and ext.lower() == '.exe':
+                        aliases.append((base.lower().replace('.',''), base))
+            alias_manager.define_aliases(aliases)
+            syscmdlist = [cmd for name, cmd in aliases]
+        db = self.db
+        db['syscmdlist'] = syscmdlist
         
     def magic_pwd(self, parameter_s = ''):
         """Return the current working directory path."""
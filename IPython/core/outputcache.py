@@ -0,0 +1,168 @@
+"""The output history, bounded by number of entries and by memory use.
+"""
+#-----------------------------------------------------------------------------
+#  Copyright (C) 2010  The IPython Development Team
+#
+#  Distributed under the terms of the BSD License.  The full license is in
+#  the file COPYING, distributed as part of this software.
+#-----------------------------------------------------------------------------
+
+#-----------------------------------------------------------------------------
+# Imports
+#-----------------------------------------------------------------------------
+
+from collections import deque
+
+from IPython.utils.data import approx_sizeof
+
+#-----------------------------------------------------------------------------
+# Classes and functions
+#-----------------------------------------------------------------------------
+
+class OutputCache(dict):
+    """A dict of outputs keyed by prompt number, dropping old ones as needed.
+
+    When more than max_entries outputs are stored, or when they take more
+    than max_bytes bytes as measured by :func:`approx_sizeof`, the least
+    recently used ones are dropped until we are under both limits again.
+    Looking up an output by key marks it as used, :meth:`peek` doesn't.  The
+    entry just stored is never dropped, even if it alone goes over max_bytes.
+
+    on_evict, if given, is called with the key and value of each dropped
+    entry, so that other references to it (like the ``_N`` variables) can be
+    cleaned up too.
+    """
+
+    def __init__(self, max_entries=1000, max_bytes=256*1024*1024,
+                 on_evict=None):
+        dict.__init__(self)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.on_evict = on_evict
+        # Number of bytes taken by the stored outputs
+        self.size = 0
+        # Lookups by key that found an entry, and that didn't
+        self.hits = 0
+        self.misses = 0
+        # Number of entries dropped, and how many bytes they took
+        self.evictions = 0
+        self.evicted_bytes = 0
+        self._sizes = {}
+        # Last time each entry was used, in a counter of uses, and the
+        # (time, key) of the uses, oldest first.  Entries of the deque for
+        # keys that were used again since, or dropped, are skipped when we
+        # get to them.
+        self._used = {}
+        self._order = deque()
+        self._clock = 0
+
+    def _touch(self, key):
+        self._clock += 1
+        self._used[key] = self._clock
+        self._order.append((self._clock, key))
+        if len(self._order) > 2*len(self._used) + 100:
+            used = self._used
+            self._order = deque(e for e in self._order
+                                if used.get(e[1]) == e[0])
+
+    def __getitem__(self, key):
+        try:
+            value = dict.__getitem__(self, key)
+        except KeyError:
+            self.misses += 1
+            raise
+        self.hits += 1
+        self._touch(key)
+        return value
+
+    def get(self, key, default=None):
+        # Not finding an entry here is not a miss: callers like
+        # HistoryManager.get_history look up every prompt number.
+        if key in self:
+            return self[key]
+        return default
+
+    def peek(self, key, default=None):
+        """Return the output for key, without counting it as a use.
+
+        This is for listings like ``%hist -o``, which go over every output
+        and shouldn't change which ones are dropped first.
+        """
+        return dict.get(self, key, default)
+
+    def __setitem__(self, key, value):
+        if key in self:
+            self._forget(key)
+        dict.__setitem__(self, key, value)
+        size = approx_sizeof(value)
+        self._sizes[key] = size
+        self.size += size
+        self._touch(key)
+        if len(self) > self.max_entries or self.size > self.max_bytes:
+            self.shrink(keep=key)
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        self._forget(key)
+
+    def _forget(self, key):
+        self.size -= self._sizes.pop(key)
+        del self._used[key]
+
+    def pop(self, key, *default):
+        if key in self:
+            self._forget(key)
+        return dict.pop(self, key, *default)
+
+    def popitem(self):
+        key, value = dict.popitem(self)
+        self._forget(key)
+        return key, value
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return dict.__getitem__(self, key)
+
+    def update(self, *args, **kw):
+        for key, value in dict(*args, **kw).iteritems():
+            self[key] = value
+
+    def clear(self):
+        dict.clear(self)
+        self._sizes.clear()
+        self._used.clear()
+        self._order.clear()
+        self.size = 0
+
+    def shrink(self, keep=None):
+        """Drop least recently used entries until we are within our limits.
+
+        The entry with key keep is not dropped.
+        """
+        order = self._order
+        kept = []
+        while order:
+            if len(self) <= self.max_entries and self.size <= self.max_bytes:
+                break
+            clock, key = order.popleft()
+            if self._used.get(key) != clock:
+                continue
+            if key == keep:
+                kept.append((clock, key))
+                continue
+            value = dict.pop(self, key)
+            self.evictions += 1
+            self.evicted_bytes += self._sizes[key]
+            self._forget(key)
+            if self.on_evict is not None:
+                self.on_evict(key, value)
+        order.extendleft(kept)
+
+    def stats(self):
+        """Return a dict with the current usage and hit/miss counters."""
+        return dict(entries=len(self), size=self.size,
+                    max_entries=self.max_entries, max_bytes=self.max_bytes,
+                    hits=self.hits, misses=self.misses,
+                    evictions=self.evictions,
+                    evicted_bytes=self.evicted_bytes)
@@ -60,3 +60,88 @@ def test_compiler_check_cache():
             break
     else:
         raise AssertionError('Entry for input-99 missing from linecache')
+
+
+def test_compiler_ast():
+    """Test compiling a parsed cell under its cached name.
+    """
+    cp = compilerop.CachingCompiler()
+    code = 'x=1\nx+1\n'
+    name = cp.cache(code, 98)
+    nt.assert_true(name.startswith('<ipython-input-98'))
+    nt.assert_equal(linecache.getline(name, 2), 'x+1\n')
+    mod = cp.ast_parse(code, name)
+    code_obj = cp.compile_ast(mod, name, 'exec')
+    nt.assert_equal(code_obj.co_filename, name)
+
+
+def test_code_cache_lru():
+    """Test that the code cache drops least recently used, unused entries.
+    """
+    cache = compilerop.CodeCache(max_size=12000)
+    entry = lambda name: (100, None, ['x'*100+'\n']*20, name)
+    for i in range(3):
+        cache.add('<test-%i>' % i, entry('<test-%i>' % i))
+    nt.assert_true(cache.size > 0)
+    nt.assert_true('<test-0>' in linecache.cache)
+    # Using <test-0> makes <test-1> the least recently used entry.
+    cache.get('<test-0>')
+    for i in range(3, 6):
+        cache.add('<test-%i>' % i, entry('<test-%i>' % i))
+    nt.assert_true(cache.size <= cache.max_size)
+    nt.assert_false('<test-1>' in cache)
+    nt.assert_false('<test-1>' in linecache.cache)
+    nt.assert_true('<test-0>' in cache)
+    nt.assert_true('<test-5>' in cache)
+    for name in list(cache):
+        cache.remove(name)
+    nt.assert_equal(cache.size, 0)
+
+
+def test_code_cache_live():
+    """Test that code in use keeps its source cached.
+    """
+    cp = compilerop.CachingCompiler()
+    cache = linecache._ipython_cache
+    max_size = cache.max_size
+    try:
+        ns = {}
+        exec cp('def f():\n    return 1\n', 'exec', 97) in ns
+        name = ns['f'].func_code.co_filename
+        cache.max_size = cache.size
+        for i in range(20):
+            cp('x = %i\n' % i + '# filler\n' * 100, 'exec', 97)
+        nt.assert_true(name in cache)
+        # Even after it was cleared from the linecache, it is found.
+        linecache.clearcache()
+        nt.assert_equal(linecache.getline(name, 2), '    return 1\n')
+    finally:
+        cache.max_size = max_size
+
+
+def test_code_cache_track():
+    """Test that entries are freed when the code compiled from them dies.
+    """
+    cache = compilerop.CodeCache(max_size=12000)
+    entry = lambda name: (100, None, ['x'*100+'\n']*20, name)
+    cache.add('<test-f>', entry('<test-f>'))
+    # Code nobody holds does not keep its entry.
+    cache.track(compile('def f():\n    return 1\n', '<test-f>', 'exec'))
+    nt.assert_false(cache.is_live('<test-f>'))
+    ns = {}
+    code = compile('def f():\n    return 1\n', '<test-f>', 'exec')
+    cache.track(code)
+    exec code in ns
+    del code
+    # The function keeps its entry alive, through its nested code object.
+    nt.assert_true(cache.is_live('<test-f>'))
+    for i in range(5):
+        cache.add('<test-%i>' % i, entry('<test-%i>' % i))
+    nt.assert_true('<test-f>' in cache)
+    del ns['f']
+    nt.assert_false(cache.is_live('<test-f>'))
+    for i in range(5, 10):
+        cache.add('<test-%i>' % i, entry('<test-%i>' % i))
+    nt.assert_false('<test-f>' in cache)
+    for name in list(cache):
+        cache.remove(name)
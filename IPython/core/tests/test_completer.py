@@ -156,3 +156,95 @@ def test_file_completions():
         c = ip.complete(prefix, cmd)[1]
         comp = [prefix+s for s in suffixes]
         nt.assert_equal(c, comp)
+
+
+def test_name_index():
+    index = completer.NameIndex()
+    index.update('a', ['abc', 'abd', 'b'])
+    index.update('b', ['abd', 'xyz'])
+    nt.assert_equal(index.match('ab'), ['abc', 'abd'])
+    nt.assert_equal(index.match(''), ['abc', 'abd', 'b', 'xyz'])
+    nt.assert_equal(index.match('c'), [])
+    # A name stays as long as one of its sources has it.
+    index.update('a', ['abc', 'b'])
+    nt.assert_equal(index.match('ab'), ['abc', 'abd'])
+    index.update('b', ['xyz'])
+    nt.assert_equal(index.match('ab'), ['abc'])
+    # Many changes at once rebuild the index.
+    index.update('b', ['n%04i' % i for i in range(1000)])
+    nt.assert_equal(len(index), 1002)
+    nt.assert_equal(index.match('n099'), ['n0990', 'n0991', 'n0992', 'n0993',
+                                          'n0994', 'n0995', 'n0996', 'n0997',
+                                          'n0998', 'n0999'])
+
+
+def test_global_matches_follow_namespace():
+    ip = get_ipython()
+    ip.run_cell('zz_index_test = 1')
+    nt.assert_true('zz_index_test' in ip.complete('zz_index_t')[1])
+    ip.run_cell('del zz_index_test; zz_index_other = 1')
+    nt.assert_equal(ip.complete('zz_index_')[1], ['zz_index_other'])
+    # Names pushed in between executions are found too.
+    ip.push(dict(zz_index_pushed=1))
+    nt.assert_true('zz_index_pushed' in ip.complete('zz_index_')[1])
+    ip.run_cell('del zz_index_other, zz_index_pushed')
+    nt.assert_equal(ip.complete('zz_index_')[1], [])
+
+
+def test_completion_budget():
+    ip = get_ipython()
+    c = ip.Completer
+    calls = []
+    def slow_matches(text):
+        calls.append(text)
+        while 1:
+            if c.expired():
+                return ['slow_partial']
+    slow_matches.__name__ = 'slow_matches'
+    def next_matches(text):
+        calls.append(text)
+        return ['next_match']
+    saved = c.matchers, c.budget, c.matcher_budget, c.matcher_stats
+    try:
+        c.matchers = [slow_matches, next_matches]
+        c.matcher_stats = {}
+        # A matcher past its own deadline doesn't hold up the others.
+        c.budget, c.matcher_budget = 0, 0.05
+        text, matches = ip.complete('zz_budget')
+        nt.assert_equal(matches, ['next_match', 'slow_partial'])
+        nt.assert_true(c.incomplete)
+        stats = c.matcher_stats['slow_matches']
+        nt.assert_equal((stats['calls'], stats['timeouts']), (1, 1))
+        nt.assert_true(stats['max'] >= 0.05)
+        # Once the budget of the completion is spent, the other matchers
+        # are skipped.
+        c.budget = 0.05
+        del calls[:]
+        text, matches = ip.complete('zz_budget')
+        nt.assert_equal(matches, ['slow_partial'])
+        nt.assert_equal(len(calls), 1)
+        nt.assert_true(c.incomplete)
+    finally:
+        c.matchers, c.budget, c.matcher_budget, c.matcher_stats = saved
+
+
+def test_completion_interrupted():
+    import signal
+    if not hasattr(signal, 'setitimer'):
+        return
+    import time
+    ip = get_ipython()
+    c = ip.Completer
+    def blocking_matches(text):
+        time.sleep(10)
+        return ['never']
+    saved = c.matchers, c.matcher_budget
+    try:
+        c.matchers = [blocking_matches, lambda text: ['zz_after']]
+        c.matcher_budget = 0.05
+        text, matches = ip.complete('zz_')
+        nt.assert_equal(matches, ['zz_after'])
+        nt.assert_true(c.incomplete)
+        nt.assert_equal(signal.getsignal(signal.SIGALRM), signal.SIG_DFL)
+    finally:
+        c.matchers, c.matcher_budget = saved
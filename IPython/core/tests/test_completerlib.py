@@ -0,0 +1,88 @@
+"""Tests for the completers and the module index in completerlib.
+"""
+#-----------------------------------------------------------------------------
+# Module imports
+#-----------------------------------------------------------------------------
+
+# stdlib
+import os
+import sys
+
+# third party
+import nose.tools as nt
+
+# our own packages
+from IPython.core import completerlib
+from IPython.utils.tempdir import TemporaryDirectory
+
+#-----------------------------------------------------------------------------
+# Test functions
+#-----------------------------------------------------------------------------
+
+def make_files(root, names):
+    for name in names:
+        path = os.path.join(root, name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        open(path, 'w').close()
+
+
+def test_module_index():
+    with TemporaryDirectory() as tmpdir:
+        make_files(tmpdir, ['zzmod_a.py', 'zzpkg_b/__init__.py',
+                            'zzpkg_b/sub1.py', 'zzpkg_b/subpkg/__init__.py',
+                            'zzpkg_b/subpkg/leaf.py', 'notes.txt'])
+        db = {}
+        index = completerlib.ModuleIndex(db)
+        sys.path.insert(0, tmpdir)
+        try:
+            roots = index.root_modules()
+            nt.assert_true('zzmod_a' in roots)
+            nt.assert_true('zzpkg_b' in roots)
+            nt.assert_false('notes' in roots)
+            nt.assert_equal(sorted(index.submodules('zzpkg_b')),
+                            ['sub1', 'subpkg'])
+            nt.assert_equal(index.submodules('zzpkg_b.subpkg'), ['leaf'])
+            nt.assert_equal(index.submodules('zzmod_a'), None)
+            nt.assert_equal(index.submodules('zzpkg_b.nothere'), None)
+            # Packages are not imported to find their submodules.
+            nt.assert_false('zzpkg_b' in sys.modules)
+            # New modules show up in the folders that changed.
+            make_files(tmpdir, ['zzpkg_b/sub2.py', 'zzmod_c.py'])
+            nt.assert_true('zzmod_c' in index.root_modules())
+            nt.assert_true('sub2' in index.submodules('zzpkg_b'))
+            # The index is saved, and used by the next session.
+            dirs = db[completerlib.MODULE_INDEX_KEY]
+            nt.assert_true(tmpdir in dirs)
+            index = completerlib.ModuleIndex(db)
+            nt.assert_true('zzmod_c' in index.root_modules())
+        finally:
+            sys.path.remove(tmpdir)
+
+
+def test_module_index_refresh():
+    with TemporaryDirectory() as tmpdir:
+        make_files(tmpdir, ['zzmod_r.py'])
+        index = completerlib.ModuleIndex()
+        sys.path.insert(0, tmpdir)
+        try:
+            index.start_refresh()
+            index._thread.join()
+            nt.assert_equal(index._lookup(tmpdir, False), (['zzmod_r'], []))
+        finally:
+            sys.path.remove(tmpdir)
+
+
+def test_module_completion():
+    with TemporaryDirectory() as tmpdir:
+        make_files(tmpdir, ['zzpkg_c/__init__.py', 'zzpkg_c/sub.py'])
+        sys.path.insert(0, tmpdir)
+        try:
+            nt.assert_equal(completerlib.module_completion('import zzpkg_c.'),
+                            ['zzpkg_c.sub'])
+            nt.assert_equal(
+                completerlib.module_completion('from zzpkg_c import '),
+                ['sub'])
+            nt.assert_false('zzpkg_c' in sys.modules)
+        finally:
+            sys.path.remove(tmpdir)
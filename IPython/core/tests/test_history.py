@@ -0,0 +1,150 @@
+"""Tests for the history module.
+"""
+#-----------------------------------------------------------------------------
+#  Copyright (C) 2010 The IPython Development Team.
+#
+#  Distributed under the terms of the BSD License.
+#
+#  The full license is in the file COPYING.txt, distributed with this software.
+#-----------------------------------------------------------------------------
+
+#-----------------------------------------------------------------------------
+# Imports
+#-----------------------------------------------------------------------------
+from __future__ import print_function
+
+# Stdlib imports
+import os
+import shutil
+import tempfile
+
+# Third-party imports
+import nose.tools as nt
+
+# Our own imports
+from IPython.core import history
+from IPython.testing import decorators as dec
+from IPython.testing.globalipapp import get_ipython
+from IPython.utils import pickleshare
+
+#-----------------------------------------------------------------------------
+# Globals
+#-----------------------------------------------------------------------------
+
+skip_without_sqlite = dec.skipif(history.sqlite3 is None,
+                                 "This test requires sqlite3")
+
+#-----------------------------------------------------------------------------
+# Test functions
+#-----------------------------------------------------------------------------
+
+@skip_without_sqlite
+def test_db_range_and_tail():
+    """Range and tail queries only return the requested cells."""
+    hdb = history.HistoryDB(':memory:')
+    try:
+        s1 = hdb.new_session()
+        for i in range(10):
+            hdb.store_input(s1, i, u'a=%d' % i, u'%%a %d' % i)
+        s2 = hdb.new_session()
+        hdb.store_input(s2, 1, u'b=1', u'b=1')
+        hdb.store_output(s2, 1, u'1')
+
+        rows = hdb.get_range(s1, 3, 6, raw=False)
+        nt.assert_equal(rows, [(s1, i, u'a=%d' % i) for i in range(3, 6)])
+        rows = hdb.get_tail(2, session=s1)
+        nt.assert_equal(rows, [(s1, 8, u'%a 8'), (s1, 9, u'%a 9')])
+        rows = hdb.get_tail(1, output=True)
+        nt.assert_equal(rows, [(s2, 1, u'b=1', u'1')])
+        rows = hdb.search(u'%a [12]')
+        nt.assert_equal([r[1] for r in rows], [1, 2])
+    finally:
+        hdb.close()
+
+
+@skip_without_sqlite
+def test_db_persists_across_connections():
+    """Stored inputs survive closing and reopening the database."""
+    tmpdir = tempfile.mkdtemp()
+    try:
+        fname = os.path.join(tmpdir, 'history.sqlite')
+        hdb = history.HistoryDB(fname)
+        session = hdb.new_session()
+        hdb.store_input(session, 1, u'x=1', u'x=1')
+        hdb.end_session(session, 1)
+        hdb.close()
+
+        hdb = history.HistoryDB(fname)
+        nt.assert_equal(hdb.get_range(session), [(session, 1, u'x=1')])
+        hdb.close()
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+@skip_without_sqlite
+def test_get_history():
+    """get_history reads the current session back through the database."""
+    ip = get_ipython()
+    hm = ip.history_manager
+    ip.run_cell('a_hist_test = 1')
+    ip.run_cell('a_hist_test')
+    n = len(hm.input_hist)
+    hist = hm.get_history(2, raw=True, output=False)
+    nt.assert_equal(hist, {n-2: u'a_hist_test = 1', n-1: u'a_hist_test'})
+    hist = hm.get_history((n-1, n), raw=False, output=True)
+    nt.assert_equal(hist, {n-1: (u'a_hist_test\n', 1)})
+
+
+@skip_without_sqlite
+def test_store_bytes_input():
+    """Byte string input with non-ascii characters reaches the database."""
+    ip = get_ipython()
+    hm = ip.history_manager
+    hm.store_inputs('a_hist_bytes = "\xc3\xa9"')
+    # Bytes that aren't UTF-8 are kept too, whatever the terminal encoding.
+    hm.store_inputs('a_hist_bytes = "\xe9"')
+    hm.db.flush()
+    n = len(hm.input_hist)
+    hist = hm.get_history((n-2, n), raw=True, output=False)
+    nt.assert_equal(hist[n-2], u'a_hist_bytes = "\xe9"')
+    nt.assert_equal(hist[n-1].encode('latin-1'), 'a_hist_bytes = "\xe9"')
+
+
+def test_shadowhist_log():
+    """Shadow history is appended to a log and survives reopening it."""
+    tmpdir = tempfile.mkdtemp()
+    try:
+        db = pickleshare.PickleShareDB(tmpdir)
+        s = history.ShadowHist(db, get_ipython())
+        for ent in ['a=1', 'b=2\nc=3', 'a=1', u'd=\xe9']:
+            s.add(ent)
+        nt.assert_equal(s.all(), [(1, 'a=1'), (2, 'b=2\nc=3'), (3, u'd=\xe9')])
+
+        # A second instance (e.g. another session) sees the same entries,
+        # and entries it adds are picked up by the first one.
+        s2 = history.ShadowHist(db, get_ipython())
+        nt.assert_equal(s2.get(2), 'b=2\nc=3')
+        s2.add('e=4')
+        s2.add('a=1')
+        s.add('e=4')
+        nt.assert_equal(s.get(4), 'e=4')
+        nt.assert_equal(len(s.all()), 4)
+        nt.assert_equal(s.get(5), None)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_shadowhist_migrate():
+    """Shadow history in the old PickleShareDB format is migrated."""
+    tmpdir = tempfile.mkdtemp()
+    try:
+        db = pickleshare.PickleShareDB(tmpdir)
+        db.hset('shadowhist', 'x=1', 1)
+        db.hset('shadowhist', 'y=2', 3)
+        s = history.ShadowHist(db, get_ipython())
+        nt.assert_equal(s.all(), [(1, 'x=1'), (3, 'y=2')])
+        s.add('y=2')
+        s.add('z=3')
+        nt.assert_equal(s.get(4), 'z=3')
+    finally:
+        shutil.rmtree(tmpdir)
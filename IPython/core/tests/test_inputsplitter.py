@@ -106,6 +106,31 @@ def test_remove_comments():
         nt.assert_equal(isp.remove_comments(inp), out)
 
 
+def test_line_lexer():
+    # Each test is a list of lines, and the expected (paren_level,
+    # string_quote, continued) state after pushing all of them.
+    tests = [(['x = 1'], (0, None, False)),
+             (['x = (1,'], (1, None, False)),
+             (['x = [(1,', '2)'], (1, None, False)),
+             (['x = f(a, # )', '"("'], (1, None, False)),
+             (['x = 1 + \\'], (0, None, True)),
+             (['x = 1 + \\', '2'], (0, None, False)),
+             (["s = '''abc"], (0, "'''", False)),
+             (["s = '''abc", "(def"], (0, "'''", False)),
+             (["s = '''abc", "def''' + ("], (1, None, False)),
+             (['s = "a\\"b" # "'], (0, None, False)),
+             (['s = "ab\\'], (0, '"', False)),
+             (["s = 'don't"], (0, None, False)),
+             ]
+    for lines, state in tests:
+        lexer = isp.LineLexer()
+        for line in lines:
+            lexer.push(line)
+        nt.assert_equal((lexer.paren_level, lexer.string_quote,
+                         lexer.continued), state)
+        nt.assert_equal(lexer.at_line_start, not any(state))
+
+
 def test_get_input_encoding():
     encoding = isp.get_input_encoding()
     nt.assert_true(isinstance(encoding, basestring))
@@ -333,6 +358,31 @@ class InputSplitterTestCase(unittest.TestCase):
         for block_lines in all_blocks:
             self.check_split(block_lines)
         
+    def test_split_multiline(self):
+        # Blocks that span several lines through strings, brackets and
+        # decorators must not be cut in the middle.
+        all_blocks = [ [['x = 1'],
+                        ['"""A docstring',
+                         'on two lines"""'],
+                        ['y = 2']],
+
+                       [['s = (1,',
+                         '     2)'],
+                        ['@staticmethod',
+                         '@property',
+                         'def f(x):',
+                         '  return x'],
+                        ['z = 3']],
+
+                       [['if 1:',
+                         '  s = """',
+                         'x=1',
+                         '  """'],
+                        ['t = 2']],
+                       ]
+        for block_lines in all_blocks:
+            self.check_split(block_lines)
+
     def test_split_syntax_errors(self):
         # Block splitting with invalid syntax
         all_blocks = [ [['a syntax error']],
@@ -613,6 +663,19 @@ class IPythonInputTestCase(InputSplitterTestCase):
                 self.assertEqual(out_raw.rstrip(), raw)
                 
 
+    def test_syntax_in_strings(self):
+        # Special syntax is only transformed at the start of a logical line,
+        # never inside multiline strings or bracketed expressions.
+        isp = self.isp
+        lines = ["s = '''", "!ls", "'''", "d = [1,", "%who]", "for i in x:",
+                 "    !ls", "    !pwd", ""]
+        blocks = isp.split_blocks('\n'.join(lines))
+        out = ''.join(blocks).splitlines()
+        self.assertEqual(out[:5], lines[:5])
+        self.assertEqual(out[6:8], ['    get_ipython().system("ls")',
+                                    '    get_ipython().system("pwd")'])
+
+
 class BlockIPythonInputTestCase(IPythonInputTestCase):
 
     # Deactivate tests that don't make sense for the block mode
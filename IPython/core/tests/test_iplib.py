@@ -5,8 +5,10 @@
 #-----------------------------------------------------------------------------
 
 # stdlib
+import linecache
 import os
 import shutil
+import sys
 import tempfile
 
 # third party
@@ -263,6 +265,49 @@ def test_runlines():
     ip.runlines(complex)
     
 
+def test_run_cell_last_expr():
+    """run_cell shows the value of a final one-line expression."""
+    number = ip.execution_count
+    ip.run_cell('rc_a = 3\nrc_b = rc_a*2\nrc_b+1\n')
+    nt.assert_equals(ip.user_ns['rc_b'], 6)
+    nt.assert_equals(ip.user_ns['_oh'][number], 7)
+    ip.run_cell('rc_a = 4; rc_a\n')
+    nt.assert_equals(ip.user_ns['_oh'][number+1], 4)
+
+
+def test_run_cell_linecache():
+    """A cell is cached once, and tracebacks point to its own lines."""
+    cached = set(linecache._ipython_cache)
+    ip.run_cell('def rc_f():\n    return 1/0\n\nrc_x = 1\nrc_f()\n')
+    names = list(set(linecache._ipython_cache) - cached)
+    nt.assert_equals(len(names), 1)
+    tb = sys.last_traceback
+    while tb.tb_next is not None:
+        tb = tb.tb_next
+    nt.assert_equals(tb.tb_frame.f_code.co_filename, names[0])
+    nt.assert_equals(tb.tb_lineno, 2)
+    nt.assert_equals(linecache.getline(names[0], 5), 'rc_f()\n')
+
+
+def test_run_cell_last_line_sees_body():
+    """The last line is transformed after the body of the cell has run."""
+    number = ip.execution_count
+    ip.alias_manager.define_alias('rc_myls', 'ls')
+    try:
+        ip.run_cell('rc_myls = 5\nrc_myls\n')
+        nt.assert_equals(ip.user_ns['_oh'][number], 5)
+    finally:
+        ip.alias_manager.undefine_alias('rc_myls')
+        del ip.user_ns['rc_myls']
+    autocall = ip.autocall
+    ip.magic('autocall 2')
+    try:
+        ip.run_cell('def rc_g(): return 7\nrc_g\n')
+        nt.assert_equals(ip.user_ns['_oh'][number+1], 7)
+    finally:
+        ip.magic('autocall %d' % autocall)
+
+
 def test_db():
     """Test the internal database used for variable persistence."""
     ip.db['__unittest_'] = 12
@@ -42,6 +42,42 @@ def test_rehashx():
     yield (nt.assert_true, len(scoms) > 10)
 
 
+@dec.skip_win32
+def test_executable_index():
+    from IPython.core.alias import ExecutableIndex
+    from IPython.utils.tempdir import TemporaryDirectory
+    isexec = lambda f: os.path.isfile(f) and os.access(f, os.X_OK)
+    with TemporaryDirectory() as tmpdir:
+        for name, mode in [('zzcmd', 0755), ('zzdata', 0644)]:
+            fname = os.path.join(tmpdir, name)
+            open(fname, 'w').close()
+            os.chmod(fname, mode)
+        db = {}
+        index = ExecutableIndex(db)
+        dirs = [tmpdir, os.path.join(tmpdir, 'nothere')]
+        nt.assert_equal(index.scan(dirs, isexec), [(tmpdir, ['zzcmd'])])
+        # Folders whose mtime didn't change are not listed again.
+        mtime = os.stat(tmpdir).st_mtime - 10
+        os.utime(tmpdir, (mtime, mtime))
+        index.scan(dirs, isexec)
+        os.chmod(os.path.join(tmpdir, 'zzdata'), 0755)
+        index = ExecutableIndex(db)
+        nt.assert_equal(index.scan(dirs, isexec), [(tmpdir, ['zzcmd'])])
+        index.clear()
+        nt.assert_equal(sorted(index.scan(dirs, isexec)[0][1]),
+                        ['zzcmd', 'zzdata'])
+
+
+def test_define_aliases():
+    am = get_ipython().alias_manager
+    valid = am.define_aliases([('zzalias', 'zzcmd'), ('print', 'x'),
+                               ('zzbad', 'a %s %l')])
+    nt.assert_equal(valid, [('zzalias', 'zzcmd')])
+    nt.assert_true('zzalias' in am)
+    nt.assert_false('zzbad' in am)
+    am.undefine_alias('zzalias')
+
+
 def test_magic_parse_options():
     """Test that we don't mangle paths when parsing magic options."""
     ip = get_ipython()
@@ -362,3 +398,15 @@ def test_xmode():
     for i in range(3):
         _ip.magic("xmode")
     nt.assert_equal(_ip.InteractiveTB.mode, xmode)
+
+
+def test_timeit_result():
+    ip = get_ipython()
+    ip.user_ns['zz_timeit'] = []
+    r = ip.magic('timeit -o -q -n10 -r4 zz_timeit.append(1)')
+    nt.assert_equal((r.loops, r.repeat), (10, 4))
+    nt.assert_equal(r.stmt, 'zz_timeit.append(1)')
+    # The statement runs in the user namespace.
+    nt.assert_equal(len(ip.user_ns['zz_timeit']), 40)
+    del ip.user_ns['zz_timeit']
+    nt.assert_equal(ip.magic('timeit -q -n1 pass'), None)
@@ -0,0 +1,95 @@
+"""Tests for the output cache.
+"""
+#-----------------------------------------------------------------------------
+#  Copyright (C) 2010  The IPython Development Team
+#
+#  Distributed under the terms of the BSD License.  The full license is in
+#  the file COPYING, distributed as part of this software.
+#-----------------------------------------------------------------------------
+
+#-----------------------------------------------------------------------------
+# Imports
+#-----------------------------------------------------------------------------
+
+import nose.tools as nt
+
+from IPython.core.outputcache import OutputCache
+from IPython.testing.globalipapp import get_ipython
+
+#-----------------------------------------------------------------------------
+# Test functions
+#-----------------------------------------------------------------------------
+
+def test_output_cache_lru():
+    evicted = []
+    cache = OutputCache(max_entries=3,
+                        on_evict=lambda n, r: evicted.append(n))
+    for i in range(1, 4):
+        cache[i] = i
+    cache[1]
+    cache[4] = 4
+    nt.assert_equal(sorted(cache), [1, 3, 4])
+    nt.assert_equal(evicted, [2])
+    nt.assert_raises(KeyError, lambda: cache[2])
+    st = cache.stats()
+    nt.assert_equal((st['hits'], st['misses'], st['evictions']), (1, 1, 1))
+    nt.assert_equal(cache.get(2), None)
+    nt.assert_equal(cache.stats()['misses'], 1)
+
+
+def test_output_cache_steady_state():
+    evicted = []
+    cache = OutputCache(max_entries=10,
+                        on_evict=lambda n, r: evicted.append(n))
+    for i in range(1, 1001):
+        cache[i] = i
+        # Keep using the first output, so it is never dropped.
+        cache[1]
+    nt.assert_equal(sorted(cache), [1] + range(992, 1001))
+    nt.assert_equal(evicted, range(2, 992))
+    # The record of uses doesn't grow with the number of lookups.
+    nt.assert_true(len(cache._order) <= 2*len(cache) + 101)
+
+
+def test_output_cache_peek():
+    cache = OutputCache(max_entries=3)
+    for i in range(1, 4):
+        cache[i] = i
+    # Listing the outputs doesn't count as using them.
+    nt.assert_equal([cache.peek(i) for i in range(1, 5)], [1, 2, 3, None])
+    nt.assert_equal(cache.stats()['hits'], 0)
+    cache[4] = 4
+    nt.assert_equal(sorted(cache), [2, 3, 4])
+
+
+def test_output_cache_bytes():
+    data = 'x' * 10000
+    cache = OutputCache(max_bytes=25000)
+    cache[1] = data + '1'
+    cache[2] = data + '2'
+    nt.assert_equal(len(cache), 2)
+    cache[3] = data + '3'
+    nt.assert_equal(sorted(cache), [2, 3])
+    nt.assert_true(cache.size <= cache.max_bytes)
+    # A single output larger than the budget is still kept.
+    cache[4] = data * 3
+    nt.assert_equal(sorted(cache), [4])
+    del cache[4]
+    nt.assert_equal(cache.size, 0)
+
+
+def test_shell_evicts_underscore_vars():
+    ip = get_ipython()
+    cache = ip.output_hist
+    max_entries = cache.max_entries
+    cache.max_entries = 3
+    try:
+        for i in range(4):
+            ip.run_cell('%i' % i)
+        n = ip.execution_count - 1
+        nt.assert_true(n in cache)
+        nt.assert_equal(ip.user_ns['_%i' % n], 3)
+        nt.assert_false((n-3) in cache)
+        nt.assert_false(('_%i' % (n-3)) in ip.user_ns)
+    finally:
+        cache.max_entries = max_entries
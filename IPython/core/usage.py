@@ -166,6 +166,10 @@ MAIN FEATURES
   Finally, a global dictionary named _oh exists with entries for all lines
   which generated output.
 
+  When the cache grows past cache_size outputs, or past cache_bytes bytes of
+  memory, the least recently used outputs are dropped from _oh along with
+  their _<n> variables.  %outcache shows how full the cache is.
+
 * Directory history:
 
   Your history of visited directories is kept in the global list _dh, and the
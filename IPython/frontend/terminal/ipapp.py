@@ -115,11 +115,17 @@ class IPAppConfigLoader(BaseAppConfigLoader):
             help=
             """Set the size of the output cache.  The default is 1000, you can
             change it permanently in your config file.  Setting it to 0 completely
-            disables the caching system, and the minimum value accepted is 20 (if
-            you provide a value less than 20, it is reset to 0 and a warning is
-            issued).  This limit is defined because otherwise you'll spend more
-            time re-flushing a too small cache than working""",
+            disables the caching system, and the minimum value accepted is 3 (if
+            you provide a value less than 3, it is reset to 0 and a warning is
+            issued).  Once the cache is full, the least recently used outputs
+            are dropped from it.""",
             metavar='InteractiveShell.cache_size')
+        paa('--cache-bytes',
+            type=int, dest='InteractiveShell.cache_bytes',
+            help=
+            """Set the approximate maximum memory use, in bytes, of the outputs
+            kept in the output cache.  The default is 268435456 (256MB).""",
+            metavar='InteractiveShell.cache_bytes')
         paa('--classic',
             action='store_true', dest='Global.classic',
             help="Gives IPython a similar feel to the classic Python prompt.")
@@ -58,6 +58,7 @@ from IPython.kernel import codeutil
 # Other things that the user will need
 from IPython.kernel.task import MapTask, StringTask
 from IPython.kernel.error import CompositeError
+from IPython.kernel.multiengineclient import ANY, ALL
 
 #-------------------------------------------------------------------------------
 # Code
@@ -104,6 +105,8 @@ __all__ = [
     'MultiEngineClient',
     'TaskClient',
     'CompositeError',
+    'ANY',
+    'ALL',
     'get_task_client',
     'get_multiengine_client',
     'Cluster'
@@ -0,0 +1,296 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""Benchmarks of a running IPython cluster, with results as JSON.
+
+This times, through the blocking clients, the things that matter most for
+the performance of the parallel stack:
+
+* the latency of commands sent to one and to all engines (percentiles),
+* the throughput of push and pull over a sweep of sizes,
+* the throughput of scatter and gather,
+* the number of tasks per second `TaskClient.map` runs, for tasks of a few
+  durations and chunk sizes,
+* and, for each of these, the CPU time the controller used, if it runs on
+  this host.
+
+Results are returned as a dict, or written as JSON by the command line
+interface, so that runs on different releases can be compared::
+
+    python -m IPython.kernel.clusterbench --profile default -o bench.json
+    python -m IPython.kernel.clusterbench -n 4 --quick
+
+With ``-n``, a local cluster of that many engines is started for the run and
+stopped afterwards.
+"""
+
+#-----------------------------------------------------------------------------
+#  Copyright (C) 2010  The IPython Development Team
+#
+#  Distributed under the terms of the BSD License.  The full license is in
+#  the file COPYING, distributed as part of this software.
+#-----------------------------------------------------------------------------
+
+#-----------------------------------------------------------------------------
+# Imports
+#-----------------------------------------------------------------------------
+
+import json
+import os
+import sys
+import time
+from timeit import default_timer as clock
+
+from IPython.external.argparse import ArgumentParser
+from IPython.utils.timing import percentile
+
+#-----------------------------------------------------------------------------
+# Helpers
+#-----------------------------------------------------------------------------
+
+def rate(amount, t):
+    """Return amount per second, or None if the time is too short to tell."""
+    if t > 0:
+        return amount/t
+    return None
+
+
+def summarize(times):
+    """Summarize a list of times in seconds, as a dict of times in msec."""
+    ms = [1000.0*t for t in times]
+    return dict(n=len(ms), mean=sum(ms)/len(ms), min=min(ms), max=max(ms),
+                p50=percentile(ms, 50), p90=percentile(ms, 90),
+                p99=percentile(ms, 99))
+
+
+def process_cpu_time(pid):
+    """Return the user and system CPU seconds used by a process so far.
+
+    This reads ``/proc``, so it only works on Linux, for processes on this
+    host.  None is returned when the time can't be read.
+    """
+    try:
+        stat = open('/proc/%d/stat' % pid).read()
+    except (IOError, OSError):
+        return None
+    # The command name, in parentheses, can have spaces in it.
+    fields = stat[stat.rindex(')')+2:].split()
+    ticks = float(os.sysconf('SC_CLK_TCK'))
+    return (int(fields[11]) + int(fields[12]))/ticks
+
+
+def controller_pid(cluster_dir):
+    """Return the pid of the controller of a cluster dir, or None."""
+    pid_file = os.path.join(cluster_dir, 'pid', 'ipcontroller.pid')
+    try:
+        return int(open(pid_file).read().strip())
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def make_data(nbytes):
+    """Return nbytes of data that doesn't compress, as an array if possible."""
+    try:
+        import numpy
+    except ImportError:
+        return os.urandom(nbytes)
+    else:
+        return numpy.random.random(max(nbytes//8, 1))
+
+
+def run_task(duration):
+    """The task of the map benchmarks: busy the engine for duration seconds."""
+    if duration:
+        time.sleep(duration)
+    return duration
+
+#-----------------------------------------------------------------------------
+# Benchmarks
+#-----------------------------------------------------------------------------
+
+class ClusterBenchmark(object):
+    """Time the basic operations of a cluster through its clients.
+
+    Each ``time_*`` method runs one benchmark and returns its results, and
+    `run` runs all of them.  ``quick`` cuts the sizes and counts down, for a
+    run of a few seconds.
+    """
+
+    # Sizes in bytes of the push/pull sweep and of scatter/gather.
+    sizes = [1024, 10*1024, 100*1024, 1024*1024, 10*1024*1024]
+    scatter_sizes = [100*1024, 1024*1024, 10*1024*1024]
+    # (task duration in seconds, chunksize) of the map benchmarks.
+    map_granularities = [(0, 1), (0, 10), (0.001, 1), (0.01, 1)]
+    latency_count = 200
+    repeat = 5
+    map_tasks = 400
+
+    def __init__(self, mec, tc=None, controller_pid=None, quick=False):
+        self.mec = mec
+        self.tc = tc
+        self.controller_pid = controller_pid
+        if quick:
+            self.sizes = self.sizes[:4]
+            self.scatter_sizes = self.scatter_sizes[:2]
+            self.latency_count = 50
+            self.repeat = 3
+            self.map_tasks = 100
+
+    def _timed(self, func, *args, **kwargs):
+        t0 = clock()
+        func(*args, **kwargs)
+        return clock() - t0
+
+    def _with_cpu(self, func):
+        """Run func, adding the CPU the controller used to its results."""
+        cpu0 = wall0 = None
+        if self.controller_pid is not None:
+            cpu0 = process_cpu_time(self.controller_pid)
+            wall0 = clock()
+        result = func()
+        if cpu0 is not None:
+            cpu = process_cpu_time(self.controller_pid) - cpu0
+            wall = clock() - wall0
+            result['controller_cpu'] = dict(seconds=cpu,
+                                            percent=rate(100.0*cpu, wall))
+        return result
+
+    def time_latency(self):
+        """Return the latency of 'pass' on one and on all engines."""
+        results = {}
+        for name, targets in [('single_engine', self.mec.get_ids()[0]),
+                              ('all_engines', 'all')]:
+            times = [self._timed(self.mec.execute, 'pass', targets=targets)
+                     for i in range(self.latency_count)]
+            results[name] = summarize(times)
+        return results
+
+    def _throughput(self, nbytes, func, *args, **kwargs):
+        times = [self._timed(func, *args, **kwargs)
+                 for i in range(self.repeat)]
+        mb = nbytes/(1024.0*1024.0)
+        return dict(bytes=nbytes, best_mb_sec=rate(mb, min(times)),
+                    median_mb_sec=rate(mb, percentile(times, 50)))
+
+    def time_push_pull(self):
+        """Return the throughput of push and pull over the size sweep."""
+        ids = self.mec.get_ids()
+        results = dict(push_single=[], push_all=[], pull_single=[])
+        for nbytes in self.sizes:
+            ns = dict(_bench_data=make_data(nbytes))
+            results['push_single'].append(
+                self._throughput(nbytes, self.mec.push, ns, targets=ids[0]))
+            results['push_all'].append(
+                self._throughput(nbytes*len(ids), self.mec.push, ns))
+            results['pull_single'].append(
+                self._throughput(nbytes, self.mec.pull, '_bench_data',
+                                 targets=ids[0]))
+        self.mec.execute('del _bench_data')
+        return results
+
+    def time_scatter_gather(self):
+        """Return the throughput of scatter and gather of an array."""
+        results = dict(scatter=[], gather=[])
+        for nbytes in self.scatter_sizes:
+            data = make_data(nbytes)
+            results['scatter'].append(
+                self._throughput(nbytes, self.mec.scatter, '_bench_data',
+                                 data))
+            results['gather'].append(
+                self._throughput(nbytes, self.mec.gather, '_bench_data'))
+        self.mec.execute('del _bench_data')
+        return results
+
+    def time_map(self):
+        """Return the tasks per second of TaskClient.map."""
+        results = []
+        nengines = len(self.mec.get_ids())
+        for duration, chunksize in self.map_granularities:
+            ntasks = self.map_tasks
+            if duration:
+                # Keep each run to about a second of engine time.
+                ntasks = min(ntasks, max(nengines, int(nengines/duration)))
+            mapper = self.tc.mapper(chunksize=chunksize)
+            t = self._timed(mapper.map, run_task, [duration]*ntasks)
+            self.tc.clear()
+            entry = dict(duration=duration, chunksize=chunksize,
+                         tasks=ntasks, tasks_sec=rate(ntasks, t))
+            if duration:
+                # The fraction of the ideal rate of nengines/duration.
+                entry['efficiency'] = rate(ntasks*duration, t*nengines)
+            results.append(entry)
+        return dict(runs=results)
+
+    def metadata(self):
+        """Return what is needed to compare runs: versions and settings."""
+        from IPython.core import release
+        from IPython.kernel import pbconfig
+        meta = dict(ipython=release.version, python=sys.version.split()[0],
+                    platform=sys.platform, engines=len(self.mec.get_ids()),
+                    time=time.strftime('%Y-%m-%dT%H:%M:%S'),
+                    compression=pbconfig.COMPRESSION)
+        try:
+            import numpy
+        except ImportError:
+            meta['numpy'] = None
+        else:
+            meta['numpy'] = numpy.__version__
+        return meta
+
+    def run(self):
+        """Run all the benchmarks, returning their results in a dict."""
+        results = dict(meta=self.metadata())
+        benchmarks = [('latency', self.time_latency),
+                      ('push_pull', self.time_push_pull),
+                      ('scatter_gather', self.time_scatter_gather)]
+        if self.tc is not None:
+            benchmarks.append(('map', self.time_map))
+        for name, func in benchmarks:
+            results[name] = self._with_cpu(func)
+        return results
+
+#-----------------------------------------------------------------------------
+# Command line interface
+#-----------------------------------------------------------------------------
+
+def main(argv=None):
+    parser = ArgumentParser(description='Benchmark an IPython cluster and '
+                            'print the results as JSON.')
+    parser.add_argument('--profile', default='default',
+                        help='the profile of the cluster (default: default)')
+    parser.add_argument('--cluster-dir', dest='cluster_dir', default=None,
+                        help='the cluster directory, instead of a profile')
+    parser.add_argument('-n', dest='n', type=int, default=0,
+                        help='start a local cluster of this many engines '
+                        'for the run, instead of using a running one')
+    parser.add_argument('-o', dest='output', default=None,
+                        help='write the results to this file')
+    parser.add_argument('--quick', action='store_true', default=False,
+                        help='run fewer and smaller benchmarks')
+    parser.add_argument('--no-tasks', dest='tasks', action='store_false',
+                        default=True, help='skip the task benchmarks')
+    args = parser.parse_args(argv)
+
+    from IPython.kernel.clientconnector import Cluster
+    cluster = Cluster(args.profile, args.cluster_dir, auto_create=bool(args.n),
+                      auto_stop=False)
+    if args.n:
+        cluster.start(args.n)
+    try:
+        mec = cluster.get_multiengine_client()
+        tc = None
+        if args.tasks:
+            tc = cluster.get_task_client()
+        pid = controller_pid(cluster.cluster_dir_obj.location)
+        results = ClusterBenchmark(mec, tc, pid, args.quick).run()
+    finally:
+        if args.n:
+            cluster.stop()
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output is None:
+        print output
+    else:
+        open(args.output, 'w').write(output + '\n')
+
+
+if __name__ == '__main__':
+    main()
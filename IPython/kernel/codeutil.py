@@ -29,11 +29,12 @@ def code_ctor(*args):
     return new.code(*args)
     
 def reduce_code(co):
-    if co.co_freevars or co.co_cellvars:
-        raise ValueError("Sorry, cannot pickle code objects with closures")
+    # The code of closures is pickled with the names of its free and cell
+    # variables, but the cells themselves have to be sent on their own (see
+    # pickleutil.CannedFunction).
     return code_ctor, (co.co_argcount, co.co_nlocals, co.co_stacksize,
         co.co_flags, co.co_code, co.co_consts, co.co_names,
         co.co_varnames, co.co_filename, co.co_name, co.co_firstlineno,
-        co.co_lnotab)
+        co.co_lnotab, co.co_freevars, co.co_cellvars)
 
 copy_reg.pickle(types.CodeType, reduce_code)
\ No newline at end of file
@@ -20,7 +20,7 @@ __docformat__ = "restructuredtext en"
 #-------------------------------------------------------------------------------
 
 # Standard library imports.
-from types import FunctionType
+from types import CodeType, FunctionType, ModuleType
 
 import __builtin__
 import codeop
@@ -435,12 +435,23 @@ class Interpreter(object):
         self.user_ns.update(ns)
 
     def push_function(self, ns):
-        # First set the func_globals for all functions to self.user_ns
+        # First set the func_globals for all functions to self.user_ns, and
+        # bring along the modules they use that aren't there.
         new_kwds = {}
         for k, v in ns.iteritems():
             if not isinstance(v, FunctionType):
                 raise TypeError("function object expected")
-            new_kwds[k] = FunctionType(v.func_code, self.user_ns)
+            codes = [v.func_code]
+            while codes:
+                code = codes.pop()
+                for name in code.co_names:
+                    value = v.func_globals.get(name)
+                    if isinstance(value, ModuleType):
+                        self.user_ns.setdefault(name, value)
+                codes.extend([c for c in code.co_consts
+                              if isinstance(c, CodeType)])
+            new_kwds[k] = FunctionType(v.func_code, self.user_ns, v.func_name,
+                                       v.func_defaults, v.func_closure)
         self.user_ns.update(new_kwds)        
 
     def pack_exception(self,message,exc):
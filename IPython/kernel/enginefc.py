@@ -19,8 +19,6 @@ __docformat__ = "restructuredtext en"
 # Imports
 #-------------------------------------------------------------------------------
 
-import cPickle as pickle
-
 from twisted.python import components, log, failure
 from twisted.internet import defer, threads
 from zope.interface import Interface, implements
@@ -34,20 +32,24 @@ except ImportError:
     from foolscap import Referenceable, DeadReferenceError
 from foolscap.referenceable import RemoteReference
 
-from IPython.kernel.pbutil import packageFailure, unpackageFailure
+from IPython.kernel import error
+from IPython.kernel.pbutil import (dumps, loads, packageFailure,
+    unpackageFailure)
 from IPython.kernel.controllerservice import IControllerBase
 from IPython.kernel.engineservice import (
     IEngineBase,
     IEngineQueued,
     StrictDict
 )
+from IPython.kernel.newserialized import SerializedNamespace
 from IPython.kernel.pickleutil import (
     can,
     canDict,
     canSequence,
     uncan,
     uncanDict,
-    uncanSequence
+    uncanSequence,
+    strip_code
 )
 
 
@@ -97,7 +99,7 @@ class FCEngineReferenceFromService(Referenceable, object):
     def _checkProperties(self, result):
         dosync = self.service.properties.modified
         self.service.properties.modified = False
-        return (dosync and pickle.dumps(self.service.properties, 2)), result
+        return (dosync and dumps(self.service.properties)), result
     
     def remote_execute(self, lines):
         d = self.service.execute(lines)
@@ -113,7 +115,7 @@ class FCEngineReferenceFromService(Referenceable, object):
         
     def remote_push(self, pNamespace):
         try:
-            namespace = pickle.loads(pNamespace)
+            namespace = loads(pNamespace)
         except:
             return defer.fail(failure.Failure()).addErrback(packageFailure)
         else:
@@ -125,7 +127,7 @@ class FCEngineReferenceFromService(Referenceable, object):
     
     def remote_pull(self, keys):
         d = self.service.pull(keys)
-        d.addCallback(pickle.dumps, 2)
+        d.addCallback(dumps)
         d.addErrback(packageFailure)
         return d
     
@@ -135,15 +137,13 @@ class FCEngineReferenceFromService(Referenceable, object):
     
     def remote_push_function(self, pNamespace):
         try:
-            namespace = pickle.loads(pNamespace)
+            namespace = loads(pNamespace)
+            # The functions are rebound to the user namespace by the engine,
+            # which brings along the modules imported here.
+            namespace = uncanDict(namespace, import_modules=True)
         except:
             return defer.fail(failure.Failure()).addErrback(packageFailure)
         else:
-            # The usage of globals() here is an attempt to bind any pickled functions
-            # to the globals of this module.  What we really want is to have it bound
-            # to the globals of the callers module.  This will require walking the 
-            # stack.  BG 10/3/07.
-            namespace = uncanDict(namespace, globals())
             return self.service.push_function(namespace).addErrback(packageFailure)
     
     def remote_pull_function(self, keys):
@@ -152,7 +152,7 @@ class FCEngineReferenceFromService(Referenceable, object):
             d.addCallback(canSequence)
         elif len(keys)==1:
             d.addCallback(can)
-        d.addCallback(pickle.dumps, 2)
+        d.addCallback(dumps)
         d.addErrback(packageFailure)
         return d
 
@@ -178,7 +178,7 @@ class FCEngineReferenceFromService(Referenceable, object):
     
     def remote_push_serialized(self, pNamespace):
         try:
-            namespace = pickle.loads(pNamespace)
+            namespace = loads(pNamespace)
         except:
             return defer.fail(failure.Failure()).addErrback(packageFailure)
         else:
@@ -187,7 +187,7 @@ class FCEngineReferenceFromService(Referenceable, object):
     
     def remote_pull_serialized(self, keys):
         d = self.service.pull_serialized(keys)
-        d.addCallback(pickle.dumps, 2)
+        d.addCallback(dumps)
         d.addErrback(packageFailure)
         return d
     
@@ -197,7 +197,7 @@ class FCEngineReferenceFromService(Referenceable, object):
     
     def remote_set_properties(self, pNamespace):
         try:
-            namespace = pickle.loads(pNamespace)
+            namespace = loads(pNamespace)
         except:
             return defer.fail(failure.Failure()).addErrback(packageFailure)
         else:
@@ -205,13 +205,13 @@ class FCEngineReferenceFromService(Referenceable, object):
     
     def remote_get_properties(self, keys=None):
         d = self.service.get_properties(keys)
-        d.addCallback(pickle.dumps, 2)
+        d.addCallback(dumps)
         d.addErrback(packageFailure)
         return d
     
     def remote_has_properties(self, keys):
         d = self.service.has_properties(keys)
-        d.addCallback(pickle.dumps, 2)
+        d.addCallback(dumps)
         d.addErrback(packageFailure)
         return d
     
@@ -253,6 +253,8 @@ class EngineFromReference(object):
         self._id = None
         self._properties = StrictDict()
         self.currentCommand = None
+        # The hashes of the function code the engine has received
+        self._known_code = set()
     
     def callRemote(self, *args, **kwargs):
         try:
@@ -286,7 +288,7 @@ class EngineFromReference(object):
                     self.properties = pick
                     return pick
                 else:
-                    self.properties = pickle.loads(pick)
+                    self.properties = loads(pick)
             return result
     
     def _set_properties(self, dikt):
@@ -319,8 +321,17 @@ class EngineFromReference(object):
     #---------------------------------------------------------------------------
     
     def push(self, namespace):
+        if isinstance(namespace, SerializedNamespace):
+            # The namespace is being pushed to several engines, all of them
+            # get the same package.
+            try:
+                package = namespace.package()
+            except:
+                return defer.fail(failure.Failure())
+            d = self.callRemote('push_serialized', package)
+            return d.addCallback(self.checkReturnForFailure)
         try:
-            package = pickle.dumps(namespace, 2)
+            package = dumps(namespace)
         except:
             return defer.fail(failure.Failure())
         else:
@@ -337,7 +348,7 @@ class EngineFromReference(object):
     def pull(self, keys):
         d = self.callRemote('pull', keys)
         d.addCallback(self.checkReturnForFailure)
-        d.addCallback(pickle.loads)
+        d.addCallback(loads)
         return d
     
     #---------------------------------------------------------------------------
@@ -345,8 +356,15 @@ class EngineFromReference(object):
     #---------------------------------------------------------------------------
     
     def push_function(self, namespace):
+        return self._push_function(namespace, True)
+    
+    def _push_function(self, namespace, retry):
+        # Only the hash of code the engine has already received is sent.  If
+        # the engine has dropped it since, everything is sent again, once.
         try:
-            package = pickle.dumps(canDict(namespace), 2)
+            namespace = canDict(namespace)
+            hashes = strip_code(namespace.values(), self._known_code)
+            package = dumps(namespace)
         except:
             return defer.fail(failure.Failure())
         else:
@@ -354,12 +372,25 @@ class EngineFromReference(object):
                 return defer.fail(package)
             else:
                 d = self.callRemote('push_function', package)
-                return d.addCallback(self.checkReturnForFailure)    
+                d.addCallback(self.checkReturnForFailure)
+                d.addCallback(self._codeReceived, hashes)
+                if retry:
+                    d.addErrback(self._codeMissing, namespace)
+                return d
+    
+    def _codeReceived(self, result, hashes):
+        self._known_code.update(hashes)
+        return result
+    
+    def _codeMissing(self, reason, namespace):
+        reason.trap(error.MissingFunctionCode)
+        self._known_code.clear()
+        return self._push_function(namespace, False)
     
     def pull_function(self, keys):
         d = self.callRemote('pull_function', keys)
         d.addCallback(self.checkReturnForFailure)
-        d.addCallback(pickle.loads)
+        d.addCallback(loads)
         # The usage of globals() here is an attempt to bind any pickled functions
         # to the globals of this module.  What we really want is to have it bound
         # to the globals of the callers module.  This will require walking the 
@@ -404,7 +435,7 @@ class EngineFromReference(object):
     
     def set_properties(self, properties):
         try:
-            package = pickle.dumps(properties, 2)
+            package = dumps(properties)
         except:
             return defer.fail(failure.Failure())
         else:
@@ -418,13 +449,13 @@ class EngineFromReference(object):
     def get_properties(self, keys=None):
         d = self.callRemote('get_properties', keys)
         d.addCallback(self.checkReturnForFailure)
-        d.addCallback(pickle.loads)
+        d.addCallback(loads)
         return d
     
     def has_properties(self, keys):
         d = self.callRemote('has_properties', keys)
         d.addCallback(self.checkReturnForFailure)
-        d.addCallback(pickle.loads)
+        d.addCallback(loads)
         return d
     
     def del_properties(self, keys):
@@ -445,7 +476,7 @@ class EngineFromReference(object):
     def push_serialized(self, namespace):
         """Older version of pushSerialize."""
         try:
-            package = pickle.dumps(namespace, 2)
+            package = dumps(namespace)
         except:
             return defer.fail(failure.Failure())
         else:
@@ -458,7 +489,7 @@ class EngineFromReference(object):
     def pull_serialized(self, keys):
         d = self.callRemote('pull_serialized', keys)
         d.addCallback(self.checkReturnForFailure)
-        d.addCallback(pickle.loads)
+        d.addCallback(loads)
         return d
     
     #---------------------------------------------------------------------------
@@ -520,7 +551,7 @@ class FCRemoteEngineRefFromService(Referenceable):
         # First adapt the engine_reference to a basic non-queued engine
         engine = IEngineBase(engine_reference)
         if pproperties:
-            engine.properties = pickle.loads(pproperties)
+            engine.properties = loads(pproperties)
         # Make it an IQueuedEngine before registration
         remote_engine = IEngineQueued(engine)
         # Get the ip/port of the remote side
@@ -255,6 +255,9 @@ class StrictDict(dict):
     def __init__(self, *args, **kwargs):
         dict.__init__(self, *args, **kwargs)
         self.modified = True
+        # Bumped on every change, so that others can cache what they compute
+        # from the properties (see `task.IndexedScheduler`).
+        self.version = 0
     
     def __getitem__(self, key):
         return copy.deepcopy(dict.__getitem__(self, key))
@@ -270,10 +273,12 @@ class StrictDict(dict):
             raise error.InvalidProperty("can't be a value: %r" % value)
         dict.__setitem__(self, key, newvalue)
         self.modified = True
+        self.version += 1
     
     def __delitem__(self, key):
         dict.__delitem__(self, key)
         self.modified = True
+        self.version += 1
     
     def update(self, dikt):
         for k,v in dikt.iteritems():
@@ -281,14 +286,17 @@ class StrictDict(dict):
     
     def pop(self, key):
         self.modified = True
+        self.version += 1
         return dict.pop(self, key)
     
     def popitem(self):
         self.modified = True
+        self.version += 1
         return dict.popitem(self)
     
     def clear(self):
         self.modified = True
+        self.version += 1
         dict.clear(self)
     
     def subDict(self, *keys):
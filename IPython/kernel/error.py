@@ -73,10 +73,19 @@ class InvalidDeferredID(KernelError):
     pass
 
 
+class ResultDiscarded(InvalidDeferredID):
+    pass
+
+
 class SerializationError(KernelError):
     pass
 
 
+class MissingFunctionCode(SerializationError):
+    """The code of a canned function was sent by hash, but isn't cached."""
+    pass
+
+
 class MessageSizeError(KernelError):
     pass
 
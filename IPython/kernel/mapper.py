@@ -15,9 +15,11 @@ __docformat__ = "restructuredtext en"
 # Imports
 #----------------------------------------------------------------------------
 
+import math
+import time
 from types import FunctionType
 from zope.interface import Interface, implements
-from IPython.kernel.task import MapTask
+from IPython.kernel.task import MapTask, ChunkedMapTask
 from IPython.kernel.twistedutil import gatherBoth
 from IPython.kernel.error import collect_exceptions
 
@@ -67,14 +69,15 @@ class ITaskMapperFactory(Interface):
     """
     
     def mapper(clear_before=False, clear_after=False, retries=0, 
-                recovery_task=None, depend=None, block=True):
+                recovery_task=None, depend=None, block=True, chunksize=1):
         """
         Create an `IMapper` implementer with a given set of arguments.
         
         The `IMapper` created using a task controller is load balanced.
         
         See the documentation for `IPython.kernel.task.BaseTask` for 
-        documentation on the arguments to this method.
+        documentation on the arguments to this method, and the one of
+        `TaskMapper` for `chunksize`.
         """
 
 
@@ -122,15 +125,66 @@ class MultiEngineMapper(object):
         return self.multiengine.raw_map(func, sequences, dist=self.dist,
             targets=self.targets, block=self.block)
 
+def _task_args(sequences):
+    """Check that sequences have equal lengths and zip them."""
+    max_len = max(len(s) for s in sequences)
+    for s in sequences:
+        if len(s)!=max_len:
+            raise ValueError('all sequences must have equal length')
+    return zip(*sequences)
+
+
+def _chunks(task_args, chunksize):
+    """Split task_args in lists of chunksize items."""
+    return [task_args[i:i+chunksize]
+            for i in range(0, len(task_args), chunksize)]
+
+
+def _flatten(chunk_results):
+    """Join the lists of values of `ChunkedMapTask` results."""
+    results = []
+    for values, compute_time in chunk_results:
+        results.extend(values)
+    return results
+
+
+def auto_chunksize(nitems, latency, compute_time, nprobe, overhead=0.1,
+                   min_chunks=16):
+    """Pick a chunksize for mapping over nitems items.
+
+    A first chunk of nprobe items took latency seconds from submission to
+    result, compute_time of which were spent in the function.  The rest is
+    taken to be the fixed cost of running a task, and chunks are made large
+    enough for it to be at most a fraction overhead of their compute time.
+    There are always at least min_chunks chunks though, when there are that
+    many items, so that the work still gets spread over the engines.
+    """
+    max_size = int(math.ceil(float(nitems) / min_chunks)) or 1
+    per_item = compute_time / max(nprobe, 1)
+    task_cost = max(latency - compute_time, 0.0)
+    if per_item <= 0:
+        return max_size
+    size = int(math.ceil(task_cost / (overhead * per_item)))
+    return max(1, min(size, max_size))
+
+
 class TaskMapper(object):
     """
     Make an `ITaskController` look like an `IMapper`.
     
     This class provides a load balanced version of `map`.
+
+    By default, each call of the function is run as its own `MapTask`.  For
+    functions that are cheap compared to running a task, give a `chunksize`
+    to run that many calls in each task (a `ChunkedMapTask`), or 'auto' to
+    time a first task of one call and pick the chunksize from that (see
+    `auto_chunksize`).  When `block` is False and chunks are used, `map`
+    returns the ids of the chunk tasks, whose results are the
+    ``(values, compute_time)`` tuples of `ChunkedMapTask`.
     """
     
     def __init__(self, task_controller, clear_before=False, clear_after=False, retries=0, 
-            recovery_task=None, depend=None, block=True):
+            recovery_task=None, depend=None, block=True, chunksize=1):
         """
         Create a `IMapper` given a `TaskController` and arguments.
         
@@ -141,6 +195,8 @@ class TaskMapper(object):
         :Parameters:
             task_controller : an `IBlockingTaskClient` implementer
                 The `TaskController` to use for calls to `map`
+            chunksize : int or 'auto'
+                The number of calls to run in each task
         """
         self.task_controller = task_controller
         self.clear_before = clear_before
@@ -149,32 +205,65 @@ class TaskMapper(object):
         self.recovery_task = recovery_task
         self.depend = depend
         self.block = block
+        self.chunksize = chunksize
     
+    def _make_task(self, func, task_args, chunked):
+        if chunked:
+            task_class = ChunkedMapTask
+        else:
+            task_class = MapTask
+        return task_class(func, task_args, clear_before=self.clear_before,
+            clear_after=self.clear_after, retries=self.retries,
+            recovery_task=self.recovery_task, depend=self.depend)
+
     def map(self, func, *sequences):
         """
         Apply func to *sequences elementwise.  Like Python's builtin map.
         
         This version is load balanced.
         """
-        max_len = max(len(s) for s in sequences)
-        for s in sequences:
-            if len(s)!=max_len:
-                raise ValueError('all sequences must have equal length')
-        task_args = zip(*sequences)
-        task_ids = []
-        dlist = []
-        for ta in task_args:
-            task = MapTask(func, ta, clear_before=self.clear_before,
-                clear_after=self.clear_after, retries=self.retries,
-                recovery_task=self.recovery_task, depend=self.depend)
-            dlist.append(self.task_controller.run(task))
+        task_args = _task_args(sequences)
+        if self.chunksize == 1:
+            return self._run(func, task_args)
+        if self.chunksize != 'auto':
+            return self._run(func, _chunks(task_args, self.chunksize), [])
+        if len(task_args) < 2:
+            return self._run(func, _chunks(task_args, 1), [])
+        d = self._probe(func, task_args[:1], len(task_args)-1)
+        d.addCallback(lambda (taskid, chunksize):
+            self._run(func, _chunks(task_args[1:], chunksize), [taskid]))
+        return d
+
+    def _probe(self, func, task_args, nleft):
+        """Run a first chunk, returning a `Deferred` to its taskid and to
+        the chunksize to use for the nleft remaining items."""
+        start = time.time()
+        d = self.task_controller.run(self._make_task(func, task_args, True))
+        def get_result(taskid):
+            d = self.task_controller.get_task_result(taskid, block=True)
+            d.addCallback(lambda r: (taskid, auto_chunksize(nleft,
+                time.time()-start, r[1], len(task_args))))
+            return d
+        d.addCallback(get_result)
+        return d
+
+    def _run(self, func, task_args, chunk_ids=None):
+        """Run a task for each item of task_args, or for each chunk of them
+        if chunk_ids (the ids of the chunk tasks already run) is given."""
+        chunked = chunk_ids is not None
+        dlist = [self.task_controller.run(self._make_task(func, ta, chunked))
+                 for ta in task_args]
         dlist = gatherBoth(dlist, consumeErrors=1)
         dlist.addCallback(collect_exceptions,'map')
+        if chunked:
+            dlist.addCallback(lambda task_ids: chunk_ids + task_ids)
         if self.block:
             def get_results(task_ids):
                 d = self.task_controller.barrier(task_ids)
                 d.addCallback(lambda _: gatherBoth([self.task_controller.get_task_result(tid) for tid in task_ids], consumeErrors=1))
                 d.addCallback(collect_exceptions, 'map')
+                if chunked:
+                    d.addCallback(_flatten)
                 return d
             dlist.addCallback(get_results)
         return dlist
@@ -183,11 +272,13 @@ class SynchronousTaskMapper(object):
     """
     Make an `IBlockingTaskClient` look like an `IMapper`.
     
-    This class provides a load balanced version of `map`.
+    This class provides a load balanced version of `map`, and `imap` to get
+    the results as they are computed.  See `TaskMapper` for `chunksize`.
     """
     
     def __init__(self, task_controller, clear_before=False, clear_after=False, retries=0, 
-            recovery_task=None, depend=None, block=True):
+            recovery_task=None, depend=None, block=True, chunksize=1,
+            ordered=True):
         """
         Create a `IMapper` given a `IBlockingTaskClient` and arguments.
         
@@ -198,6 +289,10 @@ class SynchronousTaskMapper(object):
         :Parameters:
             task_controller : an `IBlockingTaskClient` implementer
                 The `TaskController` to use for calls to `map`
+            chunksize : int or 'auto'
+                The number of calls to run in each task
+            ordered : boolean
+                Whether `imap` returns results in order, or as they come
         """
         self.task_controller = task_controller
         self.clear_before = clear_before
@@ -206,27 +301,89 @@ class SynchronousTaskMapper(object):
         self.recovery_task = recovery_task
         self.depend = depend
         self.block = block
+        self.chunksize = chunksize
+        self.ordered = ordered
     
+    def _make_task(self, func, task_args, chunked):
+        if chunked:
+            task_class = ChunkedMapTask
+        else:
+            task_class = MapTask
+        return task_class(func, task_args, clear_before=self.clear_before,
+            clear_after=self.clear_after, retries=self.retries,
+            recovery_task=self.recovery_task, depend=self.depend)
+
+    def _run_chunks(self, func, task_args):
+        """Run task_args in chunks, returning the ids of the tasks."""
+        chunksize = self.chunksize
+        task_ids = []
+        if chunksize == 'auto':
+            chunksize = 1
+            if len(task_args) > 1:
+                start = time.time()
+                task_ids.append(self.task_controller.run(
+                    self._make_task(func, task_args[:1], True)))
+                r = self.task_controller.get_task_result(task_ids[0],
+                                                         block=True)
+                chunksize = auto_chunksize(len(task_args)-1,
+                    time.time()-start, r[1], 1)
+                task_args = task_args[1:]
+        for ta in _chunks(task_args, chunksize):
+            task_ids.append(self.task_controller.run(
+                self._make_task(func, ta, True)))
+        return task_ids
+
     def map(self, func, *sequences):
         """
         Apply func to *sequences elementwise.  Like Python's builtin map.
         
         This version is load balanced.
         """
-        max_len = max(len(s) for s in sequences)
-        for s in sequences:
-            if len(s)!=max_len:
-                raise ValueError('all sequences must have equal length')
-        task_args = zip(*sequences)
-        task_ids = []
-        for ta in task_args:
-            task = MapTask(func, ta, clear_before=self.clear_before,
-                clear_after=self.clear_after, retries=self.retries,
-                recovery_task=self.recovery_task, depend=self.depend)
-            task_ids.append(self.task_controller.run(task))
+        task_args = _task_args(sequences)
+        if self.chunksize == 1:
+            task_ids = [self.task_controller.run(
+                self._make_task(func, ta, False)) for ta in task_args]
+        else:
+            task_ids = self._run_chunks(func, task_args)
         if self.block:
             self.task_controller.barrier(task_ids)
             task_results = [self.task_controller.get_task_result(tid) for tid in task_ids]
+            if self.chunksize != 1:
+                task_results = _flatten(task_results)
             return task_results
         else:
-            return task_ids
\ No newline at end of file
+            return task_ids
+
+    def imap(self, func, *sequences):
+        """
+        Like `map`, but return an iterator over the results.
+
+        All the tasks are submitted right away, and results can be used as
+        soon as they arrive, in order if `ordered` is True, or else in the
+        order they are computed.  Calls are always run in `ChunkedMapTask`
+        tasks, of one call each if `chunksize` is 1.
+        """
+        task_ids = self._run_chunks(func, _task_args(sequences))
+        if self.ordered:
+            return self._iter_ordered(task_ids)
+        return self._iter_unordered(task_ids)
+
+    def _iter_ordered(self, task_ids):
+        for tid in task_ids:
+            values, compute_time = self.task_controller.get_task_result(
+                tid, block=True)
+            for v in values:
+                yield v
+
+    def _iter_unordered(self, task_ids):
+        pending = list(task_ids)
+        while pending:
+            # The controller answers as soon as some tasks have completed.
+            done = set(self.task_controller.get_completed_ids(pending, None))
+            for tid in pending:
+                if tid in done:
+                    values, compute_time = self.task_controller.get_task_result(
+                        tid, block=True)
+                    for v in values:
+                        yield v
+            pending = [tid for tid in pending if tid not in done]
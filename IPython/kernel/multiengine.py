@@ -33,6 +33,7 @@ from zope.interface import Interface, implements
 
 from IPython.kernel.twistedutil import gatherBoth
 from IPython.kernel import error
+from IPython.kernel.newserialized import SerializedNamespace
 from IPython.kernel.pendingdeferred import PendingDeferredManager, two_phase
 from IPython.kernel.controllerservice import (
     ControllerAdapterBase,
@@ -332,6 +333,9 @@ class MultiEngine(ControllerAdapterBase):
         return self._performOnEnginesAndGatherBoth('execute', lines, targets=targets)
     
     def push(self, ns, targets='all'):
+        # Remote engines all get the namespace pickled once, see
+        # EngineFromReference.push.
+        ns = SerializedNamespace(ns)
         return self._performOnEnginesAndGatherBoth('push', ns, targets=targets)
         
     def pull(self, keys, targets='all'):
@@ -519,6 +523,13 @@ class ISynchronousMultiEngine(ISynchronousEngineMultiplexer):
     def get_pending_deferred(deferredID, block=True):
         """"""
     
+    def get_completed_ids(deferredIDs, timeout=0):
+        """Return the deferredIDs whose result is ready, or that are unknown.
+        
+        If there are none, wait until there are for up to timeout seconds,
+        or forever if timeout is None.
+        """
+    
     def clear_pending_deferreds():
         """"""
 
@@ -597,7 +608,12 @@ class SynchronousMultiEngine(PendingDeferredManager):
     
     @two_phase
     def queue_status(self, targets='all'):
-        return self.multiengine.queue_status(targets)
+        # Add what we keep for the pending deferreds, which can take a lot of
+        # memory on the controller.
+        d = self.multiengine.queue_status(targets)
+        d.addCallback(lambda status: status +
+                      [('controller', self.pending_deferred_status())])
+        return d
     
     @two_phase
     def set_properties(self, properties, targets='all'):
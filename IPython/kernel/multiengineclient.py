@@ -17,6 +17,7 @@ __docformat__ = "restructuredtext en"
 #-------------------------------------------------------------------------------
 
 import sys
+import time
 import warnings
 
 from twisted.python import components
@@ -31,7 +32,7 @@ except ImportError:
 from IPython.utils.coloransi import TermColors
 
 from IPython.kernel.twistedutil import blockingCallFromThread
-from IPython.kernel import error
+from IPython.kernel import error, pbconfig, pbutil
 from IPython.kernel.parallelfunction import ParallelFunction
 from IPython.kernel.mapper import (
     MultiEngineMapper, 
@@ -46,6 +47,11 @@ from IPython.kernel.multiengine import IFullSynchronousMultiEngine
 # Pending Result things
 #-------------------------------------------------------------------------------
 
+#: Values of the return_when argument of `FullBlockingMultiEngineClient.wait`
+ANY = 'any'
+ALL = 'all'
+
+
 class IPendingResult(Interface):
     """A representation of a result that is pending.
     
@@ -236,6 +242,11 @@ class QueueStatusList(list):
         output = []
         output.append("<Queue Status List>\n")
         for e in self:
+            if e[0] == 'controller':
+                output.append("Controller:\n")
+                for k, v in sorted(e[1].items()):
+                    output.append("    %s: %s\n" % (k, repr(v)))
+                continue
             output.append("Engine: %s\n" % repr(e[0]))
             output.append("    Pending: %s\n" % repr(e[1]['pending']))
             for q in e[1]['queue']:
@@ -402,9 +413,8 @@ class FullBlockingMultiEngineClient(InteractiveMultiEngineClient):
         `PendingResult` objects to complete.  More specifically, barier does
         the following.
         
-        * The `PendingResult`s are sorted by result_id.
-        * The `get_result` method is called for each `PendingResult` sequentially
-          with block=True.
+        * It waits for all the `PendingResult`s to complete, as `wait` does.
+        * The `get_result` method is called for each `PendingResult`.
         * If a `PendingResult` gets a result that is an exception, it is 
           trapped and can be re-raised later by calling `get_result` again.
         * The `PendingResult`s are flushed from the controller.
@@ -413,21 +423,84 @@ class FullBlockingMultiEngineClient(InteractiveMultiEngineClient):
         be retrieved by calling `get_result` again or accesing the `r` attribute
         of the instance.
         """
-        
-        # Convert to list for sorting and check class type 
         prList = list(pendingResults)
-        for pr in prList:
-            if not isinstance(pr, PendingResult):
-                raise error.NotAPendingResult("Objects passed to barrier must be PendingResult instances")
-                            
-        # Sort the PendingResults so they are in order
-        prList.sort()
-        # Block on each PendingResult object
+        self.wait(prList)
         for pr in prList:
             try:
                 result = pr.get_result(block=True)
             except Exception:
                 pass
+
+    def wait(self, pendingResults, timeout=None, return_when=ALL):
+        """Wait for `PendingResult`s to complete.
+        
+        Unlike `barrier`, this doesn't wait for each result in turn: each call
+        to the controller returns all the results that have completed, or
+        waits until one has.
+        
+        :Parameters:
+            pendingResults : list of `PendingResult`
+                The results to wait for.
+            timeout : float
+                Wait for at most this many seconds, or forever if None.
+            return_when : ANY or ALL
+                Return as soon as one result has completed, or when they all
+                have.
+        
+        :Returns: A tuple (done, not_done) of the lists of the
+            `PendingResult`s that have completed and of those that haven't.
+            Calling `get_result` on those that have completed doesn't block.
+        """
+        if return_when not in (ANY, ALL):
+            raise ValueError("return_when must be ANY or ALL")
+        done = []
+        not_done = []
+        for pr in pendingResults:
+            if not isinstance(pr, PendingResult):
+                raise error.NotAPendingResult("Objects passed to wait must be PendingResult instances")
+            if pr.called:
+                done.append(pr)
+            else:
+                not_done.append(pr)
+        if timeout is not None:
+            deadline = time.time() + timeout
+        while not_done and not (return_when == ANY and done):
+            if timeout is None:
+                remaining = None
+            else:
+                remaining = max(deadline - time.time(), 0)
+            ids = self._bcft(self.smultiengine.get_completed_ids,
+                             [pr.result_id for pr in not_done], remaining)
+            completed = set(ids)
+            done.extend([pr for pr in not_done if pr.result_id in completed])
+            not_done = [pr for pr in not_done
+                        if pr.result_id not in completed]
+            if remaining == 0:
+                break
+        return done, not_done
+
+    def as_completed(self, pendingResults, timeout=None):
+        """Iterate over `PendingResult`s in the order they complete.
+        
+        Calling `get_result` on the yielded `PendingResult`s doesn't block.
+        If they haven't all completed after timeout seconds,
+        `ResultNotCompleted` is raised.
+        """
+        not_done = list(pendingResults)
+        if timeout is not None:
+            deadline = time.time() + timeout
+        while not_done:
+            if timeout is None:
+                remaining = None
+            else:
+                remaining = max(deadline - time.time(), 0)
+            done, not_done = self.wait(not_done, remaining, ANY)
+            if not done:
+                raise error.ResultNotCompleted(
+                    "%i results not completed after %s seconds" %
+                    (len(not_done), timeout))
+            for pr in done:
+                yield pr
     
     def flush(self):
         """
@@ -522,7 +595,9 @@ class FullBlockingMultiEngineClient(InteractiveMultiEngineClient):
         Push a Python function to an engine.
         
         This method is used to push a Python function to an engine.  This
-        method can then be used in code on the engines.  Closures are not supported.
+        method can then be used in code on the engines.  The defaults and
+        closure of the function are pushed with it, and the modules it uses
+        are imported on the engines.  Other globals are not pushed.
         
         :Parameters:
             namespace : dict
@@ -544,7 +619,7 @@ class FullBlockingMultiEngineClient(InteractiveMultiEngineClient):
         Pull a Python function from an engine.
         
         This method is used to pull a Python function from an engine.
-        Closures are not supported.
+        Its defaults and closure are pulled with it.
         
         :Parameters:
             keys : str or list of str
@@ -667,6 +742,12 @@ class FullBlockingMultiEngineClient(InteractiveMultiEngineClient):
         """
         Get the status of an engines queue.
         
+        The last entry, ('controller', status), has counters about the
+        results the controller keeps for calls made with block=False:
+        how many are pending, how many results are kept and how many bytes
+        they take, and how many were discarded after result_ttl seconds
+        (expired) or for going over max_result_bytes (evicted).
+        
         :Parameters:
             targets : id or list of ids
                 The engine to use for the execution
@@ -840,7 +921,7 @@ class FullBlockingMultiEngineClient(InteractiveMultiEngineClient):
         return self._blockFromThread(self.smultiengine.run, filename,
             targets=targets, block=block)
     
-    def benchmark(self, push_size=10000):
+    def benchmark(self, push_size=10000, push_array=None):
         """
         Run performance benchmarks for the current IPython cluster.
         
@@ -849,12 +930,24 @@ class FullBlockingMultiEngineClient(InteractiveMultiEngineClient):
         engines using push.  The latency is measured by having one or more
         engines execute the command 'pass'.  The throughput is measure by 
         sending an NumPy array of size `push_size` to one or more engines.
+        The 'push_scaling' entry gives the total throughput of pushing that
+        array to 1, 2, 4, ... engines, as a list of (number of engines,
+        MB/sec) pairs, which shows how well a push to many engines scales.
+        
+        The array is all zeros, unless another one is given as `push_array`.
+        Zeros compress very well, so when compression is turned on (see
+        `IPython.kernel.pbconfig`), an array of the kind of data the cluster
+        works on gives more telling results.  The 'compression' entry gives
+        the ratio of the pickled to the sent size of the messages of the push
+        benchmarks, and the compression settings.
         
         These benchmarks will vary widely on different hardware and networks
         and thus can be used to get an idea of the performance characteristics
         of a particular configuration of an IPython controller and engines.
         
         This function is not testable within our current testing framework.
+        For a fuller set of benchmarks, with percentiles and results as JSON,
+        see `IPython.kernel.clusterbench`.
         """
         import timeit, __builtin__
         __builtin__._mec_self = self
@@ -870,17 +963,22 @@ class FullBlockingMultiEngineClient(InteractiveMultiEngineClient):
         result = 1000*min(timer.repeat(repeat,count))/count
         benchmarks['all_engine_latency'] = (result,'msec')
 
+        stats = dict(pbutil.compression_stats)
         try:
             import numpy as np
         except:
             pass
         else:
+            if push_array is None:
+                push_array = np.zeros(push_size, dtype='float64')
+            __builtin__._mec_array = push_array
+            nbytes = push_array.nbytes
             timer = timeit.Timer(
                 "_mec_self.push(d)",
-                "import numpy as np; d = dict(a=np.zeros(%r,dtype='float64'))" % push_size
+                "d = dict(a=_mec_array)"
             )
             result = min(timer.repeat(repeat,count))/count
-            benchmarks['all_engine_push'] = (1e-6*push_size*8/result, 'MB/sec')
+            benchmarks['all_engine_push'] = (1e-6*nbytes/result, 'MB/sec')
 
         try:
             import numpy as np
@@ -889,10 +987,42 @@ class FullBlockingMultiEngineClient(InteractiveMultiEngineClient):
         else:
             timer = timeit.Timer(
                 "_mec_self.push(d,0)",
-                "import numpy as np; d = dict(a=np.zeros(%r,dtype='float64'))" % push_size
+                "d = dict(a=_mec_array)"
             )
             result = min(timer.repeat(repeat,count))/count
-            benchmarks['single_engine_push'] = (1e-6*push_size*8/result, 'MB/sec')
+            benchmarks['single_engine_push'] = (1e-6*nbytes/result, 'MB/sec')
+
+        try:
+            import numpy as np
+        except:
+            pass
+        else:
+            # Total throughput of a push to 1, 2, 4, ... engines.
+            ids = self.get_ids()
+            scaling = []
+            n = 1
+            while ids:
+                timer = timeit.Timer(
+                    "_mec_self.push(d,%r)" % (ids[:n],),
+                    "d = dict(a=_mec_array)"
+                )
+                result = min(timer.repeat(repeat,count))/count
+                scaling.append((n, 1e-6*nbytes*n/result))
+                if n >= len(ids):
+                    break
+                n = min(2*n, len(ids))
+            benchmarks['push_scaling'] = (scaling, 'MB/sec')
+
+        pickled = pbutil.compression_stats['bytes_in'] - stats['bytes_in']
+        sent = pbutil.compression_stats['bytes_out'] - stats['bytes_out']
+        if pbconfig.COMPRESSION is None:
+            settings = 'no compression'
+        else:
+            settings = '%s level %s, threshold %s bytes' % (
+                pbconfig.COMPRESSION, pbconfig.COMPRESSION_LEVEL,
+                pbconfig.COMPRESSION_THRESHOLD)
+        benchmarks['compression'] = (sent and float(pickled)/sent or 1.0,
+                                     'x, ' + settings)
 
         return benchmarks
 
@@ -17,7 +17,6 @@ __docformat__ = "restructuredtext en"
 # Imports
 #-------------------------------------------------------------------------------
 
-import cPickle as pickle
 from types import FunctionType
 
 from zope.interface import Interface, implements
@@ -42,6 +41,7 @@ from IPython.kernel.multiengine import (
     IMultiEngine,
     IFullSynchronousMultiEngine,
     ISynchronousMultiEngine)
+from IPython.kernel.pbutil import dumps, loads
 from IPython.kernel.pendingdeferred import PendingDeferredManager
 from IPython.kernel.pickleutil import (
     canDict,
@@ -109,7 +109,7 @@ class FCSynchronousMultiEngineFromMultiEngine(Referenceable):
         return self.packageSuccess(f)
     
     def packageSuccess(self, obj):
-        serial = pickle.dumps(obj, 2)
+        serial = dumps(obj)
         return serial
     
     #---------------------------------------------------------------------------
@@ -127,6 +127,10 @@ class FCSynchronousMultiEngineFromMultiEngine(Referenceable):
             d.addCallback(callback[0], *callback[1], **callback[2])
         return d
        
+    @packageResult
+    def remote_get_completed_ids(self, deferredIDs, timeout):
+        return self.smultiengine.get_completed_ids(deferredIDs, timeout)
+       
     @packageResult
     def remote_clear_pending_deferreds(self):
         return defer.maybeDeferred(self.smultiengine.clear_pending_deferreds)
@@ -146,7 +150,7 @@ class FCSynchronousMultiEngineFromMultiEngine(Referenceable):
     @packageResult    
     def remote_push(self, binaryNS, targets, block):
         try:
-            namespace = pickle.loads(binaryNS)
+            namespace = loads(binaryNS)
         except:
             d = defer.fail(failure.Failure())
         else:
@@ -161,7 +165,7 @@ class FCSynchronousMultiEngineFromMultiEngine(Referenceable):
     @packageResult    
     def remote_push_function(self, binaryNS, targets, block):
         try:
-            namespace = pickle.loads(binaryNS)
+            namespace = loads(binaryNS)
         except:
             d = defer.fail(failure.Failure())
         else:
@@ -190,7 +194,7 @@ class FCSynchronousMultiEngineFromMultiEngine(Referenceable):
     @packageResult    
     def remote_push_serialized(self, binaryNS, targets, block):
         try:
-            namespace = pickle.loads(binaryNS)
+            namespace = loads(binaryNS)
         except:
             d = defer.fail(failure.Failure())
         else:
@@ -231,7 +235,7 @@ class FCSynchronousMultiEngineFromMultiEngine(Referenceable):
     @packageResult
     def remote_set_properties(self, binaryNS, targets, block):
         try:
-            ns = pickle.loads(binaryNS)
+            ns = loads(binaryNS)
         except:
             d = defer.fail(failure.Failure())
         else:
@@ -309,7 +313,7 @@ class FCFullSynchronousMultiEngineClient(object):
     #---------------------------------------------------------------------------
                  
     def unpackage(self, r):
-        return pickle.loads(r)
+        return loads(r)
     
     #---------------------------------------------------------------------------
     # Things related to PendingDeferredManager
@@ -334,6 +338,37 @@ class FCFullSynchronousMultiEngineClient(object):
                 d.addCallback(callback[0], *callback[1], **callback[2])
             return d
     
+    def get_completed_ids(self, deferredIDs, timeout=0):
+        
+        # As in get_pending_deferred, some ids are managed locally and some
+        # on the controller.
+        local = [did for did in deferredIDs if self.pdm.quick_has_id(did)]
+        remote = [did for did in deferredIDs if not self.pdm.quick_has_id(did)]
+        if not local:
+            d = self.remote_reference.callRemote('get_completed_ids', remote,
+                                                 timeout)
+            return d.addCallback(self.unpackage)
+        if not remote:
+            return self.pdm.get_completed_ids(local, timeout)
+        if self.pdm._completed_ids(local):
+            # Some are done already: only check the controller, so that no
+            # call is left waiting there, and return both.
+            timeout = 0
+        dlist = [self.pdm.get_completed_ids(local, timeout),
+                 self.remote_reference.callRemote('get_completed_ids', remote,
+                     timeout).addCallback(self.unpackage)]
+        if timeout == 0:
+            d = gatherBoth(dlist, consumeErrors=1)
+            d.addCallback(lambda r: r[0] + r[1])
+            return d
+        # Otherwise we fire with the ids of the side that has some completed
+        # first.  The call on the other side fires, and is forgotten, when
+        # one of its ids completes or the timeout runs out.
+        d = defer.DeferredList(dlist, fireOnOneCallback=1, fireOnOneErrback=1,
+                               consumeErrors=1)
+        d.addCallback(lambda r: r[0])
+        return d
+    
     def clear_pending_deferreds(self):
         
         # This clear both the local (self.pdm) and remote pending deferreds
@@ -356,7 +391,7 @@ class FCFullSynchronousMultiEngineClient(object):
         return d
     
     def push(self, namespace, targets='all', block=True):
-        serial = pickle.dumps(namespace, 2)
+        serial = dumps(namespace)
         d =  self.remote_reference.callRemote('push', serial, targets, block)
         d.addCallback(self.unpackage)
         return d
@@ -368,7 +403,7 @@ class FCFullSynchronousMultiEngineClient(object):
     
     def push_function(self, namespace, targets='all', block=True):
         cannedNamespace = canDict(namespace)
-        serial = pickle.dumps(cannedNamespace, 2)
+        serial = dumps(cannedNamespace)
         d = self.remote_reference.callRemote('push_function', serial, targets, block)
         d.addCallback(self.unpackage)
         return d
@@ -390,7 +425,7 @@ class FCFullSynchronousMultiEngineClient(object):
     
     def push_serialized(self, namespace, targets='all', block=True):
         cannedNamespace = canDict(namespace)
-        serial = pickle.dumps(cannedNamespace, 2)
+        serial = dumps(cannedNamespace)
         d =  self.remote_reference.callRemote('push_serialized', serial, targets, block)
         d.addCallback(self.unpackage)
         return d
@@ -433,7 +468,7 @@ class FCFullSynchronousMultiEngineClient(object):
         return d
     
     def set_properties(self, properties, targets='all', block=True):
-        serial = pickle.dumps(properties, 2)
+        serial = dumps(properties)
         d = self.remote_reference.callRemote('set_properties', serial, targets, block)
         d.addCallback(self.unpackage)
         return d
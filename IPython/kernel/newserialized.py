@@ -30,11 +30,61 @@ except ImportError:
     pass
 
 from IPython.kernel.error import SerializationError
+from IPython.kernel.pbutil import dumps
 
 #-----------------------------------------------------------------------------
 # Classes and functions
 #-----------------------------------------------------------------------------
 
+#: Arrays are pickled as a sequence of chunks of at most this many bytes, so
+#: that neither end needs a second full copy of their data.
+CHUNK_SIZE = 1024*1024
+
+
+def chunk_buffer(data, chunksize=None):
+    """Yield the bytes of a str or buffer as strs of at most chunksize bytes."""
+    if chunksize is None:
+        chunksize = CHUNK_SIZE
+    view = buffer(data)
+    for i in xrange(0, len(view), chunksize):
+        yield view[i:i+chunksize]
+
+
+def _shape_array(raw, metadata):
+    """Return the array described by metadata, using the bytes in raw.
+    
+    raw is a flat uint8 array, which is viewed and not copied.
+    """
+    dtype = numpy.dtype(metadata['dtype'])
+    shape = tuple(metadata['shape'])
+    if metadata.get('order', 'C') == 'F':
+        # Fortran ordered arrays are sent as their C ordered transpose.
+        return raw.view(dtype).reshape(shape[::-1]).T
+    return raw.view(dtype).reshape(shape)
+
+
+def _empty_array(metadata):
+    """Return a new array for metadata and a flat uint8 array of its bytes."""
+    dtype = numpy.dtype(metadata['dtype'])
+    nbytes = dtype.itemsize*int(numpy.prod(metadata['shape']))
+    raw = numpy.empty(nbytes, numpy.uint8)
+    return _shape_array(raw, metadata), raw
+
+
+def _array_from_data(data, metadata):
+    """Return a writable array using the bytes in data.
+    
+    If data is writable, like a bytearray, the array uses its memory,
+    otherwise the bytes are copied once.
+    """
+    if len(data) == 0:
+        return _empty_array(metadata)[0]
+    raw = numpy.frombuffer(data, numpy.uint8)
+    if not raw.flags.writeable:
+        raw = raw.copy()
+    return _shape_array(raw, metadata)
+
+
 class ISerialized(Interface):
     
     def getData():
@@ -76,6 +126,45 @@ class Serialized(object):
     def getMetadata(self):
         return self.metadata
 
+    def __reduce_ex__(self, protocol):
+        if self.getTypeDescriptor() == 'ndarray':
+            # The data is pickled chunk by chunk into an ArrayReceiver, so
+            # that we never hold a full size copy of it as a str.
+            return (ArrayReceiver, (self.getMetadata(),), None,
+                    chunk_buffer(self.getData()))
+        return object.__reduce_ex__(self, protocol)
+
+
+class ArrayReceiver(Serialized):
+    """A serialized array that is filled in chunk by chunk as it is unpickled.
+    
+    Each chunk is copied straight into the memory of the final array, which
+    `UnSerializeIt` then returns as is.
+    """
+    
+    def __init__(self, metadata):
+        self.array, self._raw = _empty_array(metadata)
+        self._offset = 0
+        Serialized.__init__(self, numpy.getbuffer(self._raw), 'ndarray',
+                            metadata)
+    
+    def append(self, chunk):
+        end = self._offset + len(chunk)
+        if end > len(self._raw):
+            raise SerializationError("Too much data for the array")
+        self._raw[self._offset:end] = numpy.frombuffer(chunk, numpy.uint8)
+        self._offset = end
+    
+    def extend(self, chunks):
+        # The pure Python unpickler adds the chunks with extend.
+        for chunk in chunks:
+            self.append(chunk)
+    
+    def getArray(self):
+        if self._offset != len(self._raw):
+            raise SerializationError("Incomplete data for the array")
+        return self.array
+
         
 class UnSerialized(object):
     
@@ -88,7 +177,7 @@ class UnSerialized(object):
         return self.obj
 
         
-class SerializeIt(object):
+class SerializeIt(Serialized):
     
     implements(ISerialized)
     
@@ -96,13 +185,24 @@ class SerializeIt(object):
         self.data = None
         self.obj = unSerialized.getObject()
         if globals().has_key('numpy'):
-            if isinstance(self.obj, numpy.ndarray):
-                if len(self.obj) == 0:         # length 0 arrays can't be reconstructed
-                    raise SerializationError("You cannot send a length 0 array")
-                self.obj = numpy.ascontiguousarray(self.obj, dtype=None)
+            if isinstance(self.obj, numpy.ndarray) and \
+                   not self.obj.dtype.hasobject:
+                a = self.obj
+                if a.flags.f_contiguous and not a.flags.c_contiguous:
+                    # Send the transpose, which is C ordered, without a copy.
+                    order = 'F'
+                    self.obj = a.T
+                else:
+                    order = 'C'
+                    if not a.flags.c_contiguous:
+                        self.obj = a.copy()
+                if a.dtype.fields:
+                    dtype = a.dtype.descr
+                else:
+                    dtype = a.dtype.str
                 self.typeDescriptor = 'ndarray'
-                self.metadata = {'shape':self.obj.shape,
-                                 'dtype':self.obj.dtype.str}
+                self.metadata = {'shape':a.shape, 'dtype':dtype,
+                                 'order':order}
             else:
                 self.typeDescriptor = 'pickle'
                 self.metadata = {}
@@ -119,18 +219,6 @@ class SerializeIt(object):
         else:
             raise SerializationError("Really wierd serialization error.")
         del self.obj
-        
-    def getData(self):
-        return self.data
-        
-    def getDataSize(self, units=10.0**6):
-        return len(self.data)/units
-        
-    def getTypeDescriptor(self):
-        return self.typeDescriptor
-        
-    def getMetadata(self):
-        return self.metadata
 
 
 class UnSerializeIt(UnSerialized):
@@ -144,11 +232,11 @@ class UnSerializeIt(UnSerialized):
         typeDescriptor = self.serialized.getTypeDescriptor()
         if globals().has_key('numpy'):
             if typeDescriptor == 'ndarray':
-                result = numpy.frombuffer(self.serialized.getData(), dtype = self.serialized.metadata['dtype'])
-                result.shape = self.serialized.metadata['shape']
-                # This is a hack to make the array writable.  We are working with
-                # the numpy folks to address this issue.
-                result = result.copy()
+                if isinstance(self.serialized, ArrayReceiver):
+                    result = self.serialized.getArray()
+                else:
+                    result = _array_from_data(self.serialized.getData(),
+                                              self.serialized.getMetadata())
             elif typeDescriptor == 'pickle':
                 result = pickle.loads(self.serialized.getData())
             else:
@@ -168,3 +256,32 @@ def serialize(obj):
     
 def unserialize(serialized):
     return IUnSerialized(serialized).getObject()
+
+
+class SerializedNamespace(dict):
+    """A namespace to push to many engines, serialized only once.
+
+    The first call to `package` pickles a dict of the values as
+    `Serialized` objects, so that arrays are sent as their raw data, and the
+    same string is returned to all later callers.  It is pickled with
+    `pbutil.dumps`, so it is compressed if that is turned on.  Values that
+    can't be serialized that way are pickled as `UnSerialized` objects, which
+    engines take as they are.  The namespace must not be modified once it
+    has been packaged.
+    """
+
+    def __init__(self, namespace):
+        dict.__init__(self, namespace)
+        self._package = None
+
+    def package(self):
+        """Return the namespace as a string for `push_serialized`."""
+        if self._package is None:
+            serials = {}
+            for k, v in self.iteritems():
+                try:
+                    serials[k] = serialize(v)
+                except Exception:
+                    serials[k] = UnSerialized(v)
+            self._package = dumps(serials)
+        return self._package
@@ -32,3 +32,17 @@ banana.SIZE_LIMIT = 10*1024*1024       # 10 MB
     
 # This sets the size of chunks used when paging is used.    
 CHUNK_SIZE = 64*1024
+
+#-------------------------------------------------------------------------------
+# Compression of the pickled messages sent between clients, the controller
+# and engines (see pbutil.dumps).  COMPRESSION is 'zlib', 'bz2' or None for
+# no compression, and messages smaller than COMPRESSION_THRESHOLD bytes are
+# sent as they are.  Each message says how it was compressed, so these only
+# need to be set in the processes that should compress what they send, for
+# instance in the import_statements of the controller or engine config.
+#-------------------------------------------------------------------------------
+
+COMPRESSION = None
+#COMPRESSION = 'zlib'
+COMPRESSION_LEVEL = 6
+COMPRESSION_THRESHOLD = 64*1024
@@ -16,13 +16,82 @@ __docformat__ = "restructuredtext en"
 #-------------------------------------------------------------------------------
 
 import cPickle as pickle
+import zlib
+
+try:
+    import bz2
+except ImportError:
+    bz2 = None
 
 from twisted.python.failure import Failure
 from twisted.python import failure
 
 from IPython.kernel import pbconfig
-from IPython.kernel.error import PBMessageSizeError, UnpickleableException
+from IPython.kernel.error import (PBMessageSizeError, SerializationError,
+    UnpickleableException)
+
+
+#-------------------------------------------------------------------------------
+# Compression
+#-------------------------------------------------------------------------------
+
+# The headers of compressed messages.  Pickles of protocol 2 start with
+# '\x80', so they can't be mistaken for them.
+_codec_headers = {'zlib': 'ZLIB:', 'bz2': 'BZ2:'}
+
+# Counts of what `compress` was given and what it returned, in this process.
+compression_stats = dict(messages=0, compressed=0, bytes_in=0, bytes_out=0)
+
+
+def compress(data):
+    """Compress a message as set in `pbconfig`, if that makes it smaller.
+    
+    The message is returned as it is if compression is off, if it is
+    shorter than ``pbconfig.COMPRESSION_THRESHOLD`` or if it doesn't
+    compress.  Otherwise the compressed message is returned with a header
+    that tells `decompress` how to undo it.
+    """
+    codec = pbconfig.COMPRESSION
+    compression_stats['messages'] += 1
+    compression_stats['bytes_in'] += len(data)
+    if codec is not None and len(data) >= pbconfig.COMPRESSION_THRESHOLD:
+        if codec == 'zlib':
+            packed = zlib.compress(data, pbconfig.COMPRESSION_LEVEL)
+        elif codec == 'bz2':
+            if bz2 is None:
+                raise SerializationError('bz2 compression is set, but the '
+                                         'bz2 module is not available')
+            packed = bz2.compress(data, pbconfig.COMPRESSION_LEVEL)
+        else:
+            raise SerializationError('unknown compression: %r' % codec)
+        packed = _codec_headers[codec] + packed
+        if len(packed) < len(data):
+            compression_stats['compressed'] += 1
+            data = packed
+    compression_stats['bytes_out'] += len(data)
+    return data
+
+
+def decompress(data):
+    """Undo `compress`, whatever compression the sender used."""
+    if data.startswith('ZLIB:'):
+        return zlib.decompress(buffer(data, 5))
+    elif data.startswith('BZ2:'):
+        if bz2 is None:
+            raise SerializationError('bz2 compressed message, but the bz2 '
+                                     'module is not available')
+        return bz2.decompress(buffer(data, 4))
+    return data
+
+
+def dumps(obj):
+    """Pickle and maybe compress an object to send it."""
+    return compress(pickle.dumps(obj, 2))
+
 
+def loads(data):
+    """Unpickle an object sent with `dumps`."""
+    return pickle.loads(decompress(data))
 
 #-------------------------------------------------------------------------------
 # The actual utilities
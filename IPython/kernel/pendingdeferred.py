@@ -22,9 +22,13 @@ __docformat__ = "restructuredtext en"
 # Imports
 #-------------------------------------------------------------------------------
 
-from twisted.internet import defer
+import time
+from collections import deque
+
+from twisted.internet import defer, reactor
 from twisted.python import failure
 
+from IPython.utils.data import approx_sizeof
 from IPython.kernel import error
 from IPython.external import guid
 
@@ -36,14 +40,46 @@ class PendingDeferredManager(object):
     calls `save_pending_deferred` passing that id and the deferred to
     be tracked.  To later retrieve it, the user calls
     `get_pending_deferred` passing the id.
+
+    Results that nobody has asked for yet are kept until they are retrieved,
+    but those older than `result_ttl` seconds are discarded, and so are the
+    oldest ones once all of them take more than `max_result_bytes` bytes (as
+    measured by `approx_sizeof`).  Asking for a discarded result raises
+    `ResultDiscarded`.  None for either limit means no limit.  Both can be
+    set on the class, to change them for all managers, or passed to the
+    constructor.  Results are only discarded when a new one comes in or
+    when `pending_deferred_status` is called.
     """
+
+    result_ttl = None
+    max_result_bytes = 256*1024*1024
+    # How many discarded ids we remember, to tell them from invalid ones
+    max_discarded_ids = 10000
     
-    def __init__(self):
+    def __init__(self, result_ttl=None, max_result_bytes=None):
         """Manage pending deferreds."""
 
         self.results = {} # Populated when results are ready
-        self.deferred_ids = [] # List of deferred ids I am managing
+        self.deferred_ids = set() # Set of deferred ids I am managing
         self.deferreds_to_callback = {} # dict of lists of deferreds to callback
+        if result_ttl is not None:
+            self.result_ttl = result_ttl
+        if max_result_bytes is not None:
+            self.max_result_bytes = max_result_bytes
+        # (deferred_id, time) of the kept results, oldest first.  Entries
+        # for results that have been retrieved are skipped when we get to
+        # them.
+        self._completed = deque()
+        self._result_sizes = {}
+        self.result_bytes = 0
+        # Why we discarded the results of recent ids, oldest first
+        self._discarded = {}
+        self._discarded_order = deque()
+        self.expired = 0
+        self.evicted = 0
+        # Lists of [deferred, deferred_ids, timeout call] waiting in
+        # get_completed_ids, by the ids they wait for
+        self._completion_waiters = {}
         
     def get_deferred_id(self):
         return guid.generate()
@@ -55,11 +91,19 @@ class PendingDeferredManager(object):
         if self.quick_has_id(deferred_id):
             self.results[deferred_id] = result
             self._trigger_callbacks(deferred_id)
+            self._notify_waiters(deferred_id)
+            if deferred_id in self.results:
+                # Nobody was waiting for it, keep it around for a while.
+                size = approx_sizeof(result)
+                self._result_sizes[deferred_id] = size
+                self.result_bytes += size
+                self._completed.append((deferred_id, time.time()))
+                self._discard_results(keep=deferred_id)
     
     def _trigger_callbacks(self, deferred_id):
         # Go through and call the waiting callbacks
-        result = self.results.get(deferred_id)
-        if result is not None:  # Only trigger if there is a result
+        if deferred_id in self.results:  # Only trigger if there is a result
+            result = self.results[deferred_id]
             try:
                 d = self.deferreds_to_callback.pop(deferred_id)
             except KeyError:
@@ -70,6 +114,43 @@ class PendingDeferredManager(object):
                 else:
                     d.callback(result)
                 self.delete_pending_deferred(deferred_id)
+
+    def _discard_results(self, keep=None):
+        """Discard results past their ttl, then the oldest ones over budget.
+        
+        The result of keep is never discarded for being over budget.
+        """
+        completed = self._completed
+        if self.result_ttl is not None:
+            deadline = time.time() - self.result_ttl
+            while completed and completed[0][1] <= deadline:
+                deferred_id = completed.popleft()[0]
+                if deferred_id in self._result_sizes:
+                    self.expired += 1
+                    self._discard(deferred_id, 'it was not retrieved within '
+                                  '%s seconds' % self.result_ttl)
+        if self.max_result_bytes is not None:
+            while completed and self.result_bytes > self.max_result_bytes:
+                deferred_id = completed[0][0]
+                if deferred_id == keep:
+                    break
+                completed.popleft()
+                if deferred_id in self._result_sizes:
+                    self.evicted += 1
+                    self._discard(deferred_id, 'results took more than %s '
+                                  'bytes' % self.max_result_bytes)
+        # Drop the entries of retrieved results once they are the majority.
+        if len(completed) > 2*len(self._result_sizes) + 100:
+            self._completed = deque(item for item in completed
+                                    if item[0] in self._result_sizes)
+
+    def _discard(self, deferred_id, reason):
+        self.delete_pending_deferred(deferred_id)
+        self._discarded[deferred_id] = reason
+        self._discarded_order.append(deferred_id)
+        if len(self._discarded_order) > self.max_discarded_ids:
+            self._protected_del(self._discarded_order.popleft(),
+                                self._discarded)
                    
     def save_pending_deferred(self, d, deferred_id=None):
         """Save the result of a deferred for later retrieval.
@@ -81,7 +162,7 @@ class PendingDeferredManager(object):
         """
         if deferred_id is None:
             deferred_id = self.get_deferred_id()
-        self.deferred_ids.append(deferred_id)
+        self.deferred_ids.add(deferred_id)
         d.addBoth(self._save_result, deferred_id)
         return deferred_id
     
@@ -104,17 +185,81 @@ class PendingDeferredManager(object):
             if d is not None:
                 d.errback(failure.Failure(error.AbortedPendingDeferredError("pending deferred has been deleted: %r"%deferred_id)))
             # Now delete all references to this deferred_id
-            ind = self.deferred_ids.index(deferred_id)
-            self._protected_del(ind, self.deferred_ids)
+            self.deferred_ids.discard(deferred_id)
             self._protected_del(deferred_id, self.deferreds_to_callback)
-            self._protected_del(deferred_id, self.results)            
+            self._protected_del(deferred_id, self.results)
+            self.result_bytes -= self._result_sizes.pop(deferred_id, 0)
+            self._notify_waiters(deferred_id)
         else:
             raise error.InvalidDeferredID('invalid deferred_id: %r' % deferred_id)
     
     def clear_pending_deferreds(self):
         """Remove all the deferreds I am tracking."""
-        for did in self.deferred_ids:
+        for did in list(self.deferred_ids):
             self.delete_pending_deferred(did)
+        self._completed.clear()
+
+    def pending_deferred_status(self):
+        """Return a dict of counters about the deferreds I am tracking.
+        
+        pending is the number of deferreds without a result yet, results the
+        number of results kept until they are retrieved and result_bytes
+        how much memory they take.  expired and evicted count the results
+        discarded for being older than result_ttl and for going over
+        max_result_bytes.
+        """
+        self._discard_results()
+        return dict(pending=len(self.deferred_ids) - len(self.results),
+                    results=len(self.results),
+                    result_bytes=self.result_bytes,
+                    result_ttl=self.result_ttl,
+                    max_result_bytes=self.max_result_bytes,
+                    expired=self.expired,
+                    evicted=self.evicted)
+        
+    def _completed_ids(self, deferred_ids):
+        return [did for did in deferred_ids
+                if did in self.results or not self.quick_has_id(did)]
+
+    def get_completed_ids(self, deferred_ids, timeout=0):
+        """Return a deferred to the list of deferred_ids that have completed.
+        
+        Ids that I am not tracking, because their result has been retrieved
+        or discarded or because they are invalid, count as completed, so that
+        asking for their result fails right away.  If none of the ids has
+        completed, wait until one does, for up to timeout seconds (None to
+        wait forever), then fire with those that have completed by then,
+        which may be none.
+        """
+        done = self._completed_ids(deferred_ids)
+        if done or not deferred_ids or (timeout is not None and timeout <= 0):
+            return defer.succeed(done)
+        waiter = [defer.Deferred(), list(deferred_ids), None]
+        for did in waiter[1]:
+            self._completion_waiters.setdefault(did, []).append(waiter)
+        if timeout is not None:
+            waiter[2] = reactor.callLater(timeout, self._fire_waiter, waiter)
+        return waiter[0]
+
+    def _fire_waiter(self, waiter):
+        """Fire a waiter of get_completed_ids, and forget it."""
+        d, deferred_ids, call = waiter
+        if d.called:
+            return
+        if call is not None and call.active():
+            call.cancel()
+        for did in deferred_ids:
+            waiters = self._completion_waiters.get(did)
+            if waiters is None:
+                continue
+            waiters.remove(waiter)
+            if not waiters:
+                del self._completion_waiters[did]
+        d.callback(self._completed_ids(deferred_ids))
+
+    def _notify_waiters(self, deferred_id):
+        for waiter in self._completion_waiters.get(deferred_id, [])[:]:
+            self._fire_waiter(waiter)
         
     def _delete_and_pass_through(self, r, deferred_id):
         self.delete_pending_deferred(deferred_id)
@@ -122,9 +267,14 @@ class PendingDeferredManager(object):
         
     def get_pending_deferred(self, deferred_id, block):
         if not self.quick_has_id(deferred_id) or self.deferreds_to_callback.get(deferred_id) is not None:
-            return defer.fail(failure.Failure(error.InvalidDeferredID('invalid deferred_id: %r' + deferred_id)))
-        result = self.results.get(deferred_id)
-        if result is not None:
+            reason = self._discarded.get(deferred_id)
+            if reason is not None:
+                return defer.fail(failure.Failure(error.ResultDiscarded(
+                    'result of deferred_id %r was discarded because %s' %
+                    (deferred_id, reason))))
+            return defer.fail(failure.Failure(error.InvalidDeferredID('invalid deferred_id: %r' % deferred_id)))
+        if deferred_id in self.results:
+            result = self.results[deferred_id]
             self.delete_pending_deferred(deferred_id)
             if isinstance(result, failure.Failure):
                 return defer.fail(result)
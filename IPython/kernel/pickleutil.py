@@ -15,32 +15,236 @@ __docformat__ = "restructuredtext en"
 # Imports
 #-------------------------------------------------------------------------------
 
-from types import FunctionType
+import __builtin__
+import marshal
+import sys
+from collections import deque
+from types import FunctionType, ModuleType
+
+try:
+    from hashlib import md5
+except ImportError:
+    from md5 import md5
+
+# Register the pickling of code objects, including the code of closures.
+from IPython.kernel import codeutil
+from IPython.kernel.error import MissingFunctionCode
+
+#-------------------------------------------------------------------------------
+# Code cache
+#-------------------------------------------------------------------------------
+
+# How many code objects the process keeps, by hash.  When a
+# `CannedFunction` arrives without its code (see `strip_code`), the code is
+# looked up here, and `MissingFunctionCode` is raised if it has been dropped.
+CODE_CACHE_SIZE = 1000
+
+_code_cache = {}
+_code_cache_order = deque()
+
+
+def code_hash(code):
+    """Return a hash of the contents of a code object."""
+    return md5(marshal.dumps(code)).hexdigest()
+
+
+def cache_code(key, code):
+    """Keep code under key, returning the code object already kept if any.
+    
+    Returning the same code object for the same contents lets functions
+    uncanned from separate messages share their code.
+    """
+    cached = _code_cache.get(key)
+    if cached is not None:
+        return cached
+    _code_cache[key] = code
+    _code_cache_order.append(key)
+    while len(_code_cache_order) > CODE_CACHE_SIZE:
+        del _code_cache[_code_cache_order.popleft()]
+    return code
+
+
+def _make_cell(value):
+    return (lambda: value).func_closure[0]
+
+
+def _make_empty_cell():
+    if False:
+        value = None
+    return (lambda: value).func_closure[0]
+
+
+def _code_names(code):
+    """Return the global names used by code and the code nested in it."""
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if hasattr(const, 'co_names'):
+            names.update(_code_names(const))
+    return names
+
+#-------------------------------------------------------------------------------
+# Canned objects
+#-------------------------------------------------------------------------------
 
 class CannedObject(object):
     pass
-    
+
+
+class _EmptyCell(object):
+    """Stands for a closure cell whose variable is not bound yet."""
+    pass
+
+
 class CannedFunction(CannedObject):
+    """A function that can be pickled.
+    
+    Along with the code of the function, its name, defaults and the contents
+    of its closure cells are kept, with any function among them canned in
+    turn.  The globals of the function are not, but the modules it refers to
+    by global names are recorded, so that they can be imported when the
+    function is uncanned where it is going to be called.  Uncanned functions
+    remember them, so that they are kept if the function is canned again on
+    its way there, as tasks are on the controller.
+    
+    The code is also kept by a hash of its contents, in a cache in the
+    process that uncans it, so that it doesn't have to be sent again for
+    later copies of the same function: when ``send_code`` is False, only the
+    hash is pickled.
+    """
     
-    def __init__(self, f):
-        self._checkType(f)    
-        self.code = f.func_code
+    def __init__(self, f, _canning=None):
+        self._checkType(f)
+        if _canning is None:
+            _canning = set()
+        if id(f) in _canning:
+            raise ValueError("Can't can a function %r whose closure refers "
+                             "back to it" % f.func_name)
+        _canning.add(id(f))
+        try:
+            self.code = f.func_code
+            self.code_hash = code_hash(f.func_code)
+            self.name = f.func_name
+            self.send_code = True
+            if f.func_defaults is None:
+                self.defaults = None
+            else:
+                self.defaults = tuple([_can(d, _canning)
+                                       for d in f.func_defaults])
+            if f.func_closure is None:
+                self.closure = None
+            else:
+                self.closure = []
+                for cell in f.func_closure:
+                    try:
+                        value = cell.cell_contents
+                    except ValueError:
+                        value = _EmptyCell()
+                    self.closure.append(_can(value, _canning))
+        finally:
+            _canning.discard(id(f))
+        self.modules = dict(getattr(f, '_canned_modules', {}))
+        for name in _code_names(f.func_code):
+            value = f.func_globals.get(name)
+            if isinstance(value, ModuleType) and value.__name__ != '__main__':
+                self.modules[name] = value.__name__
+    
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if not self.send_code:
+            state['code'] = None
+        return state
     
     def _checkType(self, obj):
         assert isinstance(obj, FunctionType), "Not a function type"
     
-    def getFunction(self, g=None):
+    def canned_functions(self):
+        """Yield this function and the canned functions it holds."""
+        yield self
+        for obj in (self.defaults or ()) + tuple(self.closure or ()):
+            if isinstance(obj, CannedFunction):
+                for cf in obj.canned_functions():
+                    yield cf
+    
+    def getCode(self):
+        if self.code is None:
+            code = _code_cache.get(self.code_hash)
+            if code is None:
+                raise MissingFunctionCode(self.code_hash)
+            return code
+        return cache_code(self.code_hash, self.code)
+    
+    def getFunction(self, g=None, import_modules=False):
+        """Return the function, with a copy of g as its globals.
+        
+        g itself is left alone, and without it the function gets a namespace
+        of its own.  With import_modules, the modules the function refers to
+        are imported into its globals, unless g has the names already; this
+        is only worth doing where the function is going to be called.
+        """
         if g is None:
-            g = globals()
-        newFunc = FunctionType(self.code, g)
+            ns = {'__builtins__': __builtin__}
+        else:
+            ns = dict(g)
+        if import_modules:
+            for name, modname in self.modules.iteritems():
+                if name not in ns:
+                    try:
+                        __import__(modname)
+                    except ImportError:
+                        continue
+                    ns[name] = sys.modules[modname]
+        if self.defaults is None:
+            defaults = None
+        else:
+            defaults = tuple([uncan(d, g, import_modules)
+                              for d in self.defaults])
+        if self.closure is None:
+            closure = None
+        else:
+            closure = []
+            for value in self.closure:
+                if isinstance(value, _EmptyCell):
+                    closure.append(_make_empty_cell())
+                else:
+                    closure.append(_make_cell(uncan(value, g,
+                                                    import_modules)))
+            closure = tuple(closure)
+        newFunc = FunctionType(self.getCode(), ns, self.name, defaults,
+                               closure)
+        if self.modules:
+            newFunc._canned_modules = self.modules
         return newFunc
 
-def can(obj):
+
+def strip_code(objs, known):
+    """Send only the hash of the code of canned functions known to the peer.
+    
+    For the canned functions among objs, and those they hold, ``send_code``
+    is set to whether the code hash is in the set known.  The hashes of all
+    of them are returned, so they can be added to known once the peer has
+    received them.
+    """
+    hashes = set()
+    for obj in objs:
+        if isinstance(obj, CannedFunction):
+            for cf in obj.canned_functions():
+                cf.send_code = cf.code_hash not in known
+                hashes.add(cf.code_hash)
+    return hashes
+
+#-------------------------------------------------------------------------------
+# Functions
+#-------------------------------------------------------------------------------
+
+def _can(obj, _canning):
     if isinstance(obj, FunctionType):
-        return CannedFunction(obj)
+        return CannedFunction(obj, _canning)
     else:
         return obj
 
+def can(obj):
+    return _can(obj, None)
+
 def canDict(obj):
     if isinstance(obj, dict):
         for k, v in obj.iteritems():
@@ -56,27 +260,28 @@ def canSequence(obj):
     else:
         return obj
 
-def uncan(obj, g=None):
+def uncan(obj, g=None, import_modules=False):
     if isinstance(obj, CannedFunction):
-        return obj.getFunction(g)
+        return obj.getFunction(g, import_modules)
     else:
         return obj
 
-def uncanDict(obj, g=None):
+def uncanDict(obj, g=None, import_modules=False):
     if isinstance(obj, dict):
         for k, v in obj.iteritems():
-            obj[k] = uncan(v,g)
+            obj[k] = uncan(v,g,import_modules)
         return obj
     else:
         return obj
 
-def uncanSequence(obj, g=None):
+def uncanSequence(obj, g=None, import_modules=False):
     if isinstance(obj, (list, tuple)):
         t = type(obj)
-        return t([uncan(i,g) for i in obj])
+        return t([uncan(i,g,import_modules) for i in obj])
     else:
         return obj
 
 
 def rebindFunctionGlobals(f, glbls):
-    return FunctionType(f.func_code, glbls)
+    return FunctionType(f.func_code, glbls, f.func_name, f.func_defaults,
+                        f.func_closure)
@@ -20,10 +20,13 @@ __docformat__ = "restructuredtext en"
 __test__ = {}
 
 import time
+from collections import deque
+from heapq import heapify, heappop, heappush
 from types import FunctionType
 
 import zope.interface as zi
 from twisted.internet import defer, reactor
+from twisted.internet.error import ConnectionDone, ConnectionLost
 from twisted.python import components, log, failure
 
 from IPython.kernel import engineservice as es, error
@@ -32,6 +35,20 @@ from IPython.kernel.twistedutil import DeferredList
 
 from IPython.kernel.pickleutil import can, uncan
 
+# Failures of these types mean that the engine that ran a task may be gone.
+engine_lost_errors = [error.ConnectionError, ConnectionDone, ConnectionLost]
+try:
+    from foolscap.api import DeadReferenceError
+except ImportError:
+    try:
+        from foolscap import DeadReferenceError
+    except ImportError:
+        pass
+    else:
+        engine_lost_errors.append(DeadReferenceError)
+else:
+    engine_lost_errors.append(DeadReferenceError)
+
 #-----------------------------------------------------------------------------
 # Definition of the Task objects
 #-----------------------------------------------------------------------------
@@ -261,7 +278,8 @@ class BaseTask(object):
             self.recovery_task.can_task()
             
     def uncan_task(self):
-        self.depend = uncan(self.depend)
+        # The dependency is called by the controller.
+        self.depend = uncan(self.depend, import_modules=True)
         if isinstance(self.recovery_task, BaseTask):
             self.recovery_task.uncan_task()
 
@@ -322,6 +340,41 @@ class MapTask(BaseTask):
         BaseTask.uncan_task(self)
 
 
+class ChunkedMapTask(MapTask):
+    """
+    A task that calls a function on each of a list of argument tuples.
+
+    This lets many small calls share the cost of scheduling and of the
+    round trips to the engine.  The task result is a tuple of the list of
+    return values, in order, and of the time in seconds the engine spent
+    computing them.  If any of the calls raises, the whole task fails.
+    """
+
+    def __init__(self, function, arg_list, clear_before=False,
+            clear_after=False, retries=0, recovery_task=None, depend=None):
+        MapTask.__init__(self, function, list(arg_list),
+            clear_before=clear_before, clear_after=clear_after,
+            retries=retries, recovery_task=recovery_task, depend=depend)
+
+    def submit_task(self, d, queued_engine):
+        d.addCallback(lambda r: queued_engine.push_function(
+            dict(_ipython_task_function=self.function))
+        )
+        d.addCallback(lambda r: queued_engine.push(
+            dict(_ipython_task_args=self.args))
+        )
+        d.addCallback(lambda r: queued_engine.execute(
+            "_ipython_task_start = __import__('time').time(); "
+            "_ipython_task_result = [_ipython_task_function(*_ipython_task_a) "
+            "for _ipython_task_a in _ipython_task_args]; "
+            "_ipython_task_time = __import__('time').time() - _ipython_task_start")
+        )
+        d.addCallback(lambda r: queued_engine.pull(
+            ['_ipython_task_result', '_ipython_task_time'])
+        )
+        d.addCallback(tuple)
+
+
 class StringTask(BaseTask):
     """
     A task that consists of a string of Python code to run.
@@ -649,7 +702,9 @@ class FIFOScheduler(object):
     """
     A basic First-In-First-Out (Queue) Scheduler.
     
-    This is the default Scheduler for the `TaskController`.
+    Every call to `schedule` checks queued tasks against idle workers one
+    pair at a time, which gets slow with many queued tasks; the
+    `IndexedScheduler` hands out tasks in the same order, faster.
     See the docstrings for `IScheduler` for interface details.
     """
     
@@ -736,7 +791,263 @@ class LIFOScheduler(FIFOScheduler):
         # self.workers.reverse()
         self.workers.insert(0, worker)
         # self.workers.reverse()
-    
+
+
+def _depend_key(task):
+    """Return a key shared by tasks whose dependencies are the same.
+
+    Tasks without a `depend` function get None.  `depend` functions with the
+    same code, defaults and globals, and no closure, accept the same workers,
+    so their tasks share a key.  Any other task gets a key of its own.
+    """
+    own_key = ('task', id(task))
+    check_depend = getattr(type(task), 'check_depend', None)
+    if getattr(check_depend, 'im_func', None) is not \
+            BaseTask.check_depend.im_func:
+        return own_key
+    depend = task.depend
+    if depend is None:
+        return None
+    if isinstance(depend, FunctionType) and depend.func_closure is None:
+        key = (depend.func_code, id(depend.func_globals),
+               depend.func_defaults)
+        try:
+            hash(key)
+        except TypeError:
+            return own_key
+        return key
+    return own_key
+
+
+class IndexedScheduler(object):
+    """
+    A First-In-First-Out Scheduler that scales to large numbers of tasks.
+
+    Tasks are handed out in the same order as with the `FIFOScheduler`, but
+    `schedule` does not check every queued task against every idle worker.
+    Tasks are grouped by dependency (see `_depend_key`), so only the oldest
+    task of each group is checked, in order from a heap of the groups'
+    oldest tasks, and tasks without a `depend` function go to the first
+    idle worker right away.  The result of `check_depend`
+    is cached for each group and worker until the worker's properties
+    change, as told by their `version` counter.  Tasks and workers are
+    found by id in dicts.
+
+    `depend` functions should therefore only look at the properties they
+    are given.  See the docstrings for `IScheduler` for interface details.
+    """
+
+    zi.implements(IScheduler)
+
+    def __init__(self):
+        # Queued tasks by taskid, as (seq, task, key) tuples, where key is
+        # the key of the task's group.
+        self._tasks = {}
+        # Groups of tasks by key, as deques of (seq, taskid), oldest first,
+        # and the number of queued tasks in each.
+        self._groups = {}
+        self._group_sizes = {}
+        # Heap of the (seq, taskid, key) of the oldest task of each group.
+        # Entries for tasks that are no longer queued are dropped when they
+        # are reached.
+        self._heads = []
+        # Idle workers by workerid, as (seq, worker), and a deque of their
+        # (seq, workerid) in the order they were added.
+        self._workers = {}
+        self._worker_queue = deque()
+        # Cached results of check_depend, as {key: {workerid: (properties,
+        # version, result)}}.
+        self._depend_cache = {}
+        self._seq = 0
+        # Number of entries in the deques that may no longer be valid.
+        # Entries are only checked against the dicts when they are reached,
+        # and the deques are rebuilt when too many of them pile up.
+        self._stale = 0
+
+    def _ntasks(self):
+        return len(self._tasks)
+
+    def _nworkers(self):
+        return len(self._workers)
+
+    ntasks = property(_ntasks, lambda self, _:None)
+    nworkers = property(_nworkers, lambda self, _:None)
+
+    def _taskids(self):
+        entries = sorted(self._tasks.itervalues(), key=lambda e: e[0])
+        return [e[1].taskid for e in entries]
+
+    def _workerids(self):
+        entries = sorted(self._workers.itervalues(), key=lambda e: e[0])
+        return [e[1].workerid for e in entries]
+
+    taskids = property(_taskids, lambda self,_:None)
+    workerids = property(_workerids, lambda self,_:None)
+
+    def _next_seq(self):
+        self._seq += 1
+        return self._seq
+
+    def add_task(self, task, **flags):
+        if task.taskid in self._tasks:
+            self._remove_task(task.taskid)
+        key = _depend_key(task)
+        seq = self._next_seq()
+        self._tasks[task.taskid] = (seq, task, key)
+        if key not in self._groups:
+            self._groups[key] = deque()
+            self._group_sizes[key] = 0
+            heappush(self._heads, (seq, task.taskid, key))
+        self._groups[key].append((seq, task.taskid))
+        self._group_sizes[key] += 1
+
+    def _head(self, key):
+        """Return the (seq, taskid) of the oldest task in a group."""
+        group = self._groups[key]
+        while True:
+            seq, taskid = group[0]
+            entry = self._tasks.get(taskid)
+            if entry is not None and entry[0] == seq:
+                return seq, taskid
+            group.popleft()
+            self._stale -= 1
+
+    def _prune_heads(self):
+        """Drop invalid entries from the top of the heap of group heads."""
+        heads = self._heads
+        while heads:
+            seq, taskid, key = heads[0]
+            entry = self._tasks.get(taskid)
+            if entry is not None and entry[0] == seq:
+                return
+            heappop(heads)
+
+    def _remove_task(self, id):
+        seq, task, key = self._tasks.pop(id)
+        self._group_sizes[key] -= 1
+        if self._group_sizes[key]:
+            head = self._head(key)
+            if head[0] > seq:
+                # We removed the head of the group, the next task takes its
+                # place in the heap.
+                heappush(self._heads, head + (key,))
+            self._stale += 1
+            self._maybe_compact()
+        else:
+            self._stale -= len(self._groups.pop(key)) - 1
+            del self._group_sizes[key]
+            self._depend_cache.pop(key, None)
+        return task
+
+    def pop_task(self, id=None):
+        if id is None:
+            if not self._tasks:
+                raise IndexError("pop from empty scheduler")
+            self._prune_heads()
+            id = self._heads[0][1]
+        elif id not in self._tasks:
+            raise IndexError("No task #%i"%id)
+        return self._remove_task(id)
+
+    def add_worker(self, worker, **flags):
+        if worker.workerid in self._workers:
+            self._remove_worker(worker.workerid)
+        seq = self._next_seq()
+        self._workers[worker.workerid] = (seq, worker)
+        self._worker_queue.append((seq, worker.workerid))
+
+    def _remove_worker(self, id):
+        seq, worker = self._workers.pop(id)
+        self._stale += 1
+        self._maybe_compact()
+        return worker
+
+    def _prune_workers(self):
+        """Drop invalid entries from the front of the worker deque."""
+        queue = self._worker_queue
+        while queue:
+            seq, workerid = queue[0]
+            entry = self._workers.get(workerid)
+            if entry is not None and entry[0] == seq:
+                return
+            queue.popleft()
+            self._stale -= 1
+
+    def pop_worker(self, id=None):
+        if id is None:
+            if not self._workers:
+                raise IndexError("pop from empty scheduler")
+            self._prune_workers()
+            id = self._worker_queue[0][1]
+        elif id not in self._workers:
+            raise IndexError("No worker #%i"%id)
+        return self._remove_worker(id)
+
+    def _maybe_compact(self):
+        """Drop invalid entries from the deques and the heap if there are many
+        of them."""
+        if len(self._heads) > 2 * len(self._groups) + 100:
+            self._heads = [self._head(key) + (key,) for key in self._groups]
+            heapify(self._heads)
+        if self._stale < 2 * (len(self._tasks) + len(self._workers)) + 100:
+            return
+        tasks = self._tasks
+        for key, group in self._groups.items():
+            self._groups[key] = deque(e for e in group
+                                      if tasks.get(e[1], (None,))[0] == e[0])
+        workers = self._workers
+        self._worker_queue = deque(e for e in self._worker_queue
+                                   if workers.get(e[1], (None,))[0] == e[0])
+        self._stale = 0
+
+    def _can_run(self, key, task, worker):
+        """Cached version of task.check_depend(worker.properties)."""
+        cache = self._depend_cache.setdefault(key, {})
+        try:# do not allow exceptions to break this
+            properties = worker.properties
+            version = getattr(properties, 'version', None)
+            cached = cache.get(worker.workerid)
+            if cached is not None and cached[0] is properties and \
+                    cached[1] == version and version is not None:
+                return cached[2]
+            cando = task.check_depend(properties)
+        except:
+            return False
+        if version is not None:
+            cache[worker.workerid] = (properties, version, cando)
+        return cando
+
+    def schedule(self):
+        if not self._tasks or not self._workers:
+            return None, None
+        self._prune_workers()
+        # Look at the groups oldest first, taking their heads off the heap
+        # until one can run, then put back those that couldn't.
+        skipped = []
+        found = None
+        while self._heads and found is None:
+            head = heappop(self._heads)
+            seq, taskid, key = head
+            entry = self._tasks.get(taskid)
+            if entry is None or entry[0] != seq:
+                continue
+            task = entry[1]
+            for wseq, workerid in self._worker_queue:
+                entry = self._workers.get(workerid)
+                if entry is None or entry[0] != wseq:
+                    continue
+                if key is None or self._can_run(key, task, entry[1]):
+                    found = workerid, taskid
+                    break
+            else:
+                skipped.append(head)
+        for head in skipped:
+            heappush(self._heads, head)
+        if found is None:
+            return None, None
+        workerid, taskid = found
+        return self._remove_worker(workerid), self._remove_task(taskid)
+
 
 class ITaskController(cs.IControllerBase):
     """
@@ -794,6 +1105,14 @@ class ITaskController(cs.IControllerBase):
         Returns None on success.
         """
     
+    def get_completed_ids(taskids, timeout=0):
+        """
+        Return the taskids of the tasks that have completed, or are unknown.
+        
+        If there are none, wait until there are for up to timeout seconds,
+        or forever if timeout is None.
+        """
+    
     def spin():
         """
         Touch the scheduler, to resume scheduling without submitting a task.
@@ -823,12 +1142,20 @@ class TaskController(cs.ControllerAdapterBase):
     
     If you want to use a different scheduler, just subclass this and set
     the `SchedulerClass` member to the *class* of your chosen scheduler.
+
+    Each worker can be given up to `prefetch` tasks at a time.  The ones it
+    can't run yet wait in its queue, and the next one is started as soon as
+    the previous one completes, without waiting for the scheduler.  If the
+    engine of a worker is unregistered, the tasks in its queue go back to the
+    scheduler.  A worker whose task failed because its engine may be gone is
+    kept out of the scheduler for `failurePenalty` seconds.
     """
     
     zi.implements(ITaskController)
-    SchedulerClass = FIFOScheduler
+    SchedulerClass = IndexedScheduler
     
     timeout = 30
+    prefetch = 1
     
     def __init__(self, controller):
         self.controller = controller
@@ -837,9 +1164,14 @@ class TaskController(cs.ControllerAdapterBase):
         self.taskid = 0
         self.failurePenalty = 1 # the time in seconds to penalize
                                 # a worker for failing a task
-        self.pendingTasks = {} # dict of {workerid:(taskid, task)}
+        self.pendingTasks = {} # dict of {workerid:task} of running tasks
+        self.prefetchedTasks = {} # dict of {workerid:deque of tasks}
+        self.admittedWorkers = set() # ids of the workers in the scheduler
         self.deferredResults = {} # dict of {taskid:deferred}
         self.finishedResults = {} # dict of {taskid:actualResult}
+        # Lists of [deferred, taskids, timeout call] waiting in
+        # get_completed_ids, by the taskids they wait for
+        self._completion_waiters = {}
         self.workers = {} # dict of {workerid:worker}
         self.abortPending = [] # dict of {taskid:abortDeferred}
         self.idleLater = None # delayed call object for timeout
@@ -848,7 +1180,7 @@ class TaskController(cs.ControllerAdapterBase):
         for id in self.controller.engines.keys():
                 self.workers[id] = IWorker(self.controller.engines[id])
                 self.workers[id].workerid = id
-                self.schedule.add_worker(self.workers[id])
+                self._admitWorker(id)
     
     def registerWorker(self, id):
         """Called by controller.register_engine."""
@@ -856,22 +1188,89 @@ class TaskController(cs.ControllerAdapterBase):
             raise ValueError("worker with id %s already exists.  This should not happen." % id)
         self.workers[id] = IWorker(self.controller.engines[id])
         self.workers[id].workerid = id
-        if not self.pendingTasks.has_key(id):# if not working
-            self.scheduler.add_worker(self.workers[id])
+        self._admitWorker(id)
         self.distributeTasks()
     
     def unregisterWorker(self, id):
         """Called by controller.unregister_engine"""
         
         if self.workers.has_key(id):
-            try:
-                self.scheduler.pop_worker(id)
-            except IndexError:
-                pass
+            self._withdrawWorker(id)
             self.workers.pop(id)
+            # The tasks it had not started yet can go to other workers
+            if self._requeuePrefetched(id):
+                self.distributeTasks()
     
     def _pendingTaskIDs(self):
-        return [t.taskid for t in self.pendingTasks.values()]
+        ids = [t.taskid for t in self.pendingTasks.values()]
+        for tasks in self.prefetchedTasks.values():
+            ids.extend([t.taskid for t in tasks])
+        return ids
+
+    def _freeSlots(self, workerid):
+        """How many more tasks the worker can be given."""
+        busy = len(self.prefetchedTasks.get(workerid, ()))
+        if workerid in self.pendingTasks:
+            busy += 1
+        return self.prefetch - busy
+
+    def _admitWorker(self, workerid):
+        """Add a worker to the scheduler if it can take more tasks.
+        
+        Return True if it was added.
+        """
+        if workerid in self.workers and \
+               workerid not in self.admittedWorkers and \
+               self._freeSlots(workerid) > 0:
+            self.scheduler.add_worker(self.workers[workerid])
+            self.admittedWorkers.add(workerid)
+            return True
+        return False
+
+    def _withdrawWorker(self, workerid):
+        """Remove a worker from the scheduler."""
+        if workerid in self.admittedWorkers:
+            self.admittedWorkers.discard(workerid)
+            try:
+                self.scheduler.pop_worker(workerid)
+            except IndexError:
+                pass
+
+    def _requeuePrefetched(self, workerid):
+        """Give the tasks a worker has not started back to the scheduler.
+        
+        Like retried tasks, they go after those already in the scheduler.
+        Return True if there were any.
+        """
+        tasks = self.prefetchedTasks.pop(workerid, ())
+        for task in tasks:
+            log.msg("Requeuing task %i from worker %i" % (task.taskid, workerid))
+            self.scheduler.add_task(task)
+        return bool(tasks)
+
+    def _runTask(self, worker, task):
+        self.pendingTasks[worker.workerid] = task
+        d = worker.run(task)
+        log.msg("Running task %i on worker %i" %(task.taskid, worker.workerid))
+        d.addBoth(self.taskCompleted, task.taskid, worker.workerid)
+
+    def _runNext(self, workerid):
+        """Start the next task in the queue of a worker, if any."""
+        tasks = self.prefetchedTasks.get(workerid)
+        if tasks and workerid in self.workers and \
+               workerid not in self.pendingTasks:
+            task = tasks.popleft()
+            if not tasks:
+                del self.prefetchedTasks[workerid]
+            self._runTask(self.workers[workerid], task)
+
+    def _engineLost(self, result):
+        """Is result a failure saying that the engine may be gone?"""
+        if not isinstance(result, failure.Failure):
+            # StringTask results are TaskResults with a failure attribute
+            result = getattr(result, 'failure', None)
+        return isinstance(result, failure.Failure) and \
+               result.check(*engine_lost_errors) is not None
     
     #---------------------------------------------------------------------------
     # Interface methods
@@ -923,6 +1322,8 @@ class TaskController(cs.ControllerAdapterBase):
                 d = defer.fail(IndexError("Task Already Completed"))
             elif taskid in self.abortPending:
                 d = defer.fail(IndexError("Task Already Aborted"))
+            elif self._popPrefetched(taskid):# task was not started yet
+                d = defer.execute(self._doAbort, taskid)
             elif taskid in self._pendingTaskIDs():# task is pending
                 self.abortPending.append(taskid)
                 d = defer.succeed(None)
@@ -933,6 +1334,18 @@ class TaskController(cs.ControllerAdapterBase):
         
         return d
     
+    def _popPrefetched(self, taskid):
+        """Remove a task from the queue of its worker, if it is there."""
+        for workerid, tasks in self.prefetchedTasks.items():
+            for task in tasks:
+                if task.taskid == taskid:
+                    tasks.remove(task)
+                    if not tasks:
+                        del self.prefetchedTasks[workerid]
+                    self.readmitWorker(workerid)
+                    return True
+        return False
+
     def barrier(self, taskids):
         dList = []
         if isinstance(taskids, int):
@@ -944,6 +1357,45 @@ class TaskController(cs.ControllerAdapterBase):
         d.addCallbacks(lambda r: None)
         return d
     
+    def get_completed_ids(self, taskids, timeout=0):
+        """
+        Return a `Deferred` to the list of taskids that have completed.
+        
+        Unknown taskids, including those of cleared results, count as
+        completed so that asking for their result fails right away.  If none
+        of the tasks has completed, wait until one does, for up to timeout
+        seconds (None to wait forever), then fire with those that have
+        completed by then, which may be none.
+        """
+        done = self._completed_ids(taskids)
+        if done or not taskids or (timeout is not None and timeout <= 0):
+            return defer.succeed(done)
+        waiter = [defer.Deferred(), list(taskids), None]
+        for tid in waiter[1]:
+            self._completion_waiters.setdefault(tid, []).append(waiter)
+        if timeout is not None:
+            waiter[2] = reactor.callLater(timeout, self._fire_waiter, waiter)
+        return waiter[0]
+    
+    def _completed_ids(self, taskids):
+        return [tid for tid in taskids if tid not in self.deferredResults]
+    
+    def _fire_waiter(self, waiter):
+        """Fire a waiter of get_completed_ids, and forget it."""
+        d, taskids, call = waiter
+        if d.called:
+            return
+        if call is not None and call.active():
+            call.cancel()
+        for tid in taskids:
+            waiters = self._completion_waiters.get(tid)
+            if waiters is None:
+                continue
+            waiters.remove(waiter)
+            if not waiters:
+                del self._completion_waiters[tid]
+        d.callback(self._completed_ids(taskids))
+    
     def spin(self):
         return defer.succeed(self.distributeTasks())
     
@@ -987,6 +1439,8 @@ class TaskController(cs.ControllerAdapterBase):
         self.finishedResults[taskid] = result
         for d in dlist:
             d.callback(result)
+        for waiter in self._completion_waiters.get(taskid, [])[:]:
+            self._fire_waiter(waiter)
     
     def distributeTasks(self):
         """
@@ -1002,13 +1456,16 @@ class TaskController(cs.ControllerAdapterBase):
             return False
         # else something to do:
         while worker and task:
-            # get worker and task
-            # add to pending
-            self.pendingTasks[worker.workerid] = task
-            # run/link callbacks
-            d = worker.run(task)
-            log.msg("Running task %i on worker %i" %(task.taskid, worker.workerid))
-            d.addBoth(self.taskCompleted, task.taskid, worker.workerid)
+            workerid = worker.workerid
+            self.admittedWorkers.discard(workerid)
+            if workerid in self.pendingTasks:
+                # The worker is busy, it will run the task after the others
+                self.prefetchedTasks.setdefault(workerid, deque()).append(task)
+                log.msg("Queuing task %i on worker %i" %(task.taskid, workerid))
+            else:
+                self._runTask(worker, task)
+            # Put it back in the scheduler if it can take more tasks.
+            self._admitWorker(workerid)
             worker, task = self.scheduler.schedule()
         # check for idle timeout:
         self.checkIdle()
@@ -1017,8 +1474,8 @@ class TaskController(cs.ControllerAdapterBase):
     def checkIdle(self):
         if self.idleLater and not self.idleLater.called:
             self.idleLater.cancel()
-        if self.scheduler.ntasks and self.workers and \
-                    self.scheduler.nworkers == len(self.workers):
+        if self.scheduler.ntasks and self.workers and not self.pendingTasks \
+                    and self.scheduler.nworkers == len(self.workers):
             self.idleLater = reactor.callLater(self.timeout, self.failIdle)
         else:
             self.idleLater = None
@@ -1047,6 +1504,17 @@ class TaskController(cs.ControllerAdapterBase):
             log.msg("Pending tasks: %s"%self.pendingTasks)
             return
         
+        engine_lost = not success and self._engineLost(result)
+        if engine_lost:
+            # The engine may have died, and not yet been unregistered: give
+            # the tasks it has not started to other workers, and wait a bit
+            # before readmitting it.
+            self._withdrawWorker(workerid)
+            self._requeuePrefetched(workerid)
+        else:
+            # Start the next task right away, before the scheduler runs.
+            self._runNext(workerid)
+        
         # Check if aborted while pending
         aborted = False
         if taskid in self.abortPending:
@@ -1074,18 +1542,14 @@ class TaskController(cs.ControllerAdapterBase):
                     self.distributeTasks()
                 else: # done trying
                     self._finishTask(taskid, result)
-                # wait a second before readmitting a worker that failed
-                # it may have died, and not yet been unregistered
-                reactor.callLater(self.failurePenalty, self.readmitWorker, workerid)
             else: # we succeeded
                 log.msg("Task completed: %i"% taskid)
                 self._finishTask(taskid, result)
-                self.readmitWorker(workerid)
-        else: # we aborted the task
-            if not success:
-                reactor.callLater(self.failurePenalty, self.readmitWorker, workerid)
-            else:
-                self.readmitWorker(workerid)
+        
+        if engine_lost:
+            reactor.callLater(self.failurePenalty, self.readmitWorker, workerid)
+        else:
+            self.readmitWorker(workerid)
     
     def readmitWorker(self, workerid):
         """
@@ -1095,8 +1559,7 @@ class TaskController(cs.ControllerAdapterBase):
         implemented through `reactor.callLater`.
         """
         
-        if workerid in self.workers.keys() and workerid not in self.pendingTasks.keys():
-            self.scheduler.add_worker(self.workers[workerid])
+        if self._admitWorker(workerid):
             self.distributeTasks()
     
     def clear(self):
@@ -129,6 +129,21 @@ class BlockingTaskClient(object):
         """
         return self._bcft(self.task_controller.barrier, taskids)
     
+    def get_completed_ids(self, taskids, timeout=0):
+        """Get the taskids of the completed tasks, waiting for one if needed.
+        
+        :Parameters:
+            taskids : list, tuple
+                A sequence of taskids to check.
+            timeout : float
+                Wait for at most this many seconds, or forever if None.
+        
+        :Returns: The list of the taskids that have completed, which is
+            empty if none has before the timeout.
+        """
+        return self._bcft(self.task_controller.get_completed_ids, taskids,
+                          timeout)
+    
     def spin(self):
         """
         Touch the scheduler, to resume scheduling without submitting a task.
@@ -172,23 +187,27 @@ class BlockingTaskClient(object):
         return self.mapper().map(func, *sequences)
 
     def mapper(self, clear_before=False, clear_after=False, retries=0, 
-                recovery_task=None, depend=None, block=True):
+                recovery_task=None, depend=None, block=True, chunksize=1,
+                ordered=True):
         """
         Create an `IMapper` implementer with a given set of arguments.
         
         The `IMapper` created using a task controller is load balanced.
         
         See the documentation for `IPython.kernel.task.BaseTask` for 
-        documentation on the arguments to this method.
+        documentation on the arguments to this method, and the one of
+        `IPython.kernel.mapper.SynchronousTaskMapper` for `chunksize` and
+        `ordered`.
         """
         return SynchronousTaskMapper(self, clear_before=clear_before, 
             clear_after=clear_after, retries=retries, 
-            recovery_task=recovery_task, depend=depend, block=block)
+            recovery_task=recovery_task, depend=depend, block=block,
+            chunksize=chunksize, ordered=ordered)
     
     def parallel(self, clear_before=False, clear_after=False, retries=0, 
-        recovery_task=None, depend=None, block=True):
+        recovery_task=None, depend=None, block=True, chunksize=1):
         mapper = self.mapper(clear_before, clear_after, retries,
-            recovery_task, depend, block)
+            recovery_task, depend, block, chunksize)
         pf = ParallelFunction(mapper)
         return pf
 
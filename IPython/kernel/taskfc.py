@@ -30,6 +30,7 @@ except ImportError:
     from foolscap import Referenceable
 
 from IPython.kernel import task as taskmodule
+from IPython.kernel.pbutil import dumps, loads
 from IPython.kernel.clientinterfaces import (
     IFCClientInterfaceProvider, 
     IBlockingClientAdaptor
@@ -66,6 +67,9 @@ class IFCTaskController(Interface):
     def remote_barrier(taskids):
         """"""
     
+    def remote_get_completed_ids(taskids, timeout):
+        """"""
+    
     def remote_spin():
         """"""
     
@@ -98,7 +102,7 @@ class FCTaskControllerFromTaskController(Referenceable):
         return self.packageSuccess(f)
     
     def packageSuccess(self, obj):
-        serial = pickle.dumps(obj, 2)
+        serial = dumps(obj)
         return serial
     
     #---------------------------------------------------------------------------
@@ -107,7 +111,7 @@ class FCTaskControllerFromTaskController(Referenceable):
     
     def remote_run(self, ptask):
         try:
-            task = pickle.loads(ptask)
+            task = loads(ptask)
             task.uncan_task()
         except:
             d = defer.fail(pickle.UnpickleableError("Could not unmarshal task"))
@@ -135,6 +139,12 @@ class FCTaskControllerFromTaskController(Referenceable):
         d.addErrback(self.packageFailure)
         return d        
     
+    def remote_get_completed_ids(self, taskids, timeout):
+        d = self.taskController.get_completed_ids(taskids, timeout)
+        d.addCallback(self.packageSuccess)
+        d.addErrback(self.packageFailure)
+        return d
+    
     def remote_spin(self):
         d = self.taskController.spin()
         d.addCallback(self.packageSuccess)
@@ -188,7 +198,7 @@ class FCTaskClient(object):
     #---------------------------------------------------------------------------
     
     def unpackage(self, r):
-        return pickle.loads(r)
+        return loads(r)
     
     #---------------------------------------------------------------------------
     # ITaskController related methods
@@ -207,7 +217,7 @@ class FCTaskClient(object):
         """
         assert isinstance(task, taskmodule.BaseTask), "task must be a Task object!"
         task.can_task()
-        ptask = pickle.dumps(task, 2)
+        ptask = dumps(task)
         task.uncan_task()
         d = self.remote_reference.callRemote('run', ptask)
         d.addCallback(self.unpackage)
@@ -252,6 +262,20 @@ class FCTaskClient(object):
         d.addCallback(self.unpackage)
         return d 
     
+    def get_completed_ids(self, taskids, timeout=0):
+        """Get the taskids of the completed tasks, waiting for one if needed.
+        
+        :Parameters:
+            taskids : list, tuple
+                A sequence of taskids to check.
+            timeout : float
+                Wait for at most this many seconds, or forever if None.
+        """
+        d = self.remote_reference.callRemote('get_completed_ids', taskids,
+                                             timeout)
+        d.addCallback(self.unpackage)
+        return d
+    
     def spin(self):
         """
         Touch the scheduler, to resume scheduling without submitting a task.
@@ -307,23 +331,25 @@ class FCTaskClient(object):
         return self.mapper().map(func, *sequences)
     
     def mapper(self, clear_before=False, clear_after=False, retries=0, 
-                recovery_task=None, depend=None, block=True):
+                recovery_task=None, depend=None, block=True, chunksize=1):
         """
         Create an `IMapper` implementer with a given set of arguments.
         
         The `IMapper` created using a task controller is load balanced.
         
         See the documentation for `IPython.kernel.task.BaseTask` for 
-        documentation on the arguments to this method.
+        documentation on the arguments to this method, and the one of
+        `IPython.kernel.mapper.TaskMapper` for `chunksize`.
         """
         return TaskMapper(self, clear_before=clear_before, 
             clear_after=clear_after, retries=retries, 
-            recovery_task=recovery_task, depend=depend, block=block)
+            recovery_task=recovery_task, depend=depend, block=block,
+            chunksize=chunksize)
     
     def parallel(self, clear_before=False, clear_after=False, retries=0, 
-        recovery_task=None, depend=None, block=True):
+        recovery_task=None, depend=None, block=True, chunksize=1):
         mapper = self.mapper(clear_before, clear_after, retries,
-            recovery_task, depend, block)
+            recovery_task, depend, block, chunksize)
         pf = ParallelFunction(mapper)
         return pf
 
@@ -77,6 +77,11 @@ globala = 99
 def testg(x):
     return  globala*x
 
+def make_testh(n):
+    def testh(x, y=1):
+        return pickle.loads(pickle.dumps(n*x + y))
+    return testh
+
 class IEngineCoreTestCase(object):
     """Test an IEngineCore implementer."""
 
@@ -195,6 +200,15 @@ class IEngineCoreTestCase(object):
         d.addCallback(lambda r: self.assertEquals(r, testg(10)))
         return d
         
+    def testPushFunctionClosure(self):
+        """Pushed functions keep their closure and defaults, and the modules they use."""
+        h = make_testh(3)
+        d = self.engine.push_function(dict(h=h))
+        d.addCallback(lambda _: self.engine.execute('result = h(10)'))
+        d.addCallback(lambda _: self.engine.pull('result'))
+        d.addCallback(lambda r: self.assertEquals(r, h(10)))
+        return d
+        
     def testGetResultFailure(self):
         d = self.engine.get_result(None)
         d.addErrback(lambda f: self.assertRaises(IndexError, f.raiseException))
@@ -665,6 +665,22 @@ class ISynchronousMultiEngineTestCase(IMultiEngineBaseTestCase):
         d.addCallback(lambda r: self.assertEquals(r, 4*[[True, False, True, True, False]]))
         return d
 
+    def test_get_completed_ids(self):
+        self.addEngine(4)
+        did_list = []
+        d= self.multiengine.execute('a=10',block=False)
+        d.addCallback(lambda did: did_list.append(did))
+        d.addCallback(lambda _: self.multiengine.pull('a',block=False))
+        d.addCallback(lambda did: did_list.append(did))
+        d.addCallback(lambda _: self.multiengine.get_completed_ids(did_list, None))
+        d.addCallback(lambda r: self.assert_(r and set(r) <= set(did_list)))
+        d.addCallback(lambda _: self.multiengine.get_pending_deferred(did_list[1],True))
+        d.addCallback(lambda r: self.assertEquals(r, 4*[10]))
+        # Retrieved results count as completed
+        d.addCallback(lambda _: self.multiengine.get_completed_ids(did_list[1:], 0))
+        d.addCallback(lambda r: self.assertEquals(r, did_list[1:]))
+        return d
+
     def test_clear_pending_deferreds(self):
         self.addEngine(4)
         did_list = []
@@ -16,7 +16,7 @@ __docformat__ = "restructuredtext en"
 
 import time
 
-from IPython.kernel import task, engineservice as es
+from IPython.kernel import task, mapper, engineservice as es
 from IPython.kernel.util import printer
 from IPython.kernel import error
 
@@ -170,6 +170,34 @@ class ITaskControllerTestCase(TaskTestBase):
         d.addErrback(lambda f: self.assertRaises(ZeroDivisionError, f.raiseException))
         return d
     
+    def test_chunked_map_task(self):
+        self.addEngine(1)
+        t = task.ChunkedMapTask(lambda x, y: x*y, [(1, 2), (3, 4)])
+        d = self.tc.run(t)
+        d.addCallback(self.tc.get_task_result, block=True)
+        d.addCallback(lambda r: self.assertEquals(r[0], [2, 12]))
+        return d
+    
+    def test_task_mapper_chunks(self):
+        self.addEngine(2)
+        f = lambda x, y: x+y
+        expected = map(f, range(10), range(10))
+        m = mapper.TaskMapper(self.tc, chunksize=3)
+        d = m.map(f, range(10), range(10))
+        d.addCallback(lambda r: self.assertEquals(r, expected))
+        m2 = mapper.TaskMapper(self.tc, chunksize='auto')
+        d.addCallback(lambda _: m2.map(f, range(10), range(10)))
+        d.addCallback(lambda r: self.assertEquals(r, expected))
+        return d
+    
+    def test_auto_chunksize(self):
+        # 1ms of overhead for 1us of work: as few chunks as allowed.
+        self.assertEquals(mapper.auto_chunksize(1600, 0.001001, 1e-6, 1), 100)
+        # Work that dwarfs the overhead: one call per task.
+        self.assertEquals(mapper.auto_chunksize(1600, 1.001, 1.0, 1), 1)
+        # Overhead is 10% of the work for chunks of 10 calls.
+        self.assertEquals(mapper.auto_chunksize(1600, 0.002, 0.001, 1), 10)
+    
     def test_map_task_args(self):
         self.assertRaises(TypeError, task.MapTask, 'asdfasdf')
         self.assertRaises(TypeError, task.MapTask, lambda x: x, 10)
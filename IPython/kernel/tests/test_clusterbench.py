@@ -0,0 +1,61 @@
+# encoding: utf-8
+
+"""This file contains unittests for the clusterbench.py module."""
+
+__docformat__ = "restructuredtext en"
+
+#-----------------------------------------------------------------------------
+#  Copyright (C) 2010  The IPython Development Team
+#
+#  Distributed under the terms of the BSD License.  The full license is in
+#  the file COPYING, distributed as part of this software.
+#-----------------------------------------------------------------------------
+
+#-----------------------------------------------------------------------------
+# Imports
+#-----------------------------------------------------------------------------
+
+# Tell nose to skip this module
+__test__ = {}
+
+import os
+import shutil
+import sys
+import tempfile
+
+from twisted.trial import unittest
+
+from IPython.kernel import clusterbench as cb
+
+#-----------------------------------------------------------------------------
+# Tests
+#-----------------------------------------------------------------------------
+
+class HelpersTestCase(unittest.TestCase):
+
+    def testSummarize(self):
+        s = cb.summarize([0.001, 0.002, 0.003])
+        self.assertEquals(s['n'], 3)
+        self.assertAlmostEquals(s['mean'], 2.0)
+        self.assertAlmostEquals(s['p50'], 2.0)
+        self.assertAlmostEquals(s['max'], 3.0)
+
+    def testRate(self):
+        self.assertEquals(cb.rate(10, 2.0), 5.0)
+        self.assertEquals(cb.rate(10, 0), None)
+
+    def testProcessCPUTime(self):
+        if not sys.platform.startswith('linux'):
+            raise unittest.SkipTest('/proc is only read on Linux')
+        t = cb.process_cpu_time(os.getpid())
+        self.assert_(t >= 0)
+
+    def testControllerPID(self):
+        d = tempfile.mkdtemp()
+        try:
+            self.assertEquals(cb.controller_pid(d), None)
+            os.mkdir(os.path.join(d, 'pid'))
+            open(os.path.join(d, 'pid', 'ipcontroller.pid'), 'w').write('42\n')
+            self.assertEquals(cb.controller_pid(d), 42)
+        finally:
+            shutil.rmtree(d)
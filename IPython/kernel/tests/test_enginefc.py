@@ -31,6 +31,8 @@ from IPython.kernel import engineservice as es
 from IPython.testing.util import DeferredTestCase
 from IPython.kernel.controllerservice import IControllerBase
 from IPython.kernel.enginefc import FCRemoteEngineRefFromService, IEngineBase
+from IPython.kernel.enginefc import EngineFromReference
+from IPython.kernel.error import MissingFunctionCode
 from IPython.kernel.engineservice import IEngineQueued
 from IPython.kernel.engineconnector import EngineConnector
 
@@ -89,4 +91,29 @@ class EngineFCTest(DeferredTestCase,
       return {'id':id}
  
   def unregister_engine(self, id):
-      pass
\ No newline at end of file
+      pass
+
+
+class CodeMissingReference(object):
+    """A reference to an engine that never has the code it is sent."""
+    
+    def __init__(self):
+        self.calls = 0
+    
+    def callRemote(self, *args, **kwargs):
+        self.calls += 1
+        return defer.fail(MissingFunctionCode('x'))
+
+
+class PushFunctionRetryTest(DeferredTestCase):
+    
+    def testRetryOnce(self):
+        ref = CodeMissingReference()
+        engine = EngineFromReference(ref)
+        def f(x):
+            return x
+        d = engine.push_function(dict(f=f))
+        d.addCallback(lambda r: self.fail('push_function should fail'))
+        d.addErrback(lambda f: f.trap(MissingFunctionCode))
+        d.addCallback(lambda r: self.assertEquals(ref.calls, 2))
+        return d
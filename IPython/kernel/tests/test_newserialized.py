@@ -28,7 +28,11 @@ from IPython.kernel.newserialized import \
     Serialized, \
     UnSerialized, \
     SerializeIt, \
-    UnSerializeIt
+    UnSerializeIt, \
+    SerializedNamespace, \
+    ArrayReceiver, \
+    serialize, \
+    unserialize
 
 
 #-----------------------------------------------------------------------------
@@ -100,3 +104,106 @@ class SerializedTestCase(unittest.TestCase):
             self.assert_(a.shape == final.shape)
         
         
+
+    def testSerializedNamespace(self):
+        import cPickle as pickle
+        ns = SerializedNamespace({'a':10, 'b':range(10)})
+        self.assert_(ns == {'a':10, 'b':range(10)})
+        package = ns.package()
+        self.assert_(ns.package() is package)
+        serials = pickle.loads(package)
+        self.assert_(sorted(serials.keys()) == ['a', 'b'])
+        for k, v in serials.iteritems():
+            self.assert_(ISerialized.providedBy(v))
+            self.assert_(IUnSerialized(v).getObject() == ns[k])
+
+    def testSerializedNamespaceNDArray(self):
+        try:
+            import numpy
+        except ImportError:
+            pass
+        else:
+            import cPickle as pickle
+            a = numpy.linspace(0.0, 1.0, 1000)
+            ns = SerializedNamespace(dict(a=a, empty=numpy.zeros(0)))
+            serials = pickle.loads(ns.package())
+            self.assert_(serials['a'].getTypeDescriptor() == 'ndarray')
+            final = IUnSerialized(serials['a']).getObject()
+            self.assert_((final == a).all())
+            # Empty arrays can't be sent as raw data, but still get through.
+            empty = IUnSerialized(serials['empty']).getObject()
+            self.assert_(empty.shape == (0,))
+
+    def roundTripArray(self, a):
+        import pickle, cPickle
+        from IPython.kernel import newserialized
+        ser = serialize(a)
+        chunksize = newserialized.CHUNK_SIZE
+        # Small chunks so that the larger arrays are sent in several.
+        newserialized.CHUNK_SIZE = 64
+        try:
+            package = cPickle.dumps(ser, 2)
+        finally:
+            newserialized.CHUNK_SIZE = chunksize
+        # Both unpicklers must fill the array in.
+        for loads in (cPickle.loads, pickle.loads):
+            received = loads(package)
+            self.assert_(isinstance(received, ArrayReceiver))
+            final = unserialize(received)
+            self.assert_(final.flags.writeable)
+            self.assert_(final.dtype == a.dtype)
+            self.assert_(final.shape == a.shape)
+            self.assert_((final == a).all())
+        return final
+
+    def testNDArrayRoundTrip(self):
+        try:
+            import numpy
+        except ImportError:
+            pass
+        else:
+            self.roundTripArray(numpy.linspace(0.0, 1.0, 1000))
+            self.roundTripArray(numpy.zeros(0))
+            self.roundTripArray(numpy.zeros((0, 3), dtype='int32'))
+            self.roundTripArray(numpy.array(3.5))
+            # Non contiguous arrays
+            self.roundTripArray(numpy.arange(100)[::3])
+            f = numpy.asfortranarray(numpy.arange(60.0).reshape(3, 4, 5))
+            final = self.roundTripArray(f)
+            self.assert_(final.flags.f_contiguous)
+            s = numpy.array([(1, 2.5, 'ab'), (3, 4.5, 'cd')],
+                            dtype=[('a', 'i4'), ('b', 'f8'), ('c', 'S2')])
+            final = self.roundTripArray(s)
+            self.assert_(final['c'][1] == 'cd')
+
+    def testNDArrayObjectDtype(self):
+        try:
+            import numpy
+        except ImportError:
+            pass
+        else:
+            a = numpy.array([{'a':1}, None], dtype=object)
+            ser = serialize(a)
+            self.assert_(ser.getTypeDescriptor() == 'pickle')
+            final = unserialize(ser)
+            self.assert_(final[0] == {'a':1})
+
+    def testNDArrayWritableBuffer(self):
+        try:
+            import numpy
+        except ImportError:
+            pass
+        else:
+            a = numpy.arange(10.0)
+            md = serialize(a).getMetadata()
+            data = bytearray(str(numpy.getbuffer(a)))
+            final = unserialize(Serialized(data, 'ndarray', md))
+            self.assert_((final == a).all())
+            # The array uses the memory of the bytearray, without a copy.
+            final[0] = 42.0
+            self.assert_(numpy.frombuffer(data, 'float64')[0] == 42.0)
+            # Read only data is copied.
+            data = str(numpy.getbuffer(a))
+            final = unserialize(Serialized(data, 'ndarray', md))
+            final[0] = 42.0
+            self.assert_(a[0] == 0.0)
@@ -0,0 +1,78 @@
+# encoding: utf-8
+
+"""This file contains unittests for the pbutil.py module."""
+
+__docformat__ = "restructuredtext en"
+
+#-----------------------------------------------------------------------------
+#  Copyright (C) 2010  The IPython Development Team
+#
+#  Distributed under the terms of the BSD License.  The full license is in
+#  the file COPYING, distributed as part of this software.
+#-----------------------------------------------------------------------------
+
+#-----------------------------------------------------------------------------
+# Imports
+#-----------------------------------------------------------------------------
+
+# Tell nose to skip this module
+__test__ = {}
+
+import cPickle as pickle
+
+from twisted.trial import unittest
+
+from IPython.kernel import pbconfig, pbutil
+from IPython.kernel.error import SerializationError
+
+#-----------------------------------------------------------------------------
+# Tests
+#-----------------------------------------------------------------------------
+
+class CompressionTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.settings = (pbconfig.COMPRESSION, pbconfig.COMPRESSION_LEVEL,
+                         pbconfig.COMPRESSION_THRESHOLD)
+        pbconfig.COMPRESSION_THRESHOLD = 1000
+        self.obj = dict(a='x'*10000, b=range(100))
+
+    def tearDown(self):
+        (pbconfig.COMPRESSION, pbconfig.COMPRESSION_LEVEL,
+         pbconfig.COMPRESSION_THRESHOLD) = self.settings
+
+    def testNoCompression(self):
+        pbconfig.COMPRESSION = None
+        data = pbutil.dumps(self.obj)
+        self.assertEquals(data, pickle.dumps(self.obj, 2))
+        self.assertEquals(pbutil.loads(data), self.obj)
+
+    def testCodecs(self):
+        for codec in ('zlib', 'bz2'):
+            if codec == 'bz2' and pbutil.bz2 is None:
+                continue
+            pbconfig.COMPRESSION = codec
+            before = dict(pbutil.compression_stats)
+            data = pbutil.dumps(self.obj)
+            self.assert_(len(data) < 1000)
+            # Whatever this process is set to, the header tells how to
+            # decompress.
+            pbconfig.COMPRESSION = None
+            self.assertEquals(pbutil.loads(data), self.obj)
+            stats = pbutil.compression_stats
+            self.assertEquals(stats['compressed'] - before['compressed'], 1)
+            self.assertEquals(stats['bytes_out'] - before['bytes_out'],
+                              len(data))
+
+    def testThreshold(self):
+        pbconfig.COMPRESSION = 'zlib'
+        small = range(10)
+        self.assertEquals(pbutil.dumps(small), pickle.dumps(small, 2))
+        # Data that doesn't compress is sent as it is.
+        noise = ''.join([chr(i % 251) for i in range(0, 200000, 7)])
+        data = pbutil.dumps(noise)
+        self.assertEquals(pbutil.loads(data), noise)
+
+    def testUnknownCodec(self):
+        pbconfig.COMPRESSION = 'lzma'
+        self.assertRaises(SerializationError, pbutil.dumps, self.obj)
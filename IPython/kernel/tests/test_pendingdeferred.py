@@ -184,3 +184,77 @@ class PendingDeferredManagerTest(DeferredTestCase):
         d3 = self.pdm.get_pending_deferred(did,False)
         d3.addCallback(lambda r: self.assertEquals(r,'bar'))
 
+
+    def test_status(self):
+        d = defer.Deferred()
+        did = self.pdm.save_pending_deferred(d)
+        self.pdm.save_pending_deferred(defer.Deferred())
+        status = self.pdm.pending_deferred_status()
+        self.assertEquals((status['pending'], status['results']), (2, 0))
+        d.callback('x'*1000)
+        status = self.pdm.pending_deferred_status()
+        self.assertEquals((status['pending'], status['results']), (1, 1))
+        self.assert_(status['result_bytes'] >= 1000)
+        d2 = self.pdm.get_pending_deferred(did,False)
+        d2.addCallback(lambda r: self.assertEquals(r,'x'*1000))
+        status = self.pdm.pending_deferred_status()
+        self.assertEquals((status['results'], status['result_bytes']), (0, 0))
+        return d2
+
+    def test_result_ttl(self):
+        pdm = pd.PendingDeferredManager(result_ttl=0)
+        d = defer.Deferred()
+        did = pdm.save_pending_deferred(d)
+        d.callback('foo')
+        status = pdm.pending_deferred_status()
+        self.assertEquals((status['results'], status['expired']), (0, 1))
+        self.assert_(not pdm.quick_has_id(did))
+        d2 = pdm.get_pending_deferred(did,False)
+        d2.addErrback(lambda f: self.assertRaises(error.ResultDiscarded, f.raiseException))
+        return d2
+
+    def test_max_result_bytes(self):
+        pdm = pd.PendingDeferredManager(max_result_bytes=2500)
+        dids = []
+        for i in range(3):
+            d = defer.Deferred()
+            dids.append(pdm.save_pending_deferred(d))
+            d.callback(str(i)*1000)
+        status = pdm.pending_deferred_status()
+        self.assertEquals((status['results'], status['evicted']), (2, 1))
+        self.assert_(status['result_bytes'] <= 2500)
+        d2 = pdm.get_pending_deferred(dids[0],False)
+        d2.addErrback(lambda f: self.assertRaises(error.InvalidDeferredID, f.raiseException))
+        d2.addCallback(lambda _: pdm.get_pending_deferred(dids[2],False))
+        d2.addCallback(lambda r: self.assertEquals(r,'2'*1000))
+        return d2
+
+    def test_get_completed_ids(self):
+        d1 = defer.Deferred()
+        d2 = defer.Deferred()
+        did1 = self.pdm.save_pending_deferred(d1)
+        did2 = self.pdm.save_pending_deferred(d2)
+        completed = []
+        d = self.pdm.get_completed_ids([did1, did2], 0)
+        d.addCallback(lambda r: self.assertEquals(r, []))
+        # Waits until one of them completes.
+        d = self.pdm.get_completed_ids([did1, did2], None)
+        d.addCallback(completed.append)
+        self.assertEquals(completed, [])
+        d2.callback('foo')
+        self.assertEquals(completed, [[did2]])
+        # The waiter is forgotten by all the ids it waited for.
+        self.assertEquals(self.pdm._completion_waiters, {})
+        # Unknown ids count as completed.
+        d = self.pdm.get_completed_ids([did1, 'bad id'], None)
+        d.addCallback(lambda r: self.assertEquals(r, ['bad id']))
+        return d
+
+    def test_get_completed_ids_timeout(self):
+        d1 = defer.Deferred()
+        did1 = self.pdm.save_pending_deferred(d1)
+        d = self.pdm.get_completed_ids([did1], 0.01)
+        d.addCallback(lambda r: self.assertEquals(r, []))
+        d.addCallback(lambda _: self.assertEquals(
+            self.pdm._completion_waiters, {}))
+        return d
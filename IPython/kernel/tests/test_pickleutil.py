@@ -0,0 +1,135 @@
+# encoding: utf-8
+
+"""This file contains unittests for the pickleutil.py module."""
+
+__docformat__ = "restructuredtext en"
+
+#-----------------------------------------------------------------------------
+#  Copyright (C) 2010  The IPython Development Team
+#
+#  Distributed under the terms of the BSD License.  The full license is in
+#  the file COPYING, distributed as part of this software.
+#-----------------------------------------------------------------------------
+
+#-----------------------------------------------------------------------------
+# Imports
+#-----------------------------------------------------------------------------
+
+# Tell nose to skip this module
+__test__ = {}
+
+import __builtin__
+import cPickle as pickle
+import os
+
+from twisted.trial import unittest
+
+from IPython.kernel import pickleutil
+from IPython.kernel.error import MissingFunctionCode
+from IPython.kernel.pickleutil import can, uncan, strip_code
+
+#-----------------------------------------------------------------------------
+# Tests
+#-----------------------------------------------------------------------------
+
+def make_adder(n):
+    def add(x):
+        return x + n
+    return add
+
+
+def make_nested(n):
+    def outer(x, scale=make_adder(100)):
+        def inner(y):
+            return y*n
+        return scale(inner(x))
+    return outer
+
+
+def uses_module(path):
+    return os.path.basename(path)
+
+
+def roundtrip(f, g=None, import_modules=False):
+    return uncan(pickle.loads(pickle.dumps(can(f), 2)), g, import_modules)
+
+
+class CanningTestCase(unittest.TestCase):
+
+    def setUp(self):
+        pickleutil._code_cache.clear()
+        pickleutil._code_cache_order.clear()
+
+    def testPlainFunction(self):
+        f = roundtrip(lambda x, y=2: x*y)
+        self.assertEquals(f(3), 6)
+        self.assertEquals(f(3, 3), 9)
+
+    def testClosure(self):
+        f = roundtrip(make_adder(10))
+        self.assertEquals(f(1), 11)
+        self.assertEquals(f.func_name, 'add')
+        f = roundtrip(make_nested(3))
+        self.assertEquals(f(2), 106)
+
+    def testEmptyCell(self):
+        def outer():
+            def inner():
+                return later
+            cf = can(inner)
+            later = 1
+            return cf
+        f = uncan(pickle.loads(pickle.dumps(outer(), 2)))
+        self.assertRaises(NameError, f)
+
+    def testRecursiveClosure(self):
+        def outer():
+            def fact(n):
+                return n <= 1 and 1 or n*fact(n-1)
+            return fact
+        self.assertRaises(ValueError, can, outer())
+
+    def testModules(self):
+        g = {}
+        f = roundtrip(uses_module, g, True)
+        self.assert_(f.func_globals['os'] is os)
+        self.assertEquals(f('/a/b'), 'b')
+        # The globals given are copied, not changed.
+        self.assertEquals(g, {})
+        # Names already bound in the globals are left alone.
+        g = {'os': 'not os'}
+        f = roundtrip(uses_module, g, True)
+        self.assertEquals(f.func_globals['os'], 'not os')
+        # Modules are only imported when asked for, and never into the
+        # globals of pickleutil.
+        f = roundtrip(uses_module)
+        self.failIf('os' in f.func_globals)
+        self.failIf('os' in vars(pickleutil))
+        self.assertEquals(f.func_globals['__builtins__'], __builtin__)
+        # Canning it again, as the controller does with tasks, keeps the
+        # modules it needs.
+        f = roundtrip(f, None, True)
+        self.assert_(f.func_globals['os'] is os)
+        self.assertEquals(f('/a/b'), 'b')
+
+    def testSharedCode(self):
+        f1 = roundtrip(make_adder(1))
+        f2 = roundtrip(make_adder(2))
+        self.assert_(f1.func_code is f2.func_code)
+        self.assertEquals((f1(0), f2(0)), (1, 2))
+
+    def testStripCode(self):
+        known = set()
+        cf = can(make_nested(3))
+        hashes = strip_code([cf], known)
+        self.assertEquals(len(hashes), 2)
+        full = pickle.dumps(cf, 2)
+        known.update(hashes)
+        self.assertEquals(strip_code([cf], known), hashes)
+        short = pickle.dumps(cf, 2)
+        self.assert_(len(short) < len(full))
+        # The code has to be received once before it can be sent by hash.
+        self.assertRaises(MissingFunctionCode,
+                          uncan, pickle.loads(short))
+        self.assertEquals(uncan(pickle.loads(full))(2), 106)
+        self.assertEquals(uncan(pickle.loads(short))(2), 106)
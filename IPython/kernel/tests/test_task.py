@@ -21,9 +21,11 @@ __test__ = {}
 import time
 
 from twisted.internet import defer
+from twisted.python import failure
 from twisted.trial import unittest
 
-from IPython.kernel import task, controllerservice as cs, engineservice as es
+from IPython.kernel import task, mapper, controllerservice as cs, \
+    engineservice as es
 from IPython.kernel.multiengine import IMultiEngine
 from IPython.testing.util import DeferredTestCase
 from IPython.kernel.tests.tasktest import ITaskControllerTestCase
@@ -49,3 +51,235 @@ class BasicTaskControllerTestCase(DeferredTestCase, ITaskControllerTestCase):
             e.stopService()
 
 
+class PrefetchTaskControllerTestCase(BasicTaskControllerTestCase):
+
+    def setUp(self):
+        BasicTaskControllerTestCase.setUp(self)
+        self.tc.prefetch = 3
+
+
+
+
+class FakeWorker(object):
+    
+    def __init__(self, workerid, **properties):
+        self.workerid = workerid
+        self.properties = es.StrictDict(properties)
+
+
+def _has_gpu(properties):
+    return properties.get('gpu', False)
+
+
+_depend_calls = []
+
+def _counting_depend(properties):
+    _depend_calls.append(1)
+    return properties.get('ok', False)
+
+
+class SchedulerTestCase(unittest.TestCase):
+    
+    def make_task(self, taskid, depend=None):
+        t = task.StringTask('a=1', depend=depend)
+        t.taskid = taskid
+        return t
+    
+    def run_schedule(self, scheduler):
+        pairs = []
+        worker, t = scheduler.schedule()
+        while worker and t:
+            pairs.append((worker.workerid, t.taskid))
+            worker, t = scheduler.schedule()
+        return pairs
+    
+    def test_same_order_as_fifo(self):
+        schedulers = [task.FIFOScheduler(), task.IndexedScheduler()]
+        for s in schedulers:
+            for i in range(20):
+                s.add_task(self.make_task(i, [None, _has_gpu][i % 3 == 0]))
+            for i in range(4):
+                s.add_worker(FakeWorker(i, gpu=(i == 2)))
+        fifo, indexed = schedulers
+        self.assertEquals(indexed.taskids, fifo.taskids)
+        self.assertEquals(indexed.workerids, fifo.workerids)
+        for i in range(5):
+            pairs = self.run_schedule(fifo)
+            self.assertEquals(self.run_schedule(indexed), pairs)
+            for workerid, taskid in pairs:
+                for s in schedulers:
+                    s.add_worker(FakeWorker(workerid, gpu=(workerid == 2)))
+        self.assertEquals(indexed.taskids, fifo.taskids)
+    
+    def test_pop_by_id(self):
+        s = task.IndexedScheduler()
+        for i in range(5):
+            s.add_task(self.make_task(i))
+        s.add_worker(FakeWorker(0))
+        s.add_worker(FakeWorker(1))
+        self.assertEquals(s.pop_task(2).taskid, 2)
+        self.assertRaises(IndexError, s.pop_task, 2)
+        self.assertEquals(s.pop_task().taskid, 0)
+        self.assertEquals(s.pop_worker(1).workerid, 1)
+        self.assertRaises(IndexError, s.pop_worker, 1)
+        self.assertEquals((s.ntasks, s.nworkers), (3, 1))
+        self.assertEquals(s.taskids, [1, 3, 4])
+        w, t = s.schedule()
+        self.assertEquals((w.workerid, t.taskid), (0, 1))
+        self.assertEquals(s.schedule(), (None, None))
+    
+    def test_group_heads(self):
+        schedulers = [task.FIFOScheduler(), task.IndexedScheduler()]
+        for s in schedulers:
+            for i in range(300):
+                s.add_task(self.make_task(i, [None, _has_gpu][i % 3 == 0]))
+            # Removing the heads of the groups moves them along.
+            for i in range(0, 250, 2):
+                s.pop_task(i)
+            s.add_worker(FakeWorker(0))
+            s.add_worker(FakeWorker(1, gpu=True))
+        fifo, indexed = schedulers
+        self.assertEquals(indexed.pop_task().taskid, fifo.pop_task().taskid)
+        self.assertEquals(self.run_schedule(indexed), self.run_schedule(fifo))
+        self.assertEquals(indexed.taskids, fifo.taskids)
+        self.assert_(len(indexed._heads) <= 2 * len(indexed._groups) + 100)
+    
+    def test_depend_cache(self):
+        del _depend_calls[:]
+        s = task.IndexedScheduler()
+        worker = FakeWorker(0)
+        s.add_worker(worker)
+        for i in range(3):
+            s.add_task(self.make_task(i, _counting_depend))
+        self.assertEquals(s.schedule(), (None, None))
+        self.assertEquals(s.schedule(), (None, None))
+        self.assertEquals(len(_depend_calls), 1)
+        # Changing the properties of the worker invalidates the cache.
+        worker.properties['ok'] = True
+        w, t = s.schedule()
+        self.assertEquals(t.taskid, 0)
+        self.assertEquals(len(_depend_calls), 2)
+
+
+class RunWorker(FakeWorker):
+    """A worker whose tasks complete when we fire their deferreds."""
+    
+    def __init__(self, workerid, **properties):
+        FakeWorker.__init__(self, workerid, **properties)
+        self.runs = []
+    
+    def run(self, t):
+        d = defer.Deferred()
+        self.runs.append((t.taskid, d))
+        return d
+
+
+class PrefetchTestCase(unittest.TestCase):
+    
+    def setUp(self):
+        self.tc = task.TaskController(cs.ControllerService())
+        self.tc.prefetch = 2
+        self.worker = RunWorker(0)
+        self.tc.workers[0] = self.worker
+        self.tc._admitWorker(0)
+    
+    def tearDown(self):
+        if self.tc.idleLater is not None and self.tc.idleLater.active():
+            self.tc.idleLater.cancel()
+    
+    def test_prefetch(self):
+        tc = self.tc
+        for i in range(4):
+            tc.run(task.StringTask('a=%i' % i))
+        # One task running, one waiting on the worker, two in the scheduler
+        self.assertEquals([r[0] for r in self.worker.runs], [0])
+        self.assertEquals([t.taskid for t in tc.prefetchedTasks[0]], [1])
+        self.assertEquals(tc.scheduler.taskids, [2, 3])
+        self.assertEquals(sorted(tc._pendingTaskIDs()), [0, 1])
+        # The next task starts as soon as the first completes.
+        self.worker.runs[0][1].callback((True, 'done'))
+        self.assertEquals([r[0] for r in self.worker.runs], [0, 1])
+        self.assertEquals([t.taskid for t in tc.prefetchedTasks[0]], [2])
+        self.assertEquals(tc.finishedResults[0], 'done')
+        # Tasks that are queued on a worker can be aborted.
+        d = tc.abort(2)
+        self.assert_(isinstance(tc.finishedResults[2], failure.Failure))
+        self.assertEquals([t.taskid for t in tc.prefetchedTasks[0]], [3])
+        return d
+    
+    def test_unregister_requeues(self):
+        tc = self.tc
+        for i in range(3):
+            tc.run(task.StringTask('a=%i' % i))
+        tc.unregisterWorker(0)
+        self.assertEquals(sorted(tc.scheduler.taskids), [1, 2])
+        self.failIf(tc.prefetchedTasks)
+        # The running task completes as usual.
+        self.worker.runs[0][1].callback((True, 'done'))
+        self.assertEquals(tc.finishedResults[0], 'done')
+        self.assertEquals(sorted(tc.scheduler.taskids), [1, 2])
+    
+    def test_get_completed_ids(self):
+        tc = self.tc
+        for i in range(2):
+            tc.run(task.StringTask('a=%i' % i))
+        done = []
+        tc.get_completed_ids([0, 1], 0).addCallback(done.append)
+        self.assertEquals(done, [[]])
+        # Unknown taskids count as completed.
+        tc.get_completed_ids([0, 5], None).addCallback(done.append)
+        self.assertEquals(done[1], [5])
+        d = tc.get_completed_ids([0, 1], None)
+        d.addCallback(done.append)
+        self.assertEquals(len(done), 2)
+        self.worker.runs[0][1].callback((True, 'done'))
+        self.assertEquals(done[2], [0])
+        # Fired waiters are forgotten by all the tasks they waited for.
+        self.assertEquals(tc._completion_waiters, {})
+        self.assertEquals(tc.deferredResults[1], [])
+
+
+class LocalTaskClient(object):
+    """A blocking task client that runs map tasks when they are waited for.
+    
+    Waiting for any of several tasks completes the most recent one, so that
+    they complete in the reverse order.
+    """
+    
+    def __init__(self):
+        self.tasks = []
+        self.done = set()
+    
+    def run(self, t, block=False):
+        self.tasks.append(t)
+        return len(self.tasks) - 1
+    
+    def get_task_result(self, taskid, block=False):
+        if taskid not in self.done and not block:
+            return None
+        self.done.add(taskid)
+        t = self.tasks[taskid]
+        return [t.function(*args) for args in t.args], 0.0
+    
+    def get_completed_ids(self, taskids, timeout=0):
+        done = [tid for tid in taskids if tid in self.done]
+        if not done and timeout != 0:
+            self.done.add(max(taskids))
+            done = [max(taskids)]
+        return done
+
+
+class SynchronousTaskMapperTestCase(unittest.TestCase):
+    
+    def test_imap_ordered(self):
+        m = mapper.SynchronousTaskMapper(LocalTaskClient(), chunksize=2)
+        it = m.imap(lambda x, y: x*y, range(5), range(5))
+        self.assertEquals(list(it), [0, 1, 4, 9, 16])
+    
+    def test_imap_unordered(self):
+        client = LocalTaskClient()
+        m = mapper.SynchronousTaskMapper(client, chunksize=2, ordered=False)
+        it = m.imap(lambda x: 2*x, range(5))
+        self.assertEquals(len(client.tasks), 3)
+        # Results come in the order the tasks complete.
+        self.assertEquals(list(it), [8, 4, 6, 0, 2])
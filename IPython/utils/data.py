@@ -13,7 +13,9 @@
 # Imports
 #-----------------------------------------------------------------------------
 
+import sys
 import types
+from itertools import islice
 
 #-----------------------------------------------------------------------------
 # Code
@@ -104,3 +106,49 @@ def chop(seq, size):
     return map(chunk,xrange(0,len(seq),size))
 
 
+def approx_sizeof(obj, max_items=100, max_depth=10, max_objects=10000,
+                  _seen=None):
+    """Return roughly how many bytes obj and the objects it holds take.
+
+    Objects with an integer ``nbytes`` attribute, like numpy arrays, report
+    that.  Lists, tuples, sets, dicts and the ``__dict__`` of instances are
+    measured recursively, down to max_depth levels.  For containers with more
+    than max_items items, only the first max_items are measured and the
+    total is scaled up, so that measuring a huge list stays cheap.  Once
+    max_objects objects have been looked at, the rest are not looked into.
+    Objects referenced more than once are only counted once.
+    """
+    if _seen is None:
+        _seen = set()
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+
+    try:
+        nbytes = getattr(obj, 'nbytes', None)
+    except Exception:
+        nbytes = None
+    if isinstance(nbytes, (int, long)) and not isinstance(obj, type):
+        return sys.getsizeof(obj, 0) + nbytes
+
+    size = sys.getsizeof(obj, 0)
+    if max_depth <= 0 or len(_seen) > max_objects:
+        return size
+    if isinstance(obj, dict):
+        items = obj.iteritems()
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        items = obj
+    elif isinstance(getattr(obj, '__dict__', None), dict) and \
+             not isinstance(obj, type):
+        return size + approx_sizeof(obj.__dict__, max_items, max_depth-1,
+                                    max_objects, _seen)
+    else:
+        return size
+
+    content = 0
+    for item in islice(items, max_items):
+        content += approx_sizeof(item, max_items, max_depth-1, max_objects,
+                                 _seen)
+    if len(obj) > max_items:
+        content = content * len(obj) // max_items
+    return size + content
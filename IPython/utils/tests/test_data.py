@@ -0,0 +1,51 @@
+"""Tests for the data structure utilities.
+"""
+#-----------------------------------------------------------------------------
+#  Copyright (C) 2010  The IPython Development Team
+#
+#  Distributed under the terms of the BSD License.  The full license is in
+#  the file COPYING.txt, distributed as part of this software.
+#-----------------------------------------------------------------------------
+
+#-----------------------------------------------------------------------------
+# Imports
+#-----------------------------------------------------------------------------
+# stdlib
+import sys
+
+# third party
+import nose.tools as nt
+
+# our own
+from IPython.testing import decorators as dec
+from ..data import approx_sizeof
+
+#-----------------------------------------------------------------------------
+# Test functions
+#-----------------------------------------------------------------------------
+
+def test_approx_sizeof():
+    s = 'x' * 10000
+    nt.assert_true(approx_sizeof(s) >= 10000)
+    # Contents of containers are counted, once per object.
+    nt.assert_true(approx_sizeof([s]) > approx_sizeof(s))
+    nt.assert_equal(approx_sizeof([s, s]) - approx_sizeof([s]),
+                    sys.getsizeof([s, s]) - sys.getsizeof([s]))
+    nt.assert_true(approx_sizeof({1: s}) > 10000)
+    # Large containers are sampled, but still counted in full.
+    big = ['%05i' % i for i in range(10000)]
+    nt.assert_true(approx_sizeof(big) > 10000 * sys.getsizeof('00000'))
+
+    class A(object):
+        pass
+    a = A()
+    a.data = s
+    nt.assert_true(approx_sizeof(a) > 10000)
+
+
+@dec.skipif_not_numpy
+def test_approx_sizeof_array():
+    import numpy
+    a = numpy.zeros(100000)
+    nt.assert_true(approx_sizeof(a) >= a.nbytes)
+    nt.assert_true(approx_sizeof([a]) >= a.nbytes)
@@ -0,0 +1,105 @@
+"""Tests for IPython.utils.timing.
+"""
+#-----------------------------------------------------------------------------
+#  Copyright (C) 2010  The IPython Development Team
+#
+#  Distributed under the terms of the BSD License.  The full license is in
+#  the file COPYING, distributed as part of this software.
+#-----------------------------------------------------------------------------
+
+#-----------------------------------------------------------------------------
+# Imports
+#-----------------------------------------------------------------------------
+
+import gc
+import time
+
+import nose.tools as nt
+
+from IPython.utils.timing import (TimeitResult, format_time, percentile,
+                                  timeit_runs)
+
+#-----------------------------------------------------------------------------
+# Tests
+#-----------------------------------------------------------------------------
+
+def make_inner(stmt=None):
+    """Return an inner function like the ones timeit.template defines."""
+    calls = []
+    def inner(_it, _timer):
+        _t0 = _timer()
+        for _i in _it:
+            calls.append(gc.isenabled())
+            if stmt is not None:
+                stmt()
+        return _timer() - _t0
+    return inner, calls
+
+
+def test_format_time():
+    nt.assert_equal(format_time(2.5), u'2.5 s')
+    nt.assert_equal(format_time(0.0123), u'12.3 ms')
+    nt.assert_equal(format_time(5.2e-8), u'52 ns')
+    nt.assert_equal(format_time(0), u'0 ns')
+
+
+def test_percentile():
+    values = range(1, 101)
+    nt.assert_equal(percentile(values, 0), 1)
+    nt.assert_equal(percentile(values, 100), 100)
+    nt.assert_almost_equal(percentile(values, 50), 50.5)
+    nt.assert_almost_equal(percentile(values, 99), 99.01)
+    nt.assert_equal(percentile([3], 99), 3)
+    nt.assert_raises(ValueError, percentile, [], 50)
+
+
+def test_timeit_result():
+    r = TimeitResult([0.4, 0.2, 0.3, 0.5], 100, stmt='pass')
+    nt.assert_equal(r.repeat, 4)
+    nt.assert_almost_equal(r.best, 0.002)
+    nt.assert_almost_equal(r.worst, 0.005)
+    nt.assert_almost_equal(r.mean, 0.0035)
+    nt.assert_almost_equal(r.median, 0.0035)
+    nt.assert_almost_equal(r.stdev, 0.00129099, 7)
+    nt.assert_almost_equal(r.percentile(0), 0.002)
+    nt.assert_almost_equal(r.percentile(100), 0.005)
+    nt.assert_equal(str(r), u'100 loops, best of 4: 2 ms per loop '
+                    u'(mean 3.5 ms, stdev 1.29 ms)')
+    nt.assert_equal(TimeitResult([1.0], 1).stdev, 0.0)
+    nt.assert_raises(ValueError, TimeitResult, [], 1)
+
+
+def test_timeit_result_compare_json():
+    fast = TimeitResult([0.1, 0.2], 10)
+    slow = TimeitResult([0.3, 0.2], 10)
+    nt.assert_true(fast < slow)
+    nt.assert_true(slow >= fast)
+    nt.assert_true(fast <= 0.01)
+    r = TimeitResult.from_json(slow.to_json())
+    nt.assert_equal((r.runs, r.loops), (slow.runs, slow.loops))
+    nt.assert_almost_equal(r.to_dict()['stdev'], slow.stdev)
+
+
+def test_timeit_runs():
+    inner, calls = make_inner()
+    r = timeit_runs(inner, 5, 4)
+    nt.assert_equal((r.loops, r.repeat, len(calls)), (5, 4, 20))
+    # The garbage collector is off during the runs, unless asked for.
+    nt.assert_false(True in calls)
+    nt.assert_true(gc.isenabled())
+    del calls[:]
+    timeit_runs(inner, 5, 1, gc_enabled=True)
+    nt.assert_false(False in calls)
+
+
+def test_timeit_calibration():
+    inner, calls = make_inner()
+    r = timeit_runs(inner, repeat=2, min_run_time=0.01)
+    nt.assert_true(r.loops > 1)
+    nt.assert_equal(r.loops, 10**len(str(r.loops)[1:]))
+    nt.assert_true(min(r.runs) >= 0.005)
+    # Slow statements run once per loop, within the budget.
+    inner, calls = make_inner(lambda: time.sleep(0.05))
+    r = timeit_runs(inner, repeat=100, budget=0.3)
+    nt.assert_equal(r.loops, 1)
+    nt.assert_true(r.repeat < 10)
@@ -14,7 +14,12 @@ Utilities for timing code execution.
 # Imports
 #-----------------------------------------------------------------------------
 
+import gc
+import itertools
+import json
+import math
 import time
+from timeit import default_timer
 
 #-----------------------------------------------------------------------------
 # Code
@@ -114,3 +119,228 @@ def timing(func,*args,**kw):
 
     return timings_out(1,func,*args,**kw)[0]
 
+
+# XXX: Unfortunately the unicode 'micro' symbol can cause problems in
+# certain terminals.  Until we figure out a robust way of auto-detecting if
+# the terminal can deal with it, use plain 'us' for microseconds.  I am
+# really NOT happy about disabling the proper 'micro' prefix, but crashing is
+# worse... If anyone knows what the right solution for this is, I'm all
+# ears...
+#
+# Note: using
+#
+# s = u'\xb5'
+# s.encode(sys.getdefaultencoding())
+#
+# is not sufficient, as I've seen terminals where that fails but
+# print s
+#
+# succeeds
+#
+# See bug: https://bugs.launchpad.net/ipython/+bug/348466
+
+#units = [u"s", u"ms",u'\xb5',"ns"]
+units = [u"s", u"ms",u'us',"ns"]
+
+scaling = [1, 1e3, 1e6, 1e9]
+
+
+def format_time(timespan, precision=3):
+    """Format a time in seconds with the unit that suits it best."""
+    if timespan > 0.0 and timespan < 1000.0:
+        order = min(-int(math.floor(math.log10(timespan)) // 3), 3)
+    elif timespan >= 1000.0:
+        order = 0
+    else:
+        order = 3
+    return u"%.*g %s" % (precision, timespan * scaling[order], units[order])
+
+
+def percentile(values, p):
+    """Return the p-th percentile of values, interpolating between them."""
+    values = sorted(values)
+    if not values:
+        raise ValueError('no values')
+    k = (len(values) - 1)*p/100.0
+    i = int(k)
+    if i + 1 >= len(values):
+        return values[-1]
+    return values[i] + (values[i+1] - values[i])*(k - i)
+
+
+class TimeitResult(object):
+    """The times of the runs of a statement, as measured by %timeit.
+
+    Each run executed the statement `loops` times, and `runs` holds the total
+    time of each run, in seconds.  The statistics (`best`, `worst`, `mean`,
+    `stdev`, `median` and `percentile`) are of the times per loop.
+
+    Results compare by their best time per loop, with each other or with a
+    time in seconds, as in ``assert new <= 1.1*old.best``.  `to_json` and
+    `from_json` store and load them.
+    """
+
+    def __init__(self, runs, loops, stmt=None, timer=None, gc_enabled=False,
+                 compile_time=None, precision=3):
+        if not runs:
+            raise ValueError('a TimeitResult needs at least one run')
+        self.runs = list(runs)
+        self.loops = loops
+        self.stmt = stmt
+        self.timer = timer
+        self.gc_enabled = gc_enabled
+        self.compile_time = compile_time
+        self.precision = precision
+
+    @property
+    def timings(self):
+        """The time per loop of each run, in seconds."""
+        return [t/self.loops for t in self.runs]
+
+    @property
+    def repeat(self):
+        return len(self.runs)
+
+    @property
+    def best(self):
+        return min(self.timings)
+
+    @property
+    def worst(self):
+        return max(self.timings)
+
+    @property
+    def mean(self):
+        return sum(self.timings)/len(self.runs)
+
+    @property
+    def stdev(self):
+        """The sample standard deviation, 0 for a single run."""
+        n = len(self.runs)
+        if n < 2:
+            return 0.0
+        mean = self.mean
+        return math.sqrt(sum([(t - mean)**2 for t in self.timings])/(n - 1))
+
+    @property
+    def median(self):
+        return self.percentile(50)
+
+    def percentile(self, p):
+        """Return the p-th percentile of the times per loop, interpolated."""
+        return percentile(self.timings, p)
+
+    def __str__(self):
+        fmt = lambda t: format_time(t, self.precision)
+        out = u"%d loops, best of %d: %s per loop" % (self.loops, self.repeat,
+                                                      fmt(self.best))
+        if self.repeat > 1:
+            out += u" (mean %s, stdev %s)" % (fmt(self.mean), fmt(self.stdev))
+        return out
+
+    def __repr__(self):
+        return '<TimeitResult : %s>' % self
+
+    def _best(self, other):
+        if isinstance(other, TimeitResult):
+            return other.best
+        return other
+
+    def __lt__(self, other):
+        return self.best < self._best(other)
+
+    def __le__(self, other):
+        return self.best <= self._best(other)
+
+    def __gt__(self, other):
+        return self.best > self._best(other)
+
+    def __ge__(self, other):
+        return self.best >= self._best(other)
+
+    def to_dict(self):
+        """Return the result as a dict, statistics included."""
+        return dict(runs=self.runs, loops=self.loops, stmt=self.stmt,
+                    timer=self.timer, gc_enabled=self.gc_enabled,
+                    compile_time=self.compile_time, best=self.best,
+                    worst=self.worst, mean=self.mean, stdev=self.stdev,
+                    median=self.median, p90=self.percentile(90))
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d['runs'], d['loops'], d.get('stmt'), d.get('timer'),
+                   d.get('gc_enabled', False), d.get('compile_time'))
+
+    def to_json(self, **kw):
+        """Return the result as JSON; keywords are passed to json.dumps."""
+        return json.dumps(self.to_dict(), **kw)
+
+    @classmethod
+    def from_json(cls, s):
+        return cls.from_dict(json.loads(s))
+
+
+def timeit_runs(inner, number=0, repeat=3, timer=default_timer,
+                gc_enabled=False, budget=None, min_run_time=0.2):
+    """Time a statement, returning a TimeitResult.
+
+    Parameters
+    ----------
+    inner : function
+      The function timeit.template defines for the statement, which runs
+      it once per item of its first argument and returns the time taken
+      according to its second.
+    number : int, optional
+      The number of loops of each run.  If 0, the number is calibrated,
+      going up in powers of ten so that a run takes at least min_run_time.
+    repeat : int, optional
+      The number of runs.
+    timer : function, optional
+      The clock to measure the runs with.
+    gc_enabled : bool, optional
+      Leave the garbage collector enabled during the runs.  As with the
+      timeit module, it is disabled by default.
+    budget : float, optional
+      A time limit in seconds for the calibration and the runs.  The runs
+      are then calibrated to fit in it, and no more are started once it is
+      spent, although there is always at least one.
+    """
+    def run(number):
+        it = itertools.repeat(None, number)
+        gcold = gc.isenabled()
+        if gc_enabled:
+            gc.enable()
+        else:
+            gc.disable()
+        try:
+            return inner(it, timer)
+        finally:
+            if gcold:
+                gc.enable()
+            else:
+                gc.disable()
+
+    start = default_timer()
+    if budget:
+        min_run_time = min(min_run_time, budget/(repeat + 1.0))
+    if number == 0:
+        number = 1
+        while True:
+            t = run(number)
+            if t >= min_run_time:
+                break
+            if budget and default_timer() - start >= budget:
+                break
+            # Guess the power of ten that gets there, from what a run
+            # took, without growing too much on an imprecise clock.
+            growth = 1
+            if t > 0:
+                growth = int(math.ceil(math.log10(min_run_time/t)))
+            number *= 10**min(max(growth, 1), 3)
+
+    runs = []
+    for i in range(repeat):
+        runs.append(run(number))
+        if budget and default_timer() - start >= budget:
+            break
+    return TimeitResult(runs, number, gc_enabled=gc_enabled)
@@ -54,9 +54,9 @@ class ClientCompleter(object):
 
         # Give the kernel up to 0.5s to respond
         for i in range(5):
-            rep = self.session.recv(self.socket)
-            if rep is not None and rep.msg_type == 'complete_reply':
-                matches = rep.content.matches
+            ident, rep = self.session.recv(self.socket)
+            if rep is not None and rep['msg_type'] == 'complete_reply':
+                matches = rep['content']['matches']
                 break
             time.sleep(0.1)
         else:
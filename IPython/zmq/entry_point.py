@@ -20,6 +20,7 @@ from IPython.utils.localinterfaces import LOCALHOST
 from displayhook import DisplayHook
 from heartbeat import Heartbeat
 from iostream import OutStream
+from msgtrace import MessageTracer, TRACE_LEVELS
 from parentpoller import ParentPollerUnix, ParentPollerWindows
 from session import Session
 
@@ -51,6 +52,18 @@ def make_argument_parser():
                         help='set the REQ channel port [default: random]')
     parser.add_argument('--hb', type=int, metavar='PORT', default=0,
                         help='set the heartbeat port [default: random]')
+    parser.add_argument('--json-wire', action='store_true',
+                        help='send messages in the single-frame JSON format '
+                        'of older clients')
+    parser.add_argument('--trace', choices=sorted(TRACE_LEVELS),
+                        default='off', help='print the messages the kernel '
+                        'sends and receives: one line for each (headers), or '
+                        'with their content (full) [default: off]')
+    parser.add_argument('--trace-sample', type=int, metavar='N', default=1,
+                        help='only trace one message in N [default: 1]')
+    parser.add_argument('--trace-size', type=int, metavar='CHARS',
+                        default=2000, help='maximum size of a traced message '
+                        '[default: 2000]')
 
     if sys.platform == 'win32':
         parser.add_argument('--interrupt', type=int, metavar='HANDLE', 
@@ -88,7 +101,14 @@ def make_kernel(namespace, kernel_factory,
     context = zmq.Context()
     # Uncomment this to try closing the context.
     # atexit.register(context.close)
-    session = Session(username=u'kernel')
+    wire_format = 'json' if namespace.json_wire else 'multipart'
+    tracer = None
+    if namespace.trace != 'off':
+        tracer = MessageTracer(TRACE_LEVELS[namespace.trace],
+                               sample=namespace.trace_sample,
+                               max_size=namespace.trace_size)
+    session = Session(username=u'kernel', wire_format=wire_format,
+                      tracer=tracer)
 
     reply_socket = context.socket(zmq.XREP)
     xrep_port = bind_port(reply_socket, namespace.ip, namespace.xrep)
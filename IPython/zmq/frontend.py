@@ -92,10 +92,10 @@ class Console(code.InteractiveConsole):
 
     def recv_output(self):
         while True:
-            omsg = self.session.recv(self.sub_socket)
-            if omsg is None:
+            ident, msg = self.session.recv(self.sub_socket)
+            if msg is None:
                 break
-            self.handle_output(omsg)
+            self.handle_output(session.Message(msg))
 
     def handle_reply(self, rep):
         # Handle any side effects on output channels
@@ -114,7 +114,9 @@ class Console(code.InteractiveConsole):
                 print >> sys.stderr, ab
 
     def recv_reply(self):
-        rep = self.session.recv(self.request_socket)
+        ident, rep = self.session.recv(self.request_socket)
+        if rep is not None:
+            rep = session.Message(rep)
         self.handle_reply(rep)
         return rep
 
@@ -133,8 +135,9 @@ class Console(code.InteractiveConsole):
                 time.sleep(0.05)
 
         # Send code execution message to kernel
-        omsg = self.session.send(self.request_socket,
-                                 'execute_request', dict(code=src))
+        omsg = session.Message(self.session.send(self.request_socket,
+                                                 'execute_request',
+                                                 dict(code=src)))
         self.messages[omsg.header.msg_id] = omsg
         
         # Fake asynchronicity by letting the user put ';' at the end of the line
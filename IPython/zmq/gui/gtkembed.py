@@ -44,17 +44,25 @@ class GTKEmbed(object):
         returns False to ensure it doesn't get run again by GTK.
         """
         self.gtk_main, self.gtk_main_quit = self._hijack_gtk()
-        gobject.timeout_add(int(1000*self.kernel._poll_interval),
-                            self.iterate_kernel)
+        if sys.platform == 'win32':
+            # GLib can't watch sockets on Windows, fall back to polling.
+            gobject.timeout_add(int(1000*self.kernel._poll_interval),
+                                self.iterate_kernel)
+        else:
+            gobject.io_add_watch(self.kernel.socket_fd(), gobject.IO_IN,
+                                 self.iterate_kernel)
+        # Handle anything that arrived before the watch was set up.
+        self.kernel.flush_requests()
         return False
         
-    def iterate_kernel(self):
-        """Run one iteration of the kernel and return True.
+    def iterate_kernel(self, *args):
+        """Handle all pending kernel requests and return True.
 
-        GTK timer functions must return True to be called again, so we make the
-        call to :meth:`do_one_iteration` and then return True for GTK.
+        GTK watch and timer functions must return True to be called again, so
+        we make the call to :meth:`flush_requests` and then return True for
+        GTK.
         """
-        self.kernel.do_one_iteration()
+        self.kernel.flush_requests()
         return True
 
     def stop(self):
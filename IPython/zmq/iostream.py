@@ -1,4 +1,5 @@
 import sys
+import threading
 import time
 from cStringIO import StringIO
 
@@ -10,17 +11,55 @@ from IPython.utils import io
 # Stream classes
 #-----------------------------------------------------------------------------
 
+def split_utf8(data, size):
+    """Split utf-8 encoded data in chunks of at most size bytes.
+
+    Chunks never end in the middle of a multi-byte character, so each one
+    can be decoded on its own.
+    """
+    chunks = []
+    start = 0
+    while len(data) - start > size:
+        end = start + size
+        # Back off over utf-8 continuation bytes, 10xxxxxx.
+        while end > start + 1 and (ord(data[end]) & 0xC0) == 0x80:
+            end -= 1
+        chunks.append(data[start:end])
+        start = end
+    chunks.append(data[start:])
+    return chunks
+
+
 class OutStream(object):
-    """A file like object that publishes the stream to a 0MQ PUB socket."""
+    """A file like object that publishes the stream to a 0MQ PUB socket.
+
+    Output is buffered and published by a background thread at most
+    ``flush_interval`` seconds after it was written, so that both sparse and
+    heavy output go out promptly and in few messages.  Once more than
+    ``max_buffer_size`` bytes are waiting, :meth:`write` publishes them itself
+    before returning: a PUB socket never blocks, so this is what slows down
+    code that produces output faster than it can be sent.  Data is split in
+    messages of at most ``max_message_size`` bytes.
+    """
 
     # The time interval between automatic flushes, in seconds.
     flush_interval = 0.05
+    # Number of buffered bytes above which write flushes immediately.
+    max_buffer_size = 1024*1024
+    # Maximum number of bytes of data in a single stream message.
+    max_message_size = 64*1024
 
     def __init__(self, session, pub_socket, name):
         self.session = session
         self.pub_socket = pub_socket
         self.name = name
         self.parent_header = {}
+        # Protects the buffer, and keeps the messages of concurrent flushes in
+        # order.
+        self._lock = threading.RLock()
+        # Set when the buffer has data that the flush thread should send.
+        self._pending = threading.Event()
+        self._flush_thread = None
         self._new_buffer()
 
     def set_parent(self, parent):
@@ -34,16 +73,15 @@ class OutStream(object):
         if self.pub_socket is None:
             raise ValueError(u'I/O operation on closed file')
         else:
-            data = self._buffer.getvalue()
-            if data:
-                content = {u'name':self.name, u'data':data}
-                msg = self.session.msg(u'stream', content=content,
-                                       parent=self.parent_header)
-                io.raw_print(msg)
-                self.pub_socket.send_json(msg)
-                
-                self._buffer.close()
-                self._new_buffer()
+            with self._lock:
+                data = self._buffer.getvalue()
+                if data:
+                    self._buffer.close()
+                    self._new_buffer()
+                    self._send(data)
+                else:
+                    # Nothing to send, let the flush thread go back to sleep.
+                    self._pending.clear()
 
     def isatty(self):
         return False
@@ -65,13 +103,21 @@ class OutStream(object):
             # into utf-8 for all frontends if we get unicode inputs.
             if type(string) == unicode:
                 string = string.encode('utf-8')
-                
-            self._buffer.write(string)
-            current_time = time.time()
-            if self._start <= 0:
-                self._start = current_time
-            elif current_time - self._start > self.flush_interval:
-                self.flush()
+            if not string:
+                return
+
+            with self._lock:
+                if self._size + len(string) > self.max_buffer_size:
+                    # Don't copy big writes into the buffer, send them along
+                    # with what is already there.
+                    self.flush()
+                    self._send(string)
+                    return
+                self._buffer.write(string)
+                self._size += len(string)
+            if not self._pending.isSet():
+                self._start_flush_thread()
+                self._pending.set()
 
     def writelines(self, sequence):
         if self.pub_socket is None:
@@ -82,4 +128,29 @@ class OutStream(object):
 
     def _new_buffer(self):
         self._buffer = StringIO()
-        self._start = -1
+        self._size = 0
+        self._pending.clear()
+
+    def _send(self, data):
+        """Publish data, in as many messages as max_message_size requires."""
+        for chunk in split_utf8(data, self.max_message_size):
+            content = {u'name':self.name, u'data':chunk}
+            self.session.send(self.pub_socket, u'stream', content=content,
+                              parent=self.parent_header)
+
+    def _start_flush_thread(self):
+        if self._flush_thread is None:
+            self._flush_thread = threading.Thread(target=self._flush_loop)
+            self._flush_thread.daemon = True
+            self._flush_thread.start()
+
+    def _flush_loop(self):
+        """Flush the buffer flush_interval seconds after it gets data."""
+        while self.pub_socket is not None:
+            self._pending.wait()
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except ValueError:
+                # The stream was closed.
+                break
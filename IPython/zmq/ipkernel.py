@@ -18,7 +18,10 @@ from __future__ import print_function
 # Standard library imports.
 import __builtin__
 import atexit
+import errno
+import select
 import sys
+import threading
 import time
 import traceback
 
@@ -64,7 +67,9 @@ class Kernel(Configurable):
     # a little if it's not enough after more interactive testing.
     _execute_sleep = Float(0.0005, config=True)
 
-    # Frequency of the kernel's event loop.
+    # Frequency of the kernel's event loop, for GUI toolkits that can only
+    # check for requests periodically.  The default loop and the toolkits
+    # that can watch a file descriptor handle requests as soon as they arrive.
     # Units are in seconds, kernel subclasses for GUI toolkits may need to
     # adapt to milliseconds.
     _poll_interval = Float(0.05, config=True)
@@ -75,6 +80,8 @@ class Kernel(Configurable):
     # the end of our shutdown process (which happens after the underlying
     # IPython shell's own shutdown).
     _shutdown_message = None
+    # Routing identity of the client that requested the shutdown.
+    _shutdown_ident = None
 
     # This is a dict of port number that the kernel is listening on. It is set
     # by record_ports and used by connect_request.
@@ -105,26 +112,12 @@ class Kernel(Configurable):
 
     def do_one_iteration(self):
         """Do one iteration of the kernel's evaluation loop.
+
+        Returns True if a request was handled, and False if none was waiting.
         """
-        try:
-            ident = self.reply_socket.recv(zmq.NOBLOCK)
-        except zmq.ZMQError, e:
-            if e.errno == zmq.EAGAIN:
-                return
-            else:
-                raise
-        # This assert will raise in versions of zeromq 2.0.7 and lesser.
-        # We now require 2.0.8 or above, so we can uncomment for safety.
-        assert self.reply_socket.rcvmore(), "Missing message part."
-        msg = self.reply_socket.recv_json()
-        
-        # Print some info about this message and leave a '--->' marker, so it's
-        # easier to trace visually the message chain when debugging.  Each
-        # handler prints its message at the end.
-        # Eventually we'll move these from stdout to a logger.
-        io.raw_print('\n*** MESSAGE TYPE:', msg['msg_type'], '***')
-        io.raw_print('   Content: ', msg['content'],
-                     '\n   --->\n   ', sep='', end='')
+        ident, msg = self.session.recv(self.reply_socket, zmq.NOBLOCK)
+        if msg is None:
+            return False
 
         # Find and call actual handler for message
         handler = self.handlers.get(msg['msg_type'], None)
@@ -140,14 +133,53 @@ class Kernel(Configurable):
             # We do a normal, clean exit, which allows any actions registered
             # via atexit (such as history saving) to take place.
             sys.exit(0)
+        return True
 
+    def flush_requests(self):
+        """Handle all the requests waiting on the reply socket.
+
+        A single wakeup from the event loop may stand for several messages, so
+        this is what event loops should call when the socket is readable.
+        """
+        while True:
+            while self.do_one_iteration():
+                pass
+            # Messages that arrive while we handle others don't make the edge
+            # triggered descriptor readable again.  Reading zmq.EVENTS both
+            # tells us about them and re-arms the descriptor.
+            if not self.reply_socket.getsockopt(zmq.EVENTS) & zmq.POLLIN:
+                break
+
+    def socket_fd(self):
+        """Return the file descriptor that signals activity on the reply
+        socket, for event loops that can watch file descriptors.
+
+        This descriptor is edge triggered: once it becomes readable, the
+        event loop must call :meth:`flush_requests`, which drains the socket
+        and so re-arms it.
+        """
+        return self.reply_socket.getsockopt(zmq.FD)
 
     def start(self):
         """ Start the kernel main loop.
+
+        The kernel blocks in :meth:`zmq.Poller.poll` until requests arrive and
+        handles them immediately, so an idle kernel does not wake up at all.
         """
+        poller = zmq.Poller()
+        poller.register(self.reply_socket, zmq.POLLIN)
         while True:
-            time.sleep(self._poll_interval)
-            self.do_one_iteration()
+            try:
+                poller.poll()
+            except KeyboardInterrupt:
+                # Nothing is running, so there is nothing to interrupt.
+                io.raw_print_err('KeyboardInterrupt caught in idle kernel')
+                continue
+            except zmq.ZMQError, e:
+                if e.errno == errno.EINTR:
+                    continue
+                raise
+            self.flush_requests()
 
     def record_ports(self, xrep_port, pub_port, req_port, hb_port):
         """Record the ports that this kernel is using.
@@ -169,17 +201,13 @@ class Kernel(Configurable):
     def _publish_pyin(self, code, parent):
         """Publish the code request on the pyin stream."""
 
-        pyin_msg = self.session.msg(u'pyin',{u'code':code}, parent=parent)
-        self.pub_socket.send_json(pyin_msg)
+        self.session.send(self.pub_socket, u'pyin', {u'code':code},
+                          parent=parent)
 
     def execute_request(self, ident, parent):
         
-        status_msg = self.session.msg(
-            u'status',
-            {u'execution_state':u'busy'},
-            parent=parent
-        )
-        self.pub_socket.send_json(status_msg)
+        self.session.send(self.pub_socket, u'status',
+                          {u'execution_state':u'busy'}, parent=parent)
         
         try:
             content = parent[u'content']
@@ -265,7 +293,6 @@ class Kernel(Configurable):
 
         # Send the reply.
         reply_msg = self.session.msg(u'execute_reply', reply_content, parent)
-        io.raw_print(reply_msg)
 
         # Flush output before sending the reply.
         sys.stdout.flush()
@@ -276,57 +303,51 @@ class Kernel(Configurable):
         if self._execute_sleep:
             time.sleep(self._execute_sleep)
         
-        self.reply_socket.send(ident, zmq.SNDMORE)
-        self.reply_socket.send_json(reply_msg)
+        self.session.send(self.reply_socket, reply_msg, ident=ident)
         if reply_msg['content']['status'] == u'error':
             self._abort_queue()
 
-        status_msg = self.session.msg(
-            u'status',
-            {u'execution_state':u'idle'},
-            parent=parent
-        )
-        self.pub_socket.send_json(status_msg)
+        self.session.send(self.pub_socket, u'status',
+                          {u'execution_state':u'idle'}, parent=parent)
 
     def complete_request(self, ident, parent):
         txt, matches = self._complete(parent)
         matches = {'matches' : matches,
                    'matched_text' : txt,
+                   'incomplete' : self.shell.Completer.incomplete,
                    'status' : 'ok'}
-        completion_msg = self.session.send(self.reply_socket, 'complete_reply',
-                                           matches, parent, ident)
-        io.raw_print(completion_msg)
+        self.session.send(self.reply_socket, 'complete_reply', matches,
+                          parent, ident)
 
     def object_info_request(self, ident, parent):
         object_info = self.shell.object_inspect(parent['content']['oname'])
         # Before we send this object over, we scrub it for JSON usage
         oinfo = json_clean(object_info)
-        msg = self.session.send(self.reply_socket, 'object_info_reply',
-                                oinfo, parent, ident)
-        io.raw_print(msg)
+        self.session.send(self.reply_socket, 'object_info_reply', oinfo,
+                          parent, ident)
 
     def history_request(self, ident, parent):
         output = parent['content']['output']
         index = parent['content']['index']
         raw = parent['content']['raw']
-        hist = self.shell.get_history(index=index, raw=raw, output=output)
+        hist = self.shell.history_manager.get_history(index=index, raw=raw,
+                                                     output=output)
         content = {'history' : hist}
-        msg = self.session.send(self.reply_socket, 'history_reply',
-                                content, parent, ident)
-        io.raw_print(msg)
+        self.session.send(self.reply_socket, 'history_reply', content,
+                          parent, ident)
 
     def connect_request(self, ident, parent):
         if self._recorded_ports is not None:
             content = self._recorded_ports.copy()
         else:
             content = {}
-        msg = self.session.send(self.reply_socket, 'connect_reply',
-                                content, parent, ident)
-        io.raw_print(msg)
+        self.session.send(self.reply_socket, 'connect_reply', content,
+                          parent, ident)
 
     def shutdown_request(self, ident, parent):
         self.shell.exit_now = True
         self._shutdown_message = self.session.msg(u'shutdown_reply', parent['content'], parent)
+        self._shutdown_ident = ident
         sys.exit(0)
 
     #---------------------------------------------------------------------------
@@ -335,22 +356,15 @@ class Kernel(Configurable):
 
     def _abort_queue(self):
         while True:
-            try:
-                ident = self.reply_socket.recv(zmq.NOBLOCK)
-            except zmq.ZMQError, e:
-                if e.errno == zmq.EAGAIN:
-                    break
-            else:
-                assert self.reply_socket.rcvmore(), \
-                       "Unexpected missing message part."
-                msg = self.reply_socket.recv_json()
-            io.raw_print("Aborting:\n", Message(msg))
+            # Only the header is needed to abort a request.
+            ident, msg = self.session.recv(self.reply_socket, zmq.NOBLOCK,
+                                           content=False)
+            if msg is None:
+                break
             msg_type = msg['msg_type']
             reply_type = msg_type.split('_')[0] + '_reply'
-            reply_msg = self.session.msg(reply_type, {'status' : 'aborted'}, msg)
-            io.raw_print(reply_msg)
-            self.reply_socket.send(ident,zmq.SNDMORE)
-            self.reply_socket.send_json(reply_msg)
+            self.session.send(self.reply_socket, reply_type,
+                              {'status' : 'aborted'}, msg, ident)
             # We need to wait a bit for requests to come in. This can probably
             # be set shorter for true asynchronous clients.
             time.sleep(0.1)
@@ -362,11 +376,10 @@ class Kernel(Configurable):
 
         # Send the input request.
         content = dict(prompt=prompt)
-        msg = self.session.msg(u'input_request', content, parent)
-        self.req_socket.send_json(msg)
+        self.session.send(self.req_socket, u'input_request', content, parent)
 
         # Await a response.
-        reply = self.req_socket.recv_json()
+        ident, reply = self.session.recv(self.req_socket, 0)
         try:
             value = reply['content']['value']
         except:
@@ -423,9 +436,9 @@ class Kernel(Configurable):
         """
         # io.rprint("Kernel at_shutdown") # dbg
         if self._shutdown_message is not None:
-            self.reply_socket.send_json(self._shutdown_message)
-            self.pub_socket.send_json(self._shutdown_message)
-            io.raw_print(self._shutdown_message)
+            self.session.send(self.reply_socket, self._shutdown_message,
+                              ident=self._shutdown_ident)
+            self.session.send(self.pub_socket, self._shutdown_message)
             # A very short sleep to give zmq time to flush its message buffers
             # before Python truly shuts down.
             time.sleep(0.01)
@@ -442,10 +455,12 @@ class QtKernel(Kernel):
 
         self.app = get_app_qt4([" "])
         self.app.setQuitOnLastWindowClosed(False)
-        self.timer = QtCore.QTimer()
-        self.timer.timeout.connect(self.do_one_iteration)
-        # Units for the timer are in milliseconds
-        self.timer.start(1000*self._poll_interval)
+        # Qt tells us as soon as the reply socket has activity.
+        self.notifier = QtCore.QSocketNotifier(self.socket_fd(),
+                                               QtCore.QSocketNotifier.Read)
+        self.notifier.activated.connect(lambda fd: self.flush_requests())
+        # Handle anything that arrived before the notifier was set up.
+        QtCore.QTimer.singleShot(0, self.flush_requests)
         start_event_loop_qt4(self.app)
 
 
@@ -458,30 +473,44 @@ class WxKernel(Kernel):
         import wx
         from IPython.lib.guisupport import start_event_loop_wx
 
-        doi = self.do_one_iteration
-         # Wx uses milliseconds
-        poll_interval = int(1000*self._poll_interval)
-
-        # We have to put the wx.Timer in a wx.Frame for it to fire properly.
-        # We make the Frame hidden when we create it in the main app below.
-        class TimerFrame(wx.Frame):
-            def __init__(self, func):
-                wx.Frame.__init__(self, None, -1)
-                self.timer = wx.Timer(self)
-                # Units for the timer are in milliseconds
-                self.timer.Start(poll_interval)
-                self.Bind(wx.EVT_TIMER, self.on_timer)
-                self.func = func
-
-            def on_timer(self, event):
-                self.func()
-
-        # We need a custom wx.App to create our Frame subclass that has the
-        # wx.Timer to drive the ZMQ event loop.
+        kernel = self
+
+        # Wx can't watch file descriptors, so a helper thread waits on the
+        # reply socket's descriptor and has the wx loop flush the requests.
+        # The thread waits until that is done before watching again, since the
+        # descriptor stays readable until the socket has been drained.
+        class SocketWatcher(threading.Thread):
+            def __init__(self):
+                threading.Thread.__init__(self)
+                self.daemon = True
+                self.fd = kernel.socket_fd()
+                self.flushed = threading.Event()
+
+            def run(self):
+                while True:
+                    try:
+                        select.select([self.fd], [], [])
+                    except select.error, e:
+                        if e.args[0] == errno.EINTR:
+                            continue
+                        raise
+                    self.flushed.clear()
+                    wx.CallAfter(self.flush)
+                    self.flushed.wait()
+
+            def flush(self):
+                try:
+                    kernel.flush_requests()
+                finally:
+                    self.flushed.set()
+
+        # We need a custom wx.App to start the watcher once the wx event loop
+        # can process the calls it posts.
         class IPWxApp(wx.App):
             def OnInit(self):
-                self.frame = TimerFrame(doi)
-                self.frame.Show(False)
+                self.watcher = SocketWatcher()
+                self.watcher.start()
+                wx.CallAfter(kernel.flush_requests)
                 return True
 
         # The redirect=False here makes sure that wx doesn't replace
@@ -497,7 +526,7 @@ class TkKernel(Kernel):
         """Start a Tk enabled event loop."""
 
         import Tkinter
-        doi = self.do_one_iteration
+        flush = self.flush_requests
         # Tk uses milliseconds
         poll_interval = int(1000*self._poll_interval)
         # For Tkinter, we create a Tk object and call its withdraw method.
@@ -515,7 +544,25 @@ class TkKernel(Kernel):
                 self.on_timer()  # Call it once to get things going.
                 self.app.mainloop()
 
-        self.timer = Timer(doi)
+        class FileHandler(Timer):
+            def __init__(self, func, fd):
+                Timer.__init__(self, func)
+                self.fd = fd
+
+            def on_readable(self, fd, mask):
+                self.func()
+
+            def start(self):
+                self.app.tk.createfilehandler(self.fd, Tkinter.READABLE,
+                                              self.on_readable)
+                self.app.after_idle(self.func)
+                self.app.mainloop()
+
+        # Tk can only watch file descriptors on Unix.
+        if hasattr(Tkinter.tkinter, 'createfilehandler'):
+            self.timer = FileHandler(flush, self.socket_fd())
+        else:
+            self.timer = Timer(flush)
         self.timer.start()
 
 
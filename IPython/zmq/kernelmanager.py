@@ -330,7 +330,7 @@ class XReqSocketChannel(ZmqSocketChannel):
             self._handle_recv()
 
     def _handle_recv(self):
-        msg = self.socket.recv_json()
+        ident, msg = self.session.recv(self.socket, 0)
         self.call_handlers(msg)
 
     def _handle_send(self):
@@ -339,7 +339,7 @@ class XReqSocketChannel(ZmqSocketChannel):
         except Empty:
             pass
         else:
-            self.socket.send_json(msg)
+            self.session.send(self.socket, msg)
         if self.command_queue.empty():
             self.drop_io_state(POLLOUT)
 
@@ -424,13 +424,13 @@ class SubSocketChannel(ZmqSocketChannel):
         # Get all of the messages we can
         while True:
             try:
-                msg = self.socket.recv_json(zmq.NOBLOCK)
+                ident, msg = self.session.recv(self.socket, zmq.NOBLOCK)
             except zmq.ZMQError:
-                # Check the errno?
                 # Will this trigger POLLERR?
                 break
-            else:
-                self.call_handlers(msg)
+            if msg is None:
+                break
+            self.call_handlers(msg)
 
     def _flush(self):
         """Callback for :method:`self.flush`."""
@@ -486,7 +486,7 @@ class RepSocketChannel(ZmqSocketChannel):
             self._handle_recv()
 
     def _handle_recv(self):
-        msg = self.socket.recv_json()
+        ident, msg = self.session.recv(self.socket, 0)
         self.call_handlers(msg)
 
     def _handle_send(self):
@@ -495,7 +495,7 @@ class RepSocketChannel(ZmqSocketChannel):
         except Empty:
             pass
         else:
-            self.socket.send_json(msg)
+            self.session.send(self.socket, msg)
         if self.msg_queue.empty():
             self.drop_io_state(POLLOUT)
 
@@ -0,0 +1,105 @@
+"""Tracing of the messages a kernel sends and receives, for debugging.
+
+Tracing is off unless a :class:`MessageTracer` is given to the
+:class:`~IPython.zmq.session.Session`, which is what the ``--trace`` option
+of the kernel entry points does.  When it is off, no message is ever
+formatted.
+"""
+#-----------------------------------------------------------------------------
+#  Copyright (C) 2010  The IPython Development Team
+#
+#  Distributed under the terms of the BSD License.  The full license is in
+#  the file COPYING.txt, distributed as part of this software.
+#-----------------------------------------------------------------------------
+
+#-----------------------------------------------------------------------------
+# Imports
+#-----------------------------------------------------------------------------
+
+import pprint
+import sys
+import time
+
+#-----------------------------------------------------------------------------
+# Constants
+#-----------------------------------------------------------------------------
+
+# Trace levels.
+TRACE_OFF = 0
+# One line per message: direction, type and ids.
+TRACE_HEADERS = 1
+# The whole message, with long strings and the total size capped.
+TRACE_FULL = 2
+
+TRACE_LEVELS = {'off': TRACE_OFF, 'headers': TRACE_HEADERS,
+                'full': TRACE_FULL}
+
+#-----------------------------------------------------------------------------
+# Classes and functions
+#-----------------------------------------------------------------------------
+
+def _shorten(obj, size):
+    """Return a copy of obj with all strings longer than size cut short.
+
+    This way formatting a message never has to go through a huge string.
+    """
+    if isinstance(obj, basestring):
+        if len(obj) > size:
+            return obj[:size] + '...[%i chars]' % len(obj)
+        return obj
+    if isinstance(obj, dict):
+        return dict((k, _shorten(v, size)) for (k, v) in obj.iteritems())
+    if isinstance(obj, (list, tuple)):
+        return [_shorten(v, size) for v in obj]
+    return obj
+
+
+class MessageTracer(object):
+    """Write a trace of kernel messages to a stream.
+
+    Parameters
+    ----------
+    level : int
+        One of TRACE_OFF, TRACE_HEADERS or TRACE_FULL.
+    stream : file, optional
+        Where to write the trace, sys.__stdout__ by default.
+    sample : int, optional
+        Only trace one message out of every ``sample``.
+    max_size : int, optional
+        Maximum number of characters written for a single message.
+    """
+
+    def __init__(self, level=TRACE_HEADERS, stream=None, sample=1,
+                 max_size=2000):
+        self.level = level
+        self.stream = sys.__stdout__ if stream is None else stream
+        self.sample = max(1, sample)
+        self.max_size = max_size
+        self._count = 0
+
+    def trace(self, direction, msg):
+        """Trace a message going in ``direction`` ('send' or 'recv')."""
+        if not self.level:
+            return
+        self._count += 1
+        if self._count % self.sample:
+            return
+        header = msg.get('header', {})
+        parent = msg.get('parent_header', {})
+        line = '[%.6f %s] %s msg_id=%s parent=%s' % (time.time(), direction,
+            msg.get('msg_type'), header.get('msg_id'), parent.get('msg_id'))
+        if self.level >= TRACE_FULL:
+            content = pprint.pformat(_shorten(msg.get('content'),
+                                              self.max_size))
+            if len(content) > self.max_size:
+                content = content[:self.max_size] + '\n...[truncated]'
+            nbufs = len(msg.get('buffers') or [])
+            if nbufs:
+                line += ' buffers=%i' % nbufs
+            line += '\n' + content
+        try:
+            self.stream.write(line + '\n')
+            self.stream.flush()
+        except (IOError, ValueError):
+            # The stream may be gone if we are shutting down.
+            pass
@@ -1,8 +1,10 @@
 import os
 import uuid
 import pprint
+import threading
 
 import zmq
+from zmq.utils import jsonapi
 
 class Message(object):
     """A simple message object that maps dict keys to attributes.
@@ -34,9 +36,10 @@ class Message(object):
         return self.__dict__[k]
 
 
-def msg_header(msg_id, username, session):
+def msg_header(msg_id, msg_type, username, session):
     return {
         'msg_id' : msg_id,
+        'msg_type' : msg_type,
         'username' : username,
         'session' : session
     }
@@ -62,48 +65,216 @@ def extract_header(msg_or_header):
     return h
 
 
+def _frame_bytes(frame):
+    """Return the bytes of a frame received with or without copy=False."""
+    return getattr(frame, 'bytes', frame)
+
+
+def _frame_buffer(frame):
+    """Return a buffer on a frame's memory, without copying it if possible."""
+    return getattr(frame, 'buffer', frame)
+
+
+# Frame separating the routing identities from the message in the multipart
+# wire format.
+DELIM = "<IDS|MSG>"
+
+
 class Session(object):
+    """Build, send and receive messages.
+
+    Two wire formats are supported.  In the 'multipart' format (the default)
+    a message goes out as the frames::
+
+        [ident, ...] DELIM header parent_header metadata content [buffer, ...]
+
+    where header (which includes the msg_type), parent_header, metadata and
+    content are each JSON encoded, and the buffers are raw binary data that is
+    sent without copying and never JSON encoded.  Only the frames a receiver
+    actually needs have to be decoded.
+
+    In the 'json' format, used by older clients, the whole message is sent as
+    a single JSON frame after the identities, and buffers are not supported.
+
+    Either format is understood on receipt; ``wire_format`` only determines
+    how messages are sent.
+
+    If a :class:`~IPython.zmq.msgtrace.MessageTracer` is given as
+    ``tracer``, every message sent or received is passed to it.
+
+    Sending and message numbering are serialized with a lock, so that a
+    socket can be shared by threads as long as they only send on it through
+    the same Session (the output streams flush from a background thread).
+    """
 
-    def __init__(self, username=os.environ.get('USER','username'), session=None):
+    def __init__(self, username=os.environ.get('USER','username'), session=None,
+                 wire_format='multipart', tracer=None):
         self.username = username
         if session is None:
             self.session = str(uuid.uuid4())
         else:
             self.session = session
+        if wire_format not in ('multipart', 'json'):
+            raise ValueError('Unknown wire format: %r' % wire_format)
+        self.wire_format = wire_format
+        self.tracer = tracer
         self.msg_id = 0
+        self._lock = threading.Lock()
 
-    def msg_header(self):
-        h = msg_header(self.msg_id, self.username, self.session)
-        self.msg_id += 1
+    def msg_header(self, msg_type):
+        with self._lock:
+            h = msg_header(self.msg_id, msg_type, self.username, self.session)
+            self.msg_id += 1
         return h
 
-    def msg(self, msg_type, content=None, parent=None):
+    def msg(self, msg_type, content=None, parent=None, metadata=None,
+            buffers=None):
         msg = {}
-        msg['header'] = self.msg_header()
+        msg['header'] = self.msg_header(msg_type)
         msg['parent_header'] = {} if parent is None else extract_header(parent)
         msg['msg_type'] = msg_type
         msg['content'] = {} if content is None else content
+        msg['metadata'] = {} if metadata is None else metadata
+        msg['buffers'] = [] if buffers is None else list(buffers)
+        return msg
+
+    def serialize(self, msg, ident=None):
+        """Return the list of frames that make up msg on the wire.
+
+        Parameters
+        ----------
+        msg : dict
+            A message, as made by :meth:`msg`.
+        ident : bytes or list of bytes, optional
+            The routing identities to prepend to the message.
+        """
+        if ident is None:
+            frames = []
+        elif isinstance(ident, (list, tuple)):
+            frames = list(ident)
+        else:
+            frames = [ident]
+        buffers = msg.get('buffers') or []
+        if self.wire_format == 'json':
+            if buffers:
+                raise ValueError('The json wire format does not support '
+                                 'binary buffers.')
+            whole = dict(header=msg['header'],
+                         parent_header=msg['parent_header'],
+                         msg_type=msg['msg_type'], content=msg['content'])
+            if msg.get('metadata'):
+                whole['metadata'] = msg['metadata']
+            frames.append(jsonapi.dumps(whole))
+            return frames
+        header = msg['header']
+        if header.get('msg_type') != msg['msg_type']:
+            header = dict(header, msg_type=msg['msg_type'])
+        frames.append(DELIM)
+        frames.append(jsonapi.dumps(header))
+        frames.append(jsonapi.dumps(msg['parent_header']))
+        frames.append(jsonapi.dumps(msg.get('metadata') or {}))
+        frames.append(jsonapi.dumps(msg['content']))
+        frames.extend(buffers)
+        return frames
+
+    def unserialize(self, frames, content=True):
+        """Turn a list of frames into an (idents, msg) tuple.
+
+        Parameters
+        ----------
+        frames : list
+            The frames, as bytes or as zmq messages received with copy=False.
+            In the latter case the message buffers are memory views on the
+            received frames, and are never copied.
+        content : bool, optional
+            If False, the content is left undecoded in msg['content'], for
+            receivers that only need the header; :meth:`unpack_content`
+            decodes it later.
+        """
+        # Identities are short, so only frames of the delimiter's length need
+        # to be looked at (and copied, for zero-copy frames).
+        for i, frame in enumerate(frames):
+            if len(frame) == len(DELIM) and _frame_bytes(frame) == DELIM:
+                break
+        else:
+            # Old single-frame JSON message.
+            idents = [_frame_bytes(f) for f in frames[:-1]]
+            msg = jsonapi.loads(_frame_bytes(frames[-1]))
+            msg.setdefault('metadata', {})
+            msg['buffers'] = []
+            return idents, msg
+        idents = [_frame_bytes(f) for f in frames[:i]]
+        header, parent, metadata, raw_content = frames[i+1:i+5]
+        msg = {}
+        msg['header'] = jsonapi.loads(_frame_bytes(header))
+        msg['msg_type'] = msg['header']['msg_type']
+        msg['parent_header'] = jsonapi.loads(_frame_bytes(parent))
+        msg['metadata'] = jsonapi.loads(_frame_bytes(metadata))
+        msg['content'] = _frame_bytes(raw_content)
+        if content:
+            self.unpack_content(msg)
+        msg['buffers'] = [_frame_buffer(f) for f in frames[i+5:]]
+        return idents, msg
+
+    def unpack_content(self, msg):
+        """Decode the content of a message unserialized with content=False.
+        """
+        if isinstance(msg['content'], basestring):
+            msg['content'] = jsonapi.loads(msg['content'])
+        return msg
+
+    def send(self, socket, msg_or_type, content=None, parent=None, ident=None,
+             metadata=None, buffers=None):
+        """Build and send a message, returning it.
+
+        Parameters
+        ----------
+        socket : zmq.Socket
+            The socket to send the message on.
+        msg_or_type : dict or str
+            Either a complete message, or the msg_type to build one with,
+            together with content, parent, metadata and buffers.
+        ident : bytes or list of bytes, optional
+            The routing identities for the message.
+        """
+        if isinstance(msg_or_type, dict):
+            msg = msg_or_type
+        else:
+            msg = self.msg(msg_or_type, content, parent, metadata, buffers)
+        frames = self.serialize(msg, ident)
+        # The json format refuses buffers, so they are always last here.
+        nbufs = len(msg.get('buffers') or [])
+        nframes = len(frames)
+        with self._lock:
+            for i, frame in enumerate(frames):
+                flags = zmq.SNDMORE if i < nframes-1 else 0
+                if i >= nframes-nbufs:
+                    # Binary buffers can be big, don't copy them.
+                    socket.send(frame, flags, copy=False)
+                else:
+                    socket.send(frame, flags)
+        if self.tracer is not None:
+            self.tracer.trace('send', msg)
         return msg
 
-    def send(self, socket, msg_type, content=None, parent=None, ident=None):
-        msg = self.msg(msg_type, content, parent)
-        if ident is not None:
-            socket.send(ident, zmq.SNDMORE)
-        socket.send_json(msg)
-        omsg = Message(msg)
-        return omsg
+    def recv(self, socket, mode=zmq.NOBLOCK, content=True, copy=True):
+        """Receive a message, returning an (idents, msg) tuple.
 
-    def recv(self, socket, mode=zmq.NOBLOCK):
+        If mode is zmq.NOBLOCK and no message is waiting, (None, None) is
+        returned.  With copy=False the message buffers are views on the
+        received frames.
+        """
         try:
-            msg = socket.recv_json(mode)
+            frames = socket.recv_multipart(mode, copy=copy)
         except zmq.ZMQError, e:
             if e.errno == zmq.EAGAIN:
-                # We can convert EAGAIN to None as we know in this case
-                # recv_json won't return None.
-                return None
+                return None, None
             else:
                 raise
-        return Message(msg)
+        idents, msg = self.unserialize(frames, content)
+        if self.tracer is not None:
+            self.tracer.trace('recv', msg)
+        return idents, msg
 
 def test_msg2obj():
     am = dict(x=1)
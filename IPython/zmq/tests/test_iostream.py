@@ -0,0 +1,93 @@
+"""Tests for the 0MQ output streams.
+"""
+#-----------------------------------------------------------------------------
+#  Copyright (C) 2010  The IPython Development Team
+#
+#  Distributed under the terms of the BSD License.  The full license is in
+#  the file COPYING.txt, distributed as part of this software.
+#-----------------------------------------------------------------------------
+
+import time
+
+import nose.tools as nt
+
+from ..iostream import OutStream, split_utf8
+
+#-----------------------------------------------------------------------------
+# Tests
+#-----------------------------------------------------------------------------
+
+class RecordingSession(object):
+    """A stand-in for a Session that records the stream data it sends."""
+
+    def __init__(self):
+        self.sent = []
+
+    def send(self, socket, msg_type, content=None, parent=None):
+        self.sent.append(content['data'])
+
+
+def make_stream():
+    session = RecordingSession()
+    stream = OutStream(session, object(), u'stdout')
+    return session, stream
+
+
+def test_split_utf8():
+    data = (u'a\xe9' * 10).encode('utf-8')
+    chunks = split_utf8(data, 4)
+    nt.assert_equal(''.join(chunks), data)
+    for chunk in chunks:
+        nt.assert_true(len(chunk) <= 4)
+        chunk.decode('utf-8')
+
+
+def test_timed_flush():
+    session, stream = make_stream()
+    stream.flush_interval = 0.01
+    stream.write('hello')
+    # Nothing else is written, the flush thread must send it anyway.
+    for i in range(100):
+        if session.sent:
+            break
+        time.sleep(0.01)
+    nt.assert_equal(session.sent, ['hello'])
+
+
+def test_coalesce():
+    session, stream = make_stream()
+    stream.flush_interval = 10
+    for i in range(1000):
+        stream.write('%i\n' % i)
+    stream.flush()
+    nt.assert_equal(len(session.sent), 1)
+
+
+def test_big_write():
+    session, stream = make_stream()
+    stream.flush_interval = 10
+    stream.max_buffer_size = 100
+    stream.max_message_size = 40
+    stream.write('a' * 10)
+    stream.write('b' * 100)
+    nt.assert_equal(session.sent, ['a' * 10, 'b' * 40, 'b' * 40, 'b' * 20])
+
+
+def test_idle_after_empty_write():
+    session, stream = make_stream()
+    stream.flush_interval = 0.01
+    stream.write('hello')
+    stream.flush()
+    stream.write('')
+    stream.write(u'')
+    flushes = []
+    flush = stream.flush
+    def counting_flush():
+        flushes.append(1)
+        flush()
+    stream.flush = counting_flush
+    time.sleep(0.2)
+    # The flush thread is blocked waiting for data, not polling.
+    nt.assert_false(stream._pending.isSet())
+    nt.assert_true(len(flushes) <= 1)
+    nt.assert_equal(session.sent, ['hello'])
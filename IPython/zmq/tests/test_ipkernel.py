@@ -0,0 +1,103 @@
+"""Tests for the kernel's event loop.
+"""
+#-----------------------------------------------------------------------------
+#  Copyright (C) 2010  The IPython Development Team
+#
+#  Distributed under the terms of the BSD License.  The full license is in
+#  the file COPYING.txt, distributed as part of this software.
+#-----------------------------------------------------------------------------
+
+import threading
+import time
+
+import nose.tools as nt
+
+import zmq
+
+from IPython.config.configurable import Configurable
+from ..ipkernel import Kernel
+from ..session import Session
+
+#-----------------------------------------------------------------------------
+# Tests
+#-----------------------------------------------------------------------------
+
+class StopLoop(Exception):
+    pass
+
+
+class LoopKernel(Kernel):
+    """A Kernel without a shell, which records the iterations of its loop."""
+
+    def __init__(self, **kwargs):
+        Configurable.__init__(self, **kwargs)
+        self.iterations = 0
+        self.handled = []
+        self.handlers = {'ping_request': self.ping_request,
+                         'stop_request': self.stop_request}
+
+    def do_one_iteration(self):
+        self.iterations += 1
+        return super(LoopKernel, self).do_one_iteration()
+
+    def ping_request(self, ident, msg):
+        self.handled.append(msg['msg_type'])
+
+    def stop_request(self, ident, msg):
+        raise StopLoop()
+
+
+def start_kernel():
+    """Start a LoopKernel in a thread, returning it and a client socket."""
+    ctx = zmq.Context.instance()
+    reply_socket = ctx.socket(zmq.XREP)
+    port = reply_socket.bind_to_random_port('tcp://127.0.0.1')
+    client = ctx.socket(zmq.XREQ)
+    client.connect('tcp://127.0.0.1:%i' % port)
+    kernel = LoopKernel(session=Session(), reply_socket=reply_socket)
+    kernel.shell = get_ipython()
+    def run():
+        try:
+            kernel.start()
+        except StopLoop:
+            pass
+    kernel.thread = threading.Thread(target=run)
+    kernel.thread.daemon = True
+    kernel.thread.start()
+    return kernel, client
+
+
+def stop_kernel(kernel, client):
+    kernel.session.send(client, 'stop_request')
+    kernel.thread.join(5)
+    nt.assert_false(kernel.thread.isAlive())
+    client.close()
+    kernel.reply_socket.close()
+
+
+def test_idle_loop_blocks():
+    kernel, client = start_kernel()
+    try:
+        time.sleep(0.2)
+        # Nothing was sent, so the loop never woke up to look.
+        nt.assert_equal(kernel.iterations, 0)
+    finally:
+        stop_kernel(kernel, client)
+
+
+def test_queued_request():
+    kernel, client = start_kernel()
+    try:
+        for i in range(3):
+            kernel.session.send(client, 'ping_request')
+        for i in range(500):
+            if len(kernel.handled) == 3:
+                break
+            time.sleep(0.01)
+        nt.assert_equal(kernel.handled, ['ping_request'] * 3)
+        # Once the requests are handled, the loop goes back to sleep.
+        iterations = kernel.iterations
+        time.sleep(0.1)
+        nt.assert_equal(kernel.iterations, iterations)
+    finally:
+        stop_kernel(kernel, client)
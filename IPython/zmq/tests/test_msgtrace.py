@@ -0,0 +1,52 @@
+"""Tests for the kernel message tracer.
+"""
+#-----------------------------------------------------------------------------
+#  Copyright (C) 2010  The IPython Development Team
+#
+#  Distributed under the terms of the BSD License.  The full license is in
+#  the file COPYING.txt, distributed as part of this software.
+#-----------------------------------------------------------------------------
+
+from StringIO import StringIO
+
+import nose.tools as nt
+
+from ..msgtrace import MessageTracer, TRACE_OFF, TRACE_HEADERS, TRACE_FULL
+from ..session import Session
+
+#-----------------------------------------------------------------------------
+# Tests
+#-----------------------------------------------------------------------------
+
+def make_msg():
+    return Session().msg('stream', dict(name=u'stdout', data=u'x'*10000))
+
+
+def test_off():
+    out = StringIO()
+    MessageTracer(TRACE_OFF, out).trace('send', make_msg())
+    nt.assert_equal(out.getvalue(), '')
+
+
+def test_headers():
+    out = StringIO()
+    MessageTracer(TRACE_HEADERS, out).trace('send', make_msg())
+    lines = out.getvalue().splitlines()
+    nt.assert_equal(len(lines), 1)
+    nt.assert_true('send] stream msg_id=0' in lines[0])
+
+
+def test_full_size_cap():
+    out = StringIO()
+    MessageTracer(TRACE_FULL, out, max_size=100).trace('recv', make_msg())
+    text = out.getvalue()
+    nt.assert_true('[truncated]' in text)
+    nt.assert_true(len(text) < 300)
+
+
+def test_sample():
+    out = StringIO()
+    tracer = MessageTracer(TRACE_HEADERS, out, sample=3)
+    for i in range(9):
+        tracer.trace('send', make_msg())
+    nt.assert_equal(len(out.getvalue().splitlines()), 3)
@@ -0,0 +1,78 @@
+"""Tests for the message wire formats of the Session object.
+"""
+#-----------------------------------------------------------------------------
+#  Copyright (C) 2010  The IPython Development Team
+#
+#  Distributed under the terms of the BSD License.  The full license is in
+#  the file COPYING.txt, distributed as part of this software.
+#-----------------------------------------------------------------------------
+
+import nose.tools as nt
+
+import zmq
+
+from ..session import Session, DELIM
+
+#-----------------------------------------------------------------------------
+# Tests
+#-----------------------------------------------------------------------------
+
+def test_multipart_roundtrip():
+    session = Session()
+    msg = session.msg('execute_request', dict(code=u'a=1'),
+                      metadata=dict(engine=1), buffers=['\x00\x01\x02'])
+    frames = session.serialize(msg, ident='client')
+    nt.assert_equal(frames[:2], ['client', DELIM])
+    nt.assert_equal(frames[-1], '\x00\x01\x02')
+
+    idents, msg2 = session.unserialize(frames)
+    nt.assert_equal(idents, ['client'])
+    for key in ('header', 'parent_header', 'msg_type', 'content', 'metadata',
+                'buffers'):
+        nt.assert_equal(msg2[key], msg[key])
+
+
+def test_lazy_content():
+    session = Session()
+    msg = session.msg('stream', dict(name=u'stdout', data=u'x'*1000))
+    idents, msg2 = session.unserialize(session.serialize(msg), content=False)
+    nt.assert_equal(msg2['msg_type'], 'stream')
+    nt.assert_true(isinstance(msg2['content'], basestring))
+    session.unpack_content(msg2)
+    nt.assert_equal(msg2['content'], msg['content'])
+
+
+def test_json_compat():
+    old = Session(wire_format='json')
+    new = Session()
+    msg = old.msg('complete_request', dict(text=u'a'))
+    frames = old.serialize(msg, ident='client')
+    nt.assert_equal(len(frames), 2)
+    # Either kind of session reads the single-frame format.
+    idents, msg2 = new.unserialize(frames)
+    nt.assert_equal(idents, ['client'])
+    nt.assert_equal(msg2['content'], msg['content'])
+    nt.assert_equal(msg2['buffers'], [])
+    nt.assert_raises(ValueError, old.serialize,
+                     old.msg('data', buffers=['xyz']))
+
+
+def test_send_recv_buffers():
+    ctx = zmq.Context()
+    a = ctx.socket(zmq.PAIR)
+    b = ctx.socket(zmq.PAIR)
+    port = a.bind_to_random_port('tcp://127.0.0.1')
+    b.connect('tcp://127.0.0.1:%i' % port)
+    try:
+        session = Session()
+        data = 'x' * 100000
+        session.send(a, 'data', dict(shape=[100000]), buffers=[data])
+        idents, msg = session.recv(b, 0, copy=False)
+        nt.assert_equal(msg['content'], dict(shape=[100000]))
+        nt.assert_equal(len(msg['buffers']), 1)
+        nt.assert_equal(bytearray(msg['buffers'][0]), data)
+        nt.assert_equal(session.recv(b), (None, None))
+    finally:
+        a.close()
+        b.close()
+        ctx.term()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+"""Benchmark the completion of global names against the size of a namespace.
+
+Usage::
+
+    python tools/bench_completer.py [nnames ...]
+
+For user namespaces of a few sizes (1000 to 100000 names by default), made
+of names like the ones a session piles up, this prints the best time out of
+a few runs of completing a few prefixes.  'scan' checks every name, as
+global names used to be completed; 'index' looks them up in the name index
+of the Completer.  'update' is the time it takes to update the index after an
+execution that defined a few new names, which IPython does after each one.
+"""
+#-----------------------------------------------------------------------------
+#  Copyright (C) 2010  The IPython Development Team
+#
+#  Distributed under the terms of the BSD License.  The full license is in
+#  the file COPYING, distributed as part of this software.
+#-----------------------------------------------------------------------------
+
+#-----------------------------------------------------------------------------
+# Imports
+#-----------------------------------------------------------------------------
+import __builtin__
+import keyword
+import sys
+import time
+
+from IPython.core.completer import Completer
+
+#-----------------------------------------------------------------------------
+# Benchmarks
+#-----------------------------------------------------------------------------
+
+PREFIXES = ['a', 'dat', '_i1', 'zzz', 'x']
+
+
+def make_namespace(nnames):
+    """A namespace of history variables and data names, nnames in all."""
+    ns = {}
+    for i in range(nnames//4):
+        ns['_i%i' % i] = ns['_%i' % i] = ns['_ii%i' % i] = None
+        ns['data_%i' % i] = None
+    return ns
+
+
+def scan_matches(completer, text):
+    """Complete global names by scanning them all, as it used to be done."""
+    matches = []
+    n = len(text)
+    for lst in [keyword.kwlist,
+                __builtin__.__dict__.keys(),
+                completer.namespace.keys(),
+                completer.global_namespace.keys()]:
+        for word in lst:
+            if word[:n] == text and word != "__builtins__":
+                matches.append(word)
+    return sorted(set(matches))
+
+
+def index_matches(completer, text):
+    return sorted(set(completer.global_matches(text)))
+
+
+def best_time(func, repeat=5):
+    """Return the best wall clock time out of repeat calls to func."""
+    times = []
+    for i in range(repeat):
+        t0 = time.time()
+        func()
+        times.append(time.time() - t0)
+    return min(times)
+
+
+def main(sizes=(1000, 10000, 50000, 100000)):
+    print '%-8s %12s %12s %12s' % ('names', 'scan', 'index', 'update')
+    for nnames in sizes:
+        ns = make_namespace(nnames)
+        completer = Completer(ns)
+        completer.update_names = False
+        completer.update_name_index()
+        for text in PREFIXES:
+            assert scan_matches(completer, text) == \
+                   index_matches(completer, text)
+        scan = best_time(lambda: [scan_matches(completer, text)
+                                  for text in PREFIXES])
+        index = best_time(lambda: [index_matches(completer, text)
+                                   for text in PREFIXES])
+        def execute():
+            n = len(ns)
+            for i in range(n, n+5):
+                ns['new_%i' % i] = None
+            completer.update_name_index()
+        update = best_time(execute)
+        # Times are per completion.
+        print '%-8i %11.3fms %11.3fms %11.3fms' % (
+            nnames, 1000*scan/len(PREFIXES), 1000*index/len(PREFIXES),
+            1000*update)
+
+
+if __name__ == '__main__':
+    main(*[[int(arg) for arg in sys.argv[1:]]] if sys.argv[1:] else [])
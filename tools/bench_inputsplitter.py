@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+"""Benchmark the input splitters on large cells of input.
+
+Usage::
+
+    python tools/bench_inputsplitter.py [nlines]
+
+For a few kinds of generated cells of roughly nlines lines each (5000 by
+default), this prints the best time out of a few runs of splitting the whole
+cell into blocks with split_blocks(), as run_cell does, and of pushing it in
+'cell' mode and checking whether it accepts more input, as the Qt console does.
+"""
+#-----------------------------------------------------------------------------
+#  Copyright (C) 2010  The IPython Development Team
+#
+#  Distributed under the terms of the BSD License.  The full license is in
+#  the file COPYING, distributed as part of this software.
+#-----------------------------------------------------------------------------
+
+#-----------------------------------------------------------------------------
+# Imports
+#-----------------------------------------------------------------------------
+import sys
+import time
+
+from IPython.core.inputsplitter import InputSplitter, IPythonInputSplitter
+
+#-----------------------------------------------------------------------------
+# Cell generators
+#-----------------------------------------------------------------------------
+
+def script_cell(nlines):
+    """A script made of many small statements and functions."""
+    chunk = ['x = %(i)i',
+             'def f%(i)i(a, b=1):',
+             '    """Docstring',
+             '    on two lines."""',
+             '    if a > b:',
+             '        return a',
+             '    return b',
+             '',
+             'y = f%(i)i(x, b=(1,',
+             '                 2))[0]',
+             ]
+    lines = []
+    for i in range(nlines // len(chunk)):
+        lines.extend(l % dict(i=i) for l in chunk)
+    return '\n'.join(lines)
+
+
+def function_cell(nlines):
+    """A single function with a very long body."""
+    lines = ['def f(x):']
+    lines.extend('    x%i = x + %i' % (i, i) for i in range(nlines))
+    lines.append('    return x')
+    return '\n'.join(lines)
+
+
+def literal_cell(nlines):
+    """A single, very long dict literal."""
+    lines = ['d = {']
+    lines.extend("    'key%i': %i," % (i, i) for i in range(nlines))
+    lines.append('}')
+    return '\n'.join(lines)
+
+
+def ipython_cell(nlines):
+    """A script with IPython special syntax sprinkled in."""
+    chunk = ['x = %(i)i',
+             '!echo %(i)i',
+             'files = !ls',
+             'for i in range(3):',
+             '    %%time i',
+             '    y = i*x',
+             'x?',
+             ]
+    lines = []
+    for i in range(nlines // len(chunk)):
+        lines.extend(l % dict(i=i) for l in chunk)
+    return '\n'.join(lines)
+
+#-----------------------------------------------------------------------------
+# Benchmarks
+#-----------------------------------------------------------------------------
+
+def best_time(func, repeat=3):
+    """Return the best wall clock time out of repeat calls to func."""
+    times = []
+    for i in range(repeat):
+        t0 = time.time()
+        func()
+        times.append(time.time() - t0)
+    return min(times)
+
+
+def split(splitter_cls, cell):
+    splitter_cls().split_blocks(cell)
+
+
+def push_cell(splitter_cls, cell):
+    isp = splitter_cls(input_mode='cell')
+    isp.push(cell)
+    isp.push_accepts_more()
+
+
+def main(nlines=5000):
+    cells = [('script', script_cell), ('function', function_cell),
+             ('literal', literal_cell), ('ipython', ipython_cell)]
+    splitters = [('InputSplitter', InputSplitter),
+                 ('IPythonInputSplitter', IPythonInputSplitter)]
+    print '%-10s %-22s %12s %12s' % ('cell', 'splitter', 'split_blocks',
+                                     'push cell')
+    for cell_name, make_cell in cells:
+        cell = make_cell(nlines)
+        for splitter_name, cls in splitters:
+            if cell_name == 'ipython' and cls is InputSplitter:
+                continue
+            t_split = best_time(lambda: split(cls, cell))
+            t_push = best_time(lambda: push_cell(cls, cell))
+            print '%-10s %-22s %11.3fs %11.3fs' % (cell_name, splitter_name,
+                                                   t_split, t_push)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
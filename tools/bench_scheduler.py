@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+"""Benchmark the task schedulers of the TaskController on large task queues.
+
+Usage::
+
+    python tools/bench_scheduler.py [ntasks [nworkers]]
+
+For a few kinds of workloads of ntasks tasks (20000 by default) run by
+nworkers workers (32 by default), this prints the best time out of a few runs
+of handing out all the tasks the way TaskController.distributeTasks does:
+schedule() is called until it has nothing to do, then all the busy workers
+are given back, as if their tasks had completed.  No task is actually run, so
+this only measures the time spent in the scheduler.
+"""
+#-----------------------------------------------------------------------------
+#  Copyright (C) 2010  The IPython Development Team
+#
+#  Distributed under the terms of the BSD License.  The full license is in
+#  the file COPYING, distributed as part of this software.
+#-----------------------------------------------------------------------------
+
+#-----------------------------------------------------------------------------
+# Imports
+#-----------------------------------------------------------------------------
+import sys
+import time
+
+from IPython.kernel.engineservice import StrictDict
+from IPython.kernel.task import (FIFOScheduler, IndexedScheduler, MapTask)
+
+#-----------------------------------------------------------------------------
+# Workloads
+#-----------------------------------------------------------------------------
+
+class Worker(object):
+    """A stand-in for WorkerFromQueuedEngine."""
+
+    def __init__(self, workerid, properties):
+        self.workerid = workerid
+        self.properties = StrictDict(properties)
+
+
+def square(x):
+    return x*x
+
+
+def has_gpu(properties):
+    return properties.get('gpu', False)
+
+
+def big_memory(properties):
+    return properties.get('memory', 0) >= 16
+
+
+def nodepend_tasks(ntasks):
+    """Tasks that any worker can run, as in TaskMapper.map."""
+    return [MapTask(square, (i,)) for i in range(ntasks)]
+
+
+def depend_tasks(ntasks):
+    """A mix of tasks without dependencies and with two kinds of them."""
+    depends = [None, has_gpu, None, big_memory]
+    return [MapTask(square, (i,), depend=depends[i % len(depends)])
+            for i in range(ntasks)]
+
+
+def make_workers(nworkers):
+    """Workers with a GPU or with lots of memory, one in four each."""
+    return [Worker(i, dict(gpu=(i % 4 == 0), memory=8 + 8*(i % 4 == 1)))
+            for i in range(nworkers)]
+
+#-----------------------------------------------------------------------------
+# Benchmarks
+#-----------------------------------------------------------------------------
+
+def best_time(func, repeat=3):
+    """Return the best wall clock time out of repeat calls to func."""
+    times = []
+    for i in range(repeat):
+        t0 = time.time()
+        func()
+        times.append(time.time() - t0)
+    return min(times)
+
+
+def distribute(scheduler_cls, tasks, workers):
+    """Hand out all tasks, returning the number of rounds it took."""
+    scheduler = scheduler_cls()
+    for i, task in enumerate(tasks):
+        task.taskid = i
+        scheduler.add_task(task)
+    for worker in workers:
+        scheduler.add_worker(worker)
+    rounds = 0
+    while scheduler.ntasks:
+        busy = []
+        worker, task = scheduler.schedule()
+        while worker and task:
+            busy.append(worker)
+            worker, task = scheduler.schedule()
+        if not busy:
+            raise RuntimeError('tasks left that no worker can run')
+        for worker in busy:
+            scheduler.add_worker(worker)
+        rounds += 1
+    return rounds
+
+
+def main(ntasks=20000, nworkers=32):
+    workloads = [('nodepend', nodepend_tasks), ('depend', depend_tasks)]
+    schedulers = [('FIFOScheduler', FIFOScheduler),
+                  ('IndexedScheduler', IndexedScheduler)]
+    print '%-10s %-18s %12s' % ('tasks', 'scheduler', 'distribute')
+    for workload_name, make_tasks in workloads:
+        tasks = make_tasks(ntasks)
+        workers = make_workers(nworkers)
+        for scheduler_name, cls in schedulers:
+            t = best_time(lambda: distribute(cls, tasks, workers))
+            print '%-10s %-18s %11.3fs' % (workload_name, scheduler_name, t)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
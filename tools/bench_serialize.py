@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+"""Benchmark the time and peak memory of sending arrays with newserialized.
+
+Usage::
+
+    python tools/bench_serialize.py [megabytes]
+
+For an array of the given size (200MB by default), this times pickling a
+serialized array, as the engines and the controller do to send it, and
+unpickling and unserializing it on the other end.  Each end runs in a new
+process, and the peak memory it used on top of the array or of the pickled
+package is printed, in units of the size of the array.  The 'str' kind is the
+way arrays used to be sent, with the data pickled as one str and copied again
+to make a writable array; the 'chunked' kind is the current one.
+"""
+#-----------------------------------------------------------------------------
+#  Copyright (C) 2010  The IPython Development Team
+#
+#  Distributed under the terms of the BSD License.  The full license is in
+#  the file COPYING, distributed as part of this software.
+#-----------------------------------------------------------------------------
+
+#-----------------------------------------------------------------------------
+# Imports
+#-----------------------------------------------------------------------------
+import cPickle as pickle
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy
+
+from IPython.kernel.newserialized import Serialized, serialize, unserialize
+
+#-----------------------------------------------------------------------------
+# Benchmarks
+#-----------------------------------------------------------------------------
+
+def peak_rss():
+    """Return the peak resident memory of this process, in bytes."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss*1024
+
+
+def str_send(a):
+    ser = serialize(a)
+    ser = Serialized(str(ser.getData()), 'ndarray', ser.getMetadata())
+    return pickle.dumps(ser, 2)
+
+
+def str_receive(package):
+    ser = pickle.loads(package)
+    md = ser.getMetadata()
+    result = numpy.frombuffer(ser.getData(), dtype=md['dtype'])
+    result.shape = md['shape']
+    return result.copy()
+
+
+def chunked_send(a):
+    return pickle.dumps(serialize(a), 2)
+
+
+def chunked_receive(package):
+    return unserialize(pickle.loads(package))
+
+
+def child(kind, end, nbytes, filename):
+    """Run one end of sending an array, printing its time and peak memory."""
+    if end == 'send':
+        a = numpy.ones(nbytes//8)
+    else:
+        a = open(filename, 'rb').read()
+    before = peak_rss()
+    t0 = time.time()
+    result = globals()['%s_%s' % (kind, end)](a)
+    t = time.time() - t0
+    extra = float(peak_rss() - before)/nbytes
+    if end == 'send':
+        open(filename, 'wb').write(result)
+    else:
+        assert result.flags.writeable and (result == 1.0).all()
+    print t, extra
+
+
+def main(megabytes=200):
+    nbytes = int(megabytes*1024*1024)
+    fd, filename = tempfile.mkstemp()
+    os.close(fd)
+    print '%-8s %-8s %10s %14s' % ('kind', 'end', 'time', 'extra memory')
+    try:
+        for kind in ('str', 'chunked'):
+            for end in ('send', 'receive'):
+                out = subprocess.Popen([sys.executable, __file__, '--child',
+                                        kind, end, str(nbytes), filename],
+                                       stdout=subprocess.PIPE)
+                t, extra = out.communicate()[0].split()
+                print '%-8s %-8s %9.3fs %13.2fx' % (kind, end, float(t),
+                                                     float(extra))
+    finally:
+        os.remove(filename)
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--child']:
+        child(sys.argv[2], sys.argv[3], int(sys.argv[4]), sys.argv[5])
+    else:
+        main(*[float(arg) for arg in sys.argv[1:2]])